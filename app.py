@@ -1,30 +1,48 @@
 import pandas as pd
 from decimal import Decimal
+import hashlib
+import json
 import logging
-from flask import Flask, render_template, request, redirect, flash, session, url_for, jsonify
-from markupsafe import Markup
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Request, current_app, render_template, request, redirect, flash, send_file, session, url_for, jsonify
+from markupsafe import Markup, escape
 from flask_mail import Mail, Message
 from db_utils import *
+from bank_reconciliation import build_open_item_index, match_bank_statement, read_bank_statement, statement_reference, validate_bank_statement
 from encryption import encrypt_message, decrypt_message, generate_random_password
+from payment_allocation import ALLOCATION_STRATEGIES, to_money
+from purchase_import import BASE_METRICS, PURCHASE_SHEET_COLUMNS, PURCHASE_SHEET_EXTENSIONS, find_recorded_invoices, read_purchase_sheet, validate_purchase_sheet
+from sales_import import (SALES_REPORT_EXTENSIONS, SalesReportError, build_dish_match_index, build_stock_impact, dish_alias_key,
+                          expand_sales_archive, explode_sales_to_materials, match_dish, match_restaurant,
+                          parse_sales_report_file, partition_sales_by_date, read_sales_report, suggest_dishes)
+from transfer_manifests import MANIFEST_FORMATS, build_transfer_manifests, record_manifest_failure, remove_old_manifests
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import repeat
 from werkzeug.utils import secure_filename
 import os
+import tempfile
+import time
+import uuid
 import pytz
 from dotenv import load_dotenv
 load_dotenv()
-# Get the current working directory
-current_workspace = os.getcwd()
+# ALLOWED_EXTENSIONS = {'txt', 'csv', 'xlsx'}
+
 
-# Define the path for the uploads folder
-UPLOAD_FOLDER = os.path.join(current_workspace, 'uploads')
+class SpooledUploadRequest(Request):
+    """
+    Keep uploaded files in memory up to UPLOAD_SPOOL_MAX_SIZE instead of Werkzeug's 500 KB default,
+    so typical sales reports are processed without touching the disk.
+    """
 
-# Create the uploads folder if it doesn't already exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_MAX_SIZE'], mode='rb+')
 
-# ALLOWED_EXTENSIONS = {'txt', 'csv', 'xlsx'}
 
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "default_fallback_secret")
 encryption_key = os.getenv("ENCRYPTION_KEY")
 if not encryption_key:
@@ -41,11 +59,33 @@ app.config['MAIL_PASSWORD'] = os.getenv("MAIL_PASSWORD")
 app.config['MAIL_USE_TLS'] = True
 app.config['MAIL_USE_SSL'] = False
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB
+# Uploads up to this size stay in memory; larger ones spill over to a private temporary file
+app.config['UPLOAD_SPOOL_MAX_SIZE'] = int(os.getenv("UPLOAD_SPOOL_MAX_SIZE", 16 * 1024 * 1024))
+# Bulk sales import: processes used to parse reports and concurrent DB connections used to commit them
+app.config['BULK_SALES_PARSE_WORKERS'] = int(os.getenv("BULK_SALES_PARSE_WORKERS", os.cpu_count() or 2))
+app.config['BULK_SALES_DB_WORKERS'] = int(os.getenv("BULK_SALES_DB_WORKERS", 4))
+# Chunked sales report uploads: size of each chunk (well under MAX_CONTENT_LENGTH), largest report accepted,
+# hours before an unfinished upload is discarded and minutes a run's lease lasts without being renewed
+app.config['SALES_UPLOAD_CHUNK_SIZE'] = int(os.getenv("SALES_UPLOAD_CHUNK_SIZE", 4 * 1024 * 1024))
+app.config['SALES_UPLOAD_MAX_SIZE'] = int(os.getenv("SALES_UPLOAD_MAX_SIZE", 512 * 1024 * 1024))
+app.config['SALES_UPLOAD_EXPIRY_HOURS'] = int(os.getenv("SALES_UPLOAD_EXPIRY_HOURS", 24))
+app.config['SALES_UPLOAD_STALE_MINUTES'] = int(os.getenv("SALES_UPLOAD_STALE_MINUTES", 10))
+# Uploaded bank statements are kept in the database for this long between the preview and posting the matched payments
+app.config['BANK_STATEMENT_EXPIRY_HOURS'] = int(os.getenv("BANK_STATEMENT_EXPIRY_HOURS", 24))
+# Transfer manifests are rendered by this many worker processes and kept here for MANIFEST_EXPIRY_HOURS
+app.config['MANIFEST_WORKERS'] = int(os.getenv("MANIFEST_WORKERS", 2))
+app.config['MANIFEST_DIR'] = os.getenv("MANIFEST_DIR", os.path.join(tempfile.gettempdir(), "transfer_manifests"))
+app.config['MANIFEST_EXPIRY_HOURS'] = int(os.getenv("MANIFEST_EXPIRY_HOURS", 24))
 
 mail = Mail(app)
 
+# Finalized chunked uploads are committed in the background, one sales date at a time
+sales_upload_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SALES_UPLOAD_WORKERS", 1)))
+
+# Manifest spreadsheets and PDFs are built off the web workers
+manifest_executor = ProcessPoolExecutor(max_workers=app.config['MANIFEST_WORKERS'])
+
 
 @app.before_request
 def make_session_permanent():
@@ -1034,7 +1074,7 @@ def invoice_page():
 def get_invoices(vendor_id):
     conn = get_db_connection()
     with conn.cursor() as cursor:
-        cursor.execute("SELECT DISTINCT invoice_number FROM purchase_history WHERE vendor_id = %s", (vendor_id,))
+        cursor.execute("SELECT DISTINCT invoice_number FROM purchase_invoices WHERE vendor_id = %s", (vendor_id,))
         invoices = cursor.fetchall()
     conn.close()
     return jsonify(invoices)
@@ -1045,7 +1085,7 @@ def get_invoice_dates(vendor_id, invoice_number):
     conn = get_db_connection()
     with conn.cursor() as cursor:
         cursor.execute(
-            "SELECT DISTINCT DATE_FORMAT(purchase_date, '%Y-%m-%d') AS purchase_date FROM purchase_history WHERE vendor_id = %s AND invoice_number = %s", (vendor_id, invoice_number))
+            "SELECT DISTINCT DATE_FORMAT(purchase_date, '%Y-%m-%d') AS purchase_date FROM purchase_invoices WHERE vendor_id = %s AND invoice_number = %s", (vendor_id, invoice_number))
         invoice_dates = cursor.fetchall()
     conn.close()
     return jsonify(invoice_dates)
@@ -1056,35 +1096,69 @@ def get_invoice_data():
     vendor_id = request.json.get('vendor_id')
     from_date = request.json.get('from_date')
     to_date = request.json.get('to_date')
+    after = request.json.get('cursor')
+    try:
+        limit = min(int(request.json.get('limit') or VENDOR_LEDGER_PAGE_SIZE), VENDOR_LEDGER_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid page size."}), 400
 
-    conn = get_db_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("""
-            SELECT purchase_date AS date, invoice_number AS type, invoice_number AS sr_no, '-' AS payment_mode,
-                   total_cost AS credit, 0.0 AS debit, 0.0 AS balance
-            FROM purchase_history
-            WHERE vendor_id = %s AND purchase_date BETWEEN %s AND %s
-            UNION ALL
-            SELECT paid_on AS date, 'Payment Out' AS type, invoice_number AS sr_no, mode_of_payment AS payment_mode,
-                   0.0 AS credit, amount_paid AS debit, 0.0 AS balance
-            FROM payment_records
-            WHERE vendor_id = %s AND paid_on BETWEEN %s AND %s
-            ORDER BY date
-        """, (vendor_id, from_date, to_date, vendor_id, from_date, to_date))
-        transactions = cursor.fetchall()
-        cursor.execute("SELECT SUM(total_cost) AS total_credit FROM purchase_history WHERE vendor_id = %s AND purchase_date BETWEEN %s AND %s",
-                       (vendor_id, from_date, to_date))
-        total_credit = cursor.fetchone()[0]
-        cursor.execute("SELECT SUM(amount_paid) AS total_debit FROM payment_records WHERE vendor_id = %s AND paid_on BETWEEN %s AND %s",
-                       (vendor_id, from_date, to_date))
-        total_debit = cursor.fetchone()[0]
-    conn.close()
+    if not vendor_id or not from_date or not to_date:
+        return jsonify({"error": "Vendor, from date and to date are required."}), 400
+    if after and not parse_vendor_ledger_cursor(after):
+        return jsonify({"error": "Invalid page cursor. Please load the ledger again."}), 400
+
+    return jsonify(get_vendor_ledger(vendor_id, from_date, to_date, after, limit))
+
+
+@app.cli.command("roll-vendor-ageing")
+def roll_vendor_ageing_buckets():
+    """Re-bucket every vendor's open dues by age as of today. Run nightly."""
+    as_of = get_current_date()
+    rolled = roll_vendor_ageing(as_of)
+    print(f"Ageing rolled for {rolled} vendors as of {as_of}")
+
+
+@app.cli.command("recompute-stock-cost")
+def recompute_stock_cost():
+    """Rebuild the average unit cost of storage room stock from the purchase and transfer history."""
+    updated = recompute_average_unit_costs()
+    print(f"Average unit cost recomputed for {updated} storage room stock rows")
+
+
+@app.route("/vendor_ageing")
+def vendor_ageing():
+    if "user" not in session:
+        return redirect("/login")
+    ageing = get_vendor_ageing()
+    totals = {column: sum(row[column] for row in ageing)
+              for column in ("due_0_30", "due_31_60", "due_61_90", "due_over_90", "total_due")}
+    return render_template("vendor_ageing.html", user=session["user"], ageing=ageing, totals=totals)
 
-    return jsonify({
-        "transactions": transactions,
-        "total_credit": total_credit,
-        "total_debit": total_debit
-    })
+
+@app.cli.command("refresh-vendor-balances")
+def refresh_vendor_balances():
+    """Rebuild the vendor balance checkpoints up to the end of last month."""
+    through_date = datetime.strptime(get_current_date(), '%Y-%m-%d').replace(day=1) - timedelta(days=1)
+    written = refresh_vendor_balance_checkpoints(through_date.strftime('%Y-%m-%d'))
+    print(f"{written} vendor balance checkpoints written through {through_date:%Y-%m-%d}")
+
+
+@app.cli.command("refresh-inventory-snapshots")
+def refresh_inventory_snapshots_command():
+    """Rebuild the month-end inventory snapshots up to the end of last month."""
+    through_date = datetime.strptime(get_current_date(), '%Y-%m-%d').replace(day=1) - timedelta(days=1)
+    written = refresh_inventory_snapshots(through_date.strftime('%Y-%m-%d'))
+    print(f"{written} inventory snapshots written through {through_date:%Y-%m-%d}")
+
+
+@app.cli.command("check-inventory-ledger")
+def check_inventory_ledger():
+    """List stock balances that no longer match the inventory movement ledger."""
+    drift = get_inventory_ledger_drift()
+    for row in drift:
+        print(f"{row['destination_type']} {row['destination_id']} raw material {row['raw_material_id']}: "
+              f"stock {row['stock_balance']}, ledger {row['ledger_balance']}")
+    print(f"{len(drift)} balances differ from the ledger")
 
 
 @app.route('/editvendor', methods=['POST'])
@@ -1604,116 +1678,47 @@ def add_purchase():
             cursor = connection.cursor()
 
             # Check if the invoice number already exists for the same vendor and date
-            cursor.execute(
-                """
-                SELECT COUNT(*)
-                FROM purchase_history
-                WHERE vendor_id = %s AND invoice_number = %s AND purchase_date = %s
-                """,
-                (vendor["id"], invoice_number, purchase_date)
-            )
-            existing_invoice_count = cursor.fetchone()[0]
-
-            if existing_invoice_count > 0:
+            if invoice_exists(vendor["id"], invoice_number, purchase_date):
                 flash('This invoice number already exists for the same vendor on the same day.', 'danger')
                 return redirect('/add_purchase')
 
+            # Resolve every line through a name -> raw material map instead of scanning the list per line
+            raw_material_ids = {rm['name']: rm['id'] for rm in raw_materials}
+            lines = []
             for raw_material_name, quantity, metric, cost in zip(raw_material_names, quantities, metrics, total_costs):
                 raw_material_name = raw_material_name.strip()
-                raw_material = next((rm for rm in raw_materials if rm['name'] == raw_material_name), None)
 
-                if not raw_material:
+                if raw_material_name not in raw_material_ids:
                     cursor.execute(
                         "INSERT INTO raw_materials (name, metric) VALUES (%s, %s)",
                         (raw_material_name, metric)
                     )
                     connection.commit()
-                    raw_material_id = cursor.lastrowid
-                else:
-                    raw_material_id = raw_material['id']
+                    raw_material_ids[raw_material_name] = cursor.lastrowid
 
                 quantity, metric = convert_metric(quantity, metric)
-                quantity = Decimal(quantity)
-
-                #  Insert or Update Purchase History
-                cursor.execute(
-                    """
-                    INSERT INTO purchase_history
-                    (vendor_id, invoice_number, raw_material_id, raw_material_name,
-                     quantity, metric, total_cost, purchase_date, storageroom_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        quantity = quantity + VALUES(quantity),
-                        total_cost = total_cost + VALUES(total_cost);
-                    """,
-                    (vendor["id"], invoice_number, raw_material_id, raw_material_name,
-                     quantity, metric, cost, purchase_date, storageroom['id'])
-                )
-                #  Update Vendor Payment Tracker
-                cursor.execute(
-                    """
-                    INSERT INTO vendor_payment_tracker (vendor_id, invoice_number, purchase_date, outstanding_cost)
-                    VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE outstanding_cost = outstanding_cost + VALUES(outstanding_cost);
-                    """,
-                    (vendor['id'], invoice_number, purchase_date, cost)
-                )
-
-                # Fetch minimum_quantity first, ensuring it exists
-                cursor.execute(
-                    """
-                    SELECT COALESCE(min_quantity, 0)
-                    FROM minimum_stock
-                    WHERE type='storageroom' AND destination_id=%s AND raw_material_id=%s
-                    """,
-                    (storageroom['id'], raw_material_id),
-                )
-                min_quantity_row = cursor.fetchone()
-                min_quantity = min_quantity_row[0] if min_quantity_row else 0  # Ensure default 0 if no entry exists
-
-                # Fetch current stock (if exists)
-                cursor.execute(
-                    """
-                    SELECT currently_available
-                    FROM inventory_stock
-                    WHERE destination_type='storageroom' AND destination_id=%s AND raw_material_id=%s
-                    """,
-                    (storageroom['id'], raw_material_id),
-                )
-                stock_row = cursor.fetchone()
-                opening_stock = stock_row[0] if stock_row and stock_row[0] is not None else 0
-
-                # Compute quantity_needed (only if minimum_quantity > available stock)
-                new_currently_available = opening_stock + quantity
-                new_quantity_needed = max(0, min_quantity - new_currently_available)
-
-                # Insert or Update Stock (Avoiding Subqueries)
-                cursor.execute(
-                    """
-                    INSERT INTO inventory_stock
-                    (destination_type, destination_id, raw_material_id, metric,
-                    opening_stock, incoming_stock, currently_available, minimum_quantity, quantity_needed)
-                    VALUES ('storageroom', %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        incoming_stock = incoming_stock + VALUES(incoming_stock),
-                        currently_available = currently_available + VALUES(incoming_stock),
-                        minimum_quantity = VALUES(minimum_quantity),
-                        quantity_needed = GREATEST(0, minimum_quantity - currently_available),
-                        updated_at = CURRENT_TIMESTAMP;
-                    """,
-                    (storageroom['id'], raw_material_id, metric, opening_stock, quantity,
-                     new_currently_available, min_quantity, new_quantity_needed)
-                )
-
-            #  Commit all changes after successful operations
-            connection.commit()
+                lines.append({
+                    "vendor_id": vendor["id"],
+                    "invoice_number": invoice_number,
+                    "purchase_date": purchase_date,
+                    "storageroom_id": storageroom["id"],
+                    "raw_material_id": raw_material_ids[raw_material_name],
+                    "raw_material_name": raw_material_name,
+                    "quantity": quantity,
+                    "metric": metric,
+                    "total_cost": float(cost)
+                })
             cursor.close()
-            connection.close()
+
+            # purchase_history, vendor_payment_tracker and inventory_stock for the whole invoice in one transaction
+            save_purchase_lines(lines)
             flash('Purchases added successfully!', 'success')
         except Exception as e:
             connection.rollback()  # Rollback if any issue occurs
             app.logger.error(f"Error in add_purchase: {e}")
             flash(f"An error occurred: {e}", 'danger')
+        finally:
+            connection.close()
 
         return redirect('/add_purchase')
 
@@ -1741,6 +1746,55 @@ def convert_metric(quantity, metric):
     return quantity, metric
 
 
+@app.route('/bulk_add_purchases', methods=['GET', 'POST'])
+def bulk_add_purchases():
+    if "user" not in session:
+        return redirect("/login")
+
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename.lower().endswith(PURCHASE_SHEET_EXTENSIONS):
+            flash(f"Please upload a purchase sheet ({', '.join(PURCHASE_SHEET_EXTENSIONS)}).", "danger")
+            return redirect(url_for('bulk_add_purchases'))
+
+        started = time.perf_counter()
+        try:
+            df = read_purchase_sheet(file.read())
+        except Exception as e:
+            flash(f"Unable to read the purchase sheet: {e}", "danger")
+            return redirect(url_for('bulk_add_purchases'))
+
+        # Validate every line and resolve names to ids before touching the database
+        errors, lines = validate_purchase_sheet(
+            df, get_all_vendors(only_active=True), get_all_storagerooms(only_active=True), get_all_rawmaterials())
+        if not errors and not lines:
+            flash("The purchase sheet has no lines.", "danger")
+            return redirect(url_for('bulk_add_purchases'))
+        if not errors:
+            purchase_dates = [line["purchase_date"] for line in lines]
+            recorded_invoices = get_recorded_invoices(
+                sorted({line["vendor_id"] for line in lines}), min(purchase_dates), max(purchase_dates))
+            errors = find_recorded_invoices(lines, recorded_invoices)
+        if errors:
+            flash(Markup(
+                f"The purchase sheet has errors and nothing was saved. Kindly correct them and upload again:<br>{build_report_errors_table(errors)}"), "danger")
+            return redirect(url_for('bulk_add_purchases'))
+
+        try:
+            saved = save_purchase_lines(lines)
+        except Exception as e:
+            app.logger.error(f"Error in bulk_add_purchases: {e}")
+            flash(f"An error occurred and nothing was saved: {e}", "danger")
+            return redirect(url_for('bulk_add_purchases'))
+
+        elapsed = time.perf_counter() - started
+        flash(f"{saved['lines']} lines across {saved['invoices']} invoices added in {elapsed:.2f}s "
+              f"({saved['lines'] / elapsed:.0f} lines/sec).", "success")
+        return redirect(url_for('bulk_add_purchases'))
+
+    return render_template('bulk_add_purchases.html', user=session["user"], columns=PURCHASE_SHEET_COLUMNS)
+
+
 @app.route('/get_purchases/<vendor_id>/<invoice_number>/<purchase_date>', methods=['GET'])
 def get_purchases(vendor_id, invoice_number, purchase_date):
     connection = get_db_connection()
@@ -1915,42 +1969,182 @@ def pending_payments():
 
 @app.route("/process_payments", methods=["POST"])
 def process_payments():
-    # try:
-    if request.method == "POST":
-        vendor_id = request.json.get("vendor_id")
-        paid_values = []
-        for payment in request.json.get("payments", []):
-            if payment["pay_amount"] > 0:
-                paid_values.append(payment)
-
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        for payment_detail in paid_values:
-            cursor.execute(
-                """
-                    INSERT INTO vendor_payment_tracker (vendor_id, invoice_number, purchase_date, total_paid)
-                    VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE total_paid = total_paid + %s
-                    """,
-                (vendor_id, payment_detail["invoice_number"], payment_detail["purchase_date"],
-                 payment_detail["pay_amount"], payment_detail["pay_amount"])
-            )
-            cursor.execute(
-                """
-                    INSERT INTO payment_records (vendor_id, invoice_number, purchase_date, amount_paid, mode_of_payment, paid_on)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """,
-                (vendor_id, payment_detail["invoice_number"], payment_detail["purchase_date"],
-                    payment_detail["pay_amount"], payment_detail["mode_of_payment"], payment_detail["date_of_payment"])
+    vendor_id = request.json.get("vendor_id")
+    paid_values = []
+    for payment in request.json.get("payments", []):
+        if payment["pay_amount"] > 0:
+            paid_values.append({
+                "invoice_number": payment["invoice_number"],
+                "purchase_date": payment["purchase_date"],
+                "amount": payment["pay_amount"],
+                "mode_of_payment": payment["mode_of_payment"],
+                "paid_on": payment["date_of_payment"]
+            })
+
+    try:
+        record_vendor_payments(vendor_id, paid_values)
+    except Exception as e:
+        app.logger.error(f"Error processing payments for vendor {vendor_id}: {e}")
+        flash(f'An error occurred while processing the payment. Please try again. {str(e)}', 'error')
+        return jsonify({'error': str(e)}), 400
+    flash('Payment processed successfully!', 'success')
+    return jsonify({'message': 'Payment processed successfully'}), 200
+
+
+@app.route("/allocate_vendor_payment", methods=["POST"])
+def process_lump_sum_payment():
+    if "user" not in session:
+        return jsonify({"error": "Your session has expired. Please log in again."}), 401
+
+    data = request.get_json(silent=True) or {}
+    vendor_id = data.get("vendor_id")
+    mode_of_payment = data.get("mode_of_payment")
+    paid_on = data.get("paid_on") or get_current_date()
+    strategy = data.get("strategy", "fifo")
+    try:
+        amount = to_money(data.get("amount"))
+    except (TypeError, ValueError, ArithmeticError):
+        return jsonify({"error": "Invalid amount."}), 400
+    if not vendor_id or not mode_of_payment or amount <= 0:
+        return jsonify({"error": "Vendor, a positive amount and mode of payment are required."}), 400
+    if strategy not in ALLOCATION_STRATEGIES:
+        return jsonify({"error": f"Strategy must be one of {', '.join(ALLOCATION_STRATEGIES)}."}), 400
+
+    try:
+        allocations = allocate_vendor_payment(vendor_id, amount, mode_of_payment, paid_on, strategy,
+                                              dry_run=bool(data.get("dry_run")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error allocating payment for vendor {vendor_id}: {e}")
+        return jsonify({"error": "Unable to process the payment. Please try again."}), 500
+
+    return jsonify({
+        "vendor_id": vendor_id,
+        "amount": str(amount),
+        "strategy": strategy,
+        "dry_run": bool(data.get("dry_run")),
+        "allocations": [
+            {
+                "invoice_number": allocation["invoice_number"],
+                "purchase_date": allocation["purchase_date"].strftime('%Y-%m-%d'),
+                "total_due": str(allocation["total_due"]),
+                "amount": str(allocation["amount"]),
+                "remaining_due": str(allocation["remaining_due"])
+            }
+            for allocation in allocations
+        ]
+    })
+
+
+def match_bank_statement_content(content):
+    """Validate a bank statement and match its debits against the open vendor dues. Returns (errors, results)."""
+    errors, debits = validate_bank_statement(read_bank_statement(content))
+    if errors or not debits:
+        return errors, []
+    index = build_open_item_index(get_open_vendor_payments(), get_all_vendors())
+    posted_references = get_posted_payment_references(sorted({statement_reference(debit) for debit in debits}))
+    return [], match_bank_statement(debits, index, posted_references)
+
+
+@app.route("/import_bank_statement", methods=["GET", "POST"])
+def import_bank_statement():
+    if "user" not in session:
+        return redirect("/login")
+
+    expiry_hours = app.config['BANK_STATEMENT_EXPIRY_HOURS']
+    if request.method == "POST" and request.form.get("action") == "post":
+        token = session.get("bank_statement")
+        content = get_pending_bank_statement(token, expiry_hours) if token else None
+        if content is None:
+            flash("The bank statement preview has expired. Please upload the statement again.", "danger")
+            return redirect(url_for("import_bank_statement"))
+
+        # Match again against the current dues so payments recorded since the preview are respected
+        errors, results = match_bank_statement_content(content)
+        payments_by_vendor = {}
+        for result in results:
+            if result["status"] != "matched":
+                continue
+            payments_by_vendor.setdefault(result["vendor_id"], []).extend(
+                {
+                    "invoice_number": allocation["invoice_number"],
+                    "purchase_date": allocation["purchase_date"],
+                    "amount": allocation["amount"],
+                    "mode_of_payment": "bank_transfer",
+                    "paid_on": result["date"],
+                    "reference": result["statement_reference"]
+                }
+                for allocation in result["allocations"]
             )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        flash('Payment processed successfully!', 'success')
-        return jsonify({'message': 'Payment processed successfully'}), 200
-    # except Exception as e:
-    #     flash(f'An error occurred while processing the payment. Please try again. {str(e)}', 'error')
-    #     return jsonify({'error': str(e)}), 400
+        if errors or not payments_by_vendor:
+            flash("No matched payments to post.", "danger")
+            return redirect(url_for("import_bank_statement"))
+        try:
+            post_vendor_payment_batch(payments_by_vendor)
+        except Exception as e:
+            app.logger.error(f"Error posting bank statement payments: {e}")
+            flash(f"An error occurred and no payments were posted: {e}", "danger")
+            return redirect(url_for("import_bank_statement"))
+
+        delete_pending_bank_statement(token)
+        session.pop("bank_statement", None)
+        matched = sum(1 for result in results if result["status"] == "matched")
+        flash(f"{matched} statement lines posted as payments to {len(payments_by_vendor)} vendors.", "success")
+        return redirect(url_for("import_bank_statement"))
+
+    if request.method == "POST":
+        file = request.files.get("file")
+        if not file or not file.filename.lower().endswith(".csv"):
+            flash("Please upload the bank statement as a .csv file.", "danger")
+            return redirect(url_for("import_bank_statement"))
+        content = file.read()
+        try:
+            errors, results = match_bank_statement_content(content)
+        except Exception as e:
+            flash(f"Unable to read the bank statement: {e}", "danger")
+            return redirect(url_for("import_bank_statement"))
+        if errors:
+            flash(Markup(
+                f"The bank statement has errors. Kindly correct them and upload again:<br>{build_report_errors_table(errors)}"), "danger")
+            return redirect(url_for("import_bank_statement"))
+        if not results:
+            flash("The bank statement has no debits.", "danger")
+            return redirect(url_for("import_bank_statement"))
+
+        # Any web worker can pick the statement up again when the matched payments are posted
+        delete_expired_pending_bank_statements(expiry_hours)
+        if session.get("bank_statement"):
+            delete_pending_bank_statement(session["bank_statement"])
+        token = uuid.uuid4().hex
+        if not save_pending_bank_statement(token, secure_filename(file.filename)[:255], content):
+            flash("Unable to keep the bank statement for posting. Please try again.", "danger")
+            return redirect(url_for("import_bank_statement"))
+        session["bank_statement"] = token
+        return render_template("import_bank_statement.html", user=session["user"], results=results,
+                               filename=file.filename)
+
+    return render_template("import_bank_statement.html", user=session["user"], results=None)
+
+
+@app.route('/stock_as_of')
+def stock_as_of():
+    """Stock of a storage room, kitchen or restaurant at the end of a past day, from the movement ledger."""
+    if "user" not in session:
+        return redirect("/login")
+    location = request.args.get("location", "")
+    as_of = request.args.get("as_of") or get_current_date()
+    destination_type, _, destination_id = location.partition(":")
+    # The ledger opens with the balances on the day it was introduced; earlier stock is not known
+    ledger_start = get_inventory_ledger_start()
+    before_ledger = ledger_start is not None and as_of < str(ledger_start)
+    stock = None
+    if destination_type in ("storageroom", "kitchen", "restaurant") and destination_id and not before_ledger:
+        stock = get_stock_as_of(destination_type, destination_id, as_of)
+    return render_template('stock_as_of.html', stock=stock, location=location, as_of=as_of,
+                           ledger_start=ledger_start, before_ledger=before_ledger,
+                           storage_rooms=get_all_storagerooms(), kitchens=get_all_kitchens(),
+                           restaurants=get_all_restaurants(), user=session["user"])
 
 
 @app.route('/storageroom_stock')
@@ -2144,110 +2338,41 @@ def transfer_raw_material():
         raw_materials = request.form.getlist("raw_material_id[]")
         quantities = request.form.getlist("quantity[]")
         metrics = request.form.getlist("metric[]")
-        transfer_datetime = get_current_datetime()
-        connection = get_db_connection()
 
+        # Quantities are entered in the chosen metric and stored in kg / liter / unit like the rest of
+        # inventory_stock. The transfer then goes through the same checked path as a bulk transfer.
+        lines = []
         try:
-            with connection.cursor() as cursor:
-                # Step 1: Get the latest transfer_id for today
-                cursor.execute("""
-                    SELECT IFNULL(MAX(transfer_id), 0) + 1
-                    FROM raw_material_transfer_details
-                    WHERE transferred_date = %s
-                    AND source_storage_room_id = %s
-                """, (transfer_date, source_storeroom_id))
-                next_transfer_id = cursor.fetchone()[0]  # Get next transfer ID
-
-                # Step 2: Prepare Transfer Details
-                transfer_details = [
-                    (source_storeroom_id, destination_type, destination_id,
-                     raw_material, Decimal(convert_to_base_units(quantity, metric)),
-                     metric, transfer_date, transfer_datetime, next_transfer_id)
-                    for raw_material, quantity, metric in zip(raw_materials, quantities, metrics)
-                ]
-
-                # Step 3: Bulk INSERT into `raw_material_transfer_details`
-                insert_transfer_sql = """
-                    INSERT INTO raw_material_transfer_details
-                        (source_storage_room_id, destination_type, destination_id,
-                        raw_material_id, quantity, metric, transferred_date, transfer_time, transfer_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                cursor.executemany(insert_transfer_sql, transfer_details)
-
-                # Step 4: Update inventory_stock
-                raw_material_ids = [item[3] for item in transfer_details]
-                raw_material_ids_str = ",".join(map(str, raw_material_ids))  # Convert to comma-separated string
-
-                case_statements_outgoing = " ".join([f"WHEN {item[3]} THEN {item[4]}" for item in transfer_details])
-                case_statements_available = case_statements_outgoing  # Same logic for both columns
-
-                update_inventory_sql = f"""
-                    UPDATE inventory_stock
-                    SET 
-                        outgoing_stock = outgoing_stock + CASE raw_material_id 
-                            {case_statements_outgoing} ELSE outgoing_stock END,
-                        currently_available = currently_available - CASE raw_material_id 
-                            {case_statements_available} ELSE 0 END,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE destination_type = 'storageroom' 
-                    AND destination_id = %s
-                    AND raw_material_id IN ({raw_material_ids_str})
-                """
-
-                cursor.execute(update_inventory_sql, (source_storeroom_id,))
-
-                # Step 5: Fetch current inventory details
-                fetch_inventory_sql = f"""
-                    SELECT raw_material_id, 
-                        IFNULL(currently_available, 0),
-                        IFNULL(minimum_quantity, 0), 
-                        IFNULL(quantity_needed, 0) 
-                    FROM inventory_stock 
-                    WHERE destination_type = %s 
-                    AND destination_id = %s 
-                    AND raw_material_id IN ({raw_material_ids_str})
-                """
-
-                cursor.execute(fetch_inventory_sql, (destination_type, destination_id))
-                existing_inventory = {row[0]: (Decimal(row[1]), Decimal(row[2]), Decimal(row[3]))
-                                      for row in cursor.fetchall()}  # Convert to Decimal
-
-                # Step 6: Bulk INSERT or UPDATE inventory_stock
-                insert_inventory_sql = """
-                    INSERT INTO inventory_stock
-                        (destination_type, destination_id, raw_material_id, metric,
-                        incoming_stock, currently_available, minimum_quantity, quantity_needed, updated_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    ON DUPLICATE KEY UPDATE
-                        incoming_stock = incoming_stock + VALUES(incoming_stock),
-                        currently_available = COALESCE(currently_available, 0) + VALUES(incoming_stock),
-                        updated_at = CURRENT_TIMESTAMP
-                """
-
-                inventory_values = [
-                    (item[1], item[2], item[3], item[5], Decimal(item[4]),  # Ensure quantity is Decimal
-                     existing_inventory.get(item[3], (Decimal(0), Decimal(0), Decimal(0)))[
-                        0] + Decimal(item[4]),  # Compute currently_available
-                     existing_inventory.get(item[3], (Decimal(0), Decimal(0), Decimal(0)))[
-                        1],  # Fetch minimum_quantity if exists, else 0
-                     existing_inventory.get(item[3], (Decimal(0), Decimal(0), Decimal(0)))[2])  # Fetch quantity_needed if exists, else 0
-                    for item in transfer_details
-                ]
-
-                cursor.executemany(insert_inventory_sql, inventory_values)
-
-                connection.commit()
-                flash(f"Transfer successful (Transfer ID: {next_transfer_id})", "success")
+            for raw_material, entered_quantity, metric in zip(raw_materials, quantities, metrics):
+                try:
+                    quantity = Decimal(entered_quantity)
+                except ArithmeticError:
+                    quantity = None
+                if quantity is None or not quantity.is_finite() or quantity <= 0:
+                    raise ValueError(f"Invalid quantity '{entered_quantity}'")
+                lines.append({
+                    "destination_type": destination_type,
+                    "destination_id": destination_id,
+                    "raw_material_id": int(raw_material),
+                    "quantity": convert_to_base_units(quantity, metric),
+                    "metric": BASE_METRICS.get(metric, (metric, 1))[0]
+                })
+        except ValueError as e:
+            flash(f"Please check the quantities: {e}", "danger")
+            return redirect('/transfer_raw_material')
+        if not lines:
+            flash("Enter at least one raw material to transfer.", "danger")
+            return redirect('/transfer_raw_material')
 
+        try:
+            transfer_ids = save_bulk_raw_material_transfer(source_storeroom_id, transfer_date, get_current_datetime(), lines)
+            flash(f"Transfer successful (Transfer ID: {transfer_ids[(destination_type, destination_id)]})", "success")
+        except ValueError as e:
+            flash(str(e), "danger")
         except Exception as e:
-            connection.rollback()
             app.logger.error(f"Database Error: {e}")
             flash(f"An error occurred: {e}", "danger")
 
-        finally:
-            connection.close()
-
         return redirect('/transfer_raw_material')
 
     # GET request - Load necessary data
@@ -2262,26 +2387,180 @@ def transfer_raw_material():
     )
 
 
+@app.route('/bulk_raw_material_transfer', methods=['GET', 'POST'])
+def bulk_raw_material_transfer():
+    if "user" not in session:
+        return redirect("/login")
+
+    kitchens = get_all_kitchens(only_active=True)
+    restaurants = get_all_restaurants(only_active=True)
+    destinations = [("kitchen", kitchen["id"]) for kitchen in kitchens] + \
+        [("restaurant", restaurant["id"]) for restaurant in restaurants]
+
+    if request.method == 'POST':
+        source_storeroom_id = request.form.get("storageroom")
+        transfer_date = request.form.get("transfer_date")
+        raw_material_ids = request.form.getlist("raw_material_id[]")
+        if not source_storeroom_id or not transfer_date:
+            flash("Please select the storage room and transfer date.", "danger")
+            return redirect(url_for('bulk_raw_material_transfer'))
+
+        # One row per raw material, one quantity column per destination. Quantities are entered in
+        # the material's metric and stored in kg / liter / unit like the rest of inventory_stock.
+        metrics = {str(material["id"]): BASE_METRICS.get(material["metric"], (material["metric"], 1))
+                   for material in get_all_rawmaterials()}
+        lines = []
+        try:
+            for destination_type, destination_id in destinations:
+                quantities = request.form.getlist(f"quantity_{destination_type}_{destination_id}[]")
+                for raw_material_id, quantity in zip(raw_material_ids, quantities):
+                    if not quantity or float(quantity) == 0:
+                        continue
+                    if raw_material_id not in metrics or float(quantity) < 0:
+                        raise ValueError(f"Invalid raw material or quantity '{quantity}'")
+                    lines.append({
+                        "destination_type": destination_type,
+                        "destination_id": destination_id,
+                        "raw_material_id": int(raw_material_id),
+                        "quantity": float(quantity) / metrics[raw_material_id][1],
+                        "metric": metrics[raw_material_id][0]
+                    })
+        except ValueError as e:
+            flash(f"Please check the quantities: {e}", "danger")
+            return redirect(url_for('bulk_raw_material_transfer'))
+        if not lines:
+            flash("Enter at least one quantity to transfer.", "danger")
+            return redirect(url_for('bulk_raw_material_transfer'))
+
+        try:
+            transfer_ids = save_bulk_raw_material_transfer(source_storeroom_id, transfer_date, get_current_datetime(), lines)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for('bulk_raw_material_transfer'))
+        except Exception as e:
+            app.logger.error(f"Database Error: {e}")
+            flash(f"An error occurred: {e}", "danger")
+            return redirect(url_for('bulk_raw_material_transfer'))
+
+        flash(f"{len(lines)} lines transferred to {len(transfer_ids)} destinations "
+              f"(Transfer IDs: {', '.join(str(transfer_id) for transfer_id in sorted(transfer_ids.values()))})", "success")
+        return redirect(url_for('bulk_raw_material_transfer'))
+
+    return render_template(
+        'bulk_raw_material_transfer.html',
+        raw_materials=get_all_rawmaterials(),
+        storage_rooms=get_all_storagerooms(only_active=True),
+        kitchens=kitchens,
+        restaurants=restaurants,
+        user=session["user"],
+        today_date=get_current_date()
+    )
+
+
+def submit_transfer_manifests(lines, manifest_format, path):
+    """Queue a manifest build. A pool broken by a dead worker is replaced once rather than failing every later build."""
+    global manifest_executor
+    try:
+        future = manifest_executor.submit(build_transfer_manifests, lines, manifest_format, path)
+    except BrokenProcessPool:
+        manifest_executor = ProcessPoolExecutor(max_workers=app.config['MANIFEST_WORKERS'])
+        future = manifest_executor.submit(build_transfer_manifests, lines, manifest_format, path)
+    future.add_done_callback(partial(record_manifest_failure, path))
+
+
+@app.route('/transfer_manifests', methods=['GET', 'POST'])
+def transfer_manifests():
+    if "user" not in session:
+        return redirect("/login")
+
+    if request.method == 'POST':
+        source_storeroom_id = request.form.get("storageroom")
+        transfer_date = request.form.get("transfer_date")
+        transfer_id = request.form.get("transfer_id") or None
+        manifest_format = request.form.get("format")
+        if not source_storeroom_id or not transfer_date or manifest_format not in MANIFEST_FORMATS:
+            flash("Please select the storage room, transfer date and format.", "danger")
+            return redirect(url_for('transfer_manifests'))
+
+        lines = get_transfer_manifest_lines(source_storeroom_id, transfer_date, transfer_id)
+        if not lines:
+            flash("No transfers found for the selected storage room and date.", "danger")
+            return redirect(url_for('transfer_manifests'))
+
+        remove_old_manifests(app.config['MANIFEST_DIR'], app.config['MANIFEST_EXPIRY_HOURS'])
+        token = uuid.uuid4().hex
+        os.makedirs(app.config['MANIFEST_DIR'], exist_ok=True)
+        path = os.path.join(app.config['MANIFEST_DIR'], f"{token}.{manifest_format}")
+        submit_transfer_manifests(lines, manifest_format, path)
+        return redirect(url_for('transfer_manifest', token=token, format=manifest_format,
+                                name=f"manifest_{transfer_date}" + (f"_{transfer_id}" if transfer_id else "")))
+
+    return render_template('transfer_manifests.html', storage_rooms=get_all_storagerooms(),
+                           today_date=get_current_date(), user=session["user"])
+
+
+@app.route('/transfer_manifests/<token>')
+def transfer_manifest(token):
+    """Download a manifest once its worker has finished; until then show a page that checks back."""
+    if "user" not in session:
+        return redirect("/login")
+    manifest_format = request.args.get("format")
+    try:
+        token = uuid.UUID(token).hex
+    except ValueError:
+        token = None
+    if not token or manifest_format not in MANIFEST_FORMATS:
+        flash("This manifest does not exist.", "danger")
+        return redirect(url_for('transfer_manifests'))
+
+    path = os.path.join(app.config['MANIFEST_DIR'], f"{token}.{manifest_format}")
+    if os.path.exists(path):
+        name = secure_filename(request.args.get("name", "")) or "manifest"
+        return send_file(path, as_attachment=True, download_name=f"{name}.{manifest_format}")
+    if os.path.exists(f"{path}.error"):
+        with open(f"{path}.error") as error_file:
+            flash(f"The manifest could not be generated: {error_file.read()}", "danger")
+        return redirect(url_for('transfer_manifests'))
+    return render_template('transfer_manifests.html', pending=True, user=session["user"])
+
+
 @app.route('/list_rawmaterial_transfers', methods=["GET", "POST"])
 def list_rawmaterial_transfers():
     if "user" not in session:
         return redirect("/login")
-    if request.method == "POST":
-        selected_date = request.form['transfer_date']
-        transfers = get_rawmaterial_transfer_history(selected_date)
-        return render_template('list_rawmaterial_transfers.html', transfers=transfers, current_date=selected_date, user=session["user"])
-    return render_template('list_rawmaterial_transfers.html', user=session["user"])
+    # Filters travel in the query string so the next page link can carry them with the cursor
+    filters = {key: request.values.get(key, "") for key in
+               ("from_date", "to_date", "storageroom_id", "destination", "raw_material_id")}
+    filters["from_date"] = filters["from_date"] or request.values.get("transfer_date", "")
+    filters["to_date"] = filters["to_date"] or filters["from_date"]
+    history = None
+    if filters["from_date"]:
+        destination_type, _, destination_id = filters["destination"].partition(":")
+        history = get_rawmaterial_transfer_history(
+            filters["from_date"], filters["to_date"], filters["storageroom_id"], destination_type, destination_id,
+            filters["raw_material_id"], after=request.args.get("after"))
+    return render_template('list_rawmaterial_transfers.html', history=history, filters=filters,
+                           storage_rooms=get_all_storagerooms(), kitchens=get_all_kitchens(),
+                           restaurants=get_all_restaurants(), raw_materials=get_all_rawmaterials(),
+                           user=session["user"])
 
 
 @app.route('/list_prepared_dishes_transfers', methods=["GET", "POST"])
 def list_prepared_dishes_transfers():
     if "user" not in session:
         return redirect("/login")
-    if request.method == "POST":
-        selected_date = request.form['transfer_date']
-        transfers = get_prepared_dishes_transfer_history(selected_date)
-        return render_template('list_prepared_dishes_transfers.html', transfers=transfers, current_date=selected_date, user=session["user"])
-    return render_template('list_prepared_dishes_transfers.html', user=session["user"])
+    filters = {key: request.values.get(key, "") for key in
+               ("from_date", "to_date", "kitchen_id", "restaurant_id", "dish_id")}
+    filters["from_date"] = filters["from_date"] or request.values.get("transfer_date", "")
+    filters["to_date"] = filters["to_date"] or filters["from_date"]
+    history = None
+    if filters["from_date"]:
+        history = get_prepared_dishes_transfer_history(
+            filters["from_date"], filters["to_date"], filters["kitchen_id"], filters["restaurant_id"],
+            filters["dish_id"], after=request.args.get("after"))
+    return render_template('list_prepared_dishes_transfers.html', history=history, filters=filters,
+                           kitchens=get_all_kitchens(), restaurants=get_all_restaurants(), dishes=get_all_dishes(),
+                           user=session["user"])
 
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -2439,68 +2718,38 @@ def upload_sales_report():
             flash('No selected file. Please upload a file', "danger")
             return redirect(url_for('upload_sales_report'))
 
-        if file and file.filename.endswith('.xlsx'):
-            # Save the file
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
+        if file and file.filename.lower().endswith(SALES_REPORT_EXTENSIONS):
+            # Parse and validate the report straight from the spooled upload, whatever its format,
+            # then resolve every line to a dish
+            dish_index = get_dish_match_index()
+            try:
+                sales_rows = read_sales_report(file.read(), dish_index["categories"])
+            except SalesReportError as e:
+                flash(Markup(
+                    f"The sales report has errors and nothing was processed. Kindly correct them and upload again:<br>{build_report_errors_table(e.errors)}"), "danger")
+                return redirect(url_for('upload_sales_report'))
+            except Exception as e:
+                flash(f"Unable to read the sales report: {e}", "danger")
+                return redirect(url_for('upload_sales_report'))
+            missing_recipes = process_data(sales_rows, dish_index)
 
-            # Process the file
-            missing_recipes = process_data(file_path)
+            if request.form.get("mode") == "preview":
+                # Dry run: nothing is written and no rows are locked
+                preview = preview_sales_report(restaurant_id, sales_date, sales_rows, missing_recipes)
+                restaurants = get_all_restaurants(only_active=True)
+                return render_template('upload_sales_report.html', user=session["user"], restaurants=restaurants,
+                                       current_date=sales_date, selected_restaurant_id=int(restaurant_id), preview=preview)
 
             if missing_recipes:
-                missing_recipes_table = """
-                    <table class="table table-bordered">
-                        <thead>
-                            <tr>
-                                <th>Missing Recipe</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                """
-                for recipe in missing_recipes:
-                    missing_recipes_table += f"<tr><td>{recipe}</td></tr>"
-                missing_recipes_table += "</tbody></table>"
-
                 flash(Markup(
-                    f"Recipe not found for the following dishes. Kindly update recipe for all the dishes and continue:<br>{missing_recipes_table}"), "danger")
+                    f"Recipe not found for the following dishes. Kindly update recipe for all the dishes and continue:<br>{build_missing_recipes_table(missing_recipes)}"), "danger")
             else:
                 # Process the data and update the daily_sales table
-                df = pd.read_excel(file_path)
                 # Extract sales date from filename format: Restaurant_item_tax_report_YYYY_MM_DD_HH_MM_SS.xlsx
                 # filename_parts = file.filename.split('_')
                 # sales_date_str = f"{filename_parts[4]}-{filename_parts[5]}-{filename_parts[6]}"
                 # sales_date = datetime.strptime(sales_date_str, '%Y-%m-%d').date()
-
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                sales_report_data = []
-                for index, row in df.iterrows():
-                    temp = {}
-                    temp["category"] = row['Category']
-                    temp["item_name"] = row['Item Name']
-                    temp["quantity"] = row['Qty']
-                    cursor.execute(
-                        "SELECT id FROM dishes WHERE category = %s AND name = %s", (temp["category"], temp["item_name"]))
-                    dish = cursor.fetchone()
-                    if dish:
-                        dish_id = dish[0]
-                        temp["dish_id"] = dish_id
-                        cursor.execute("""
-                            INSERT INTO daily_sales (sales_date, dish_id, restaurant_id, quantity)
-                            VALUES (%s, %s, %s, %s)
-                            ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
-                        """, (sales_date, dish_id, restaurant_id, temp["quantity"]))
-                    else:
-                        missing_recipes.append(temp["item_name"])
-                    sales_report_data.append(temp)
-
-                conn.commit()
-                cursor.close()
-                conn.close()
-
-                # Delete the uploaded Excel file
-                os.remove(file_path)
-                adjust_stocks(sales_report_data, sales_date, restaurant_id)
+                commit_sales_report_by_date(restaurant_id, sales_date, sales_rows)
                 flash("Sales report data has been processed succesfully and the inventory stocks have been adjusted accordingly. Please do not reupload the sales report as it will modify the inventory.", "success")
             return redirect(url_for('upload_sales_report'))
 
@@ -2508,6 +2757,220 @@ def upload_sales_report():
     return render_template('upload_sales_report.html', user=session["user"], restaurants=restaurants, current_date=get_current_date())
 
 
+@app.route('/upload_sales_report_bulk', methods=['GET', 'POST'])
+def upload_sales_report_bulk():
+    if "user" not in session:
+        return redirect("/login")
+
+    restaurants = get_all_restaurants(only_active=True)
+
+    if request.method == 'POST':
+        sales_date = request.form.get("sales_report_date")
+        reports = expand_sales_archive(request.files.getlist('files'))
+
+        if not reports:
+            flash('No sales reports found. Please upload a zip file or a folder of .xlsx reports.', "danger")
+            return redirect(url_for('upload_sales_report_bulk'))
+
+        # Step 1: Match every report to a restaurant by its file or folder name
+        report_restaurants = {}
+        unmatched_files = []
+        for filename, _ in reports:
+            restaurant = match_restaurant(filename, restaurants)
+            if restaurant:
+                report_restaurants[filename] = restaurant
+            else:
+                unmatched_files.append(filename)
+
+        if unmatched_files:
+            flash(f"Could not find the restaurant for: {', '.join(unmatched_files)}. Kindly name each report (or its folder) after the restaurant and upload again.", "danger")
+            return redirect(url_for('upload_sales_report_bulk'))
+
+        # Step 2: Parse and validate all reports in a process pool
+        dish_index = get_dish_match_index()
+        filenames, contents = zip(*reports)
+        parse_workers = max(1, min(app.config['BULK_SALES_PARSE_WORKERS'], len(reports)))
+        with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+            parsed_reports = list(pool.map(parse_sales_report_file, filenames, contents, repeat(dish_index["categories"])))
+
+        report_errors = [dict(error, filename=filename) for filename, _, errors in parsed_reports for error in errors]
+        if report_errors:
+            flash(Markup(
+                f"Some sales reports have errors. No reports were processed. Kindly correct them and upload again:<br>{build_report_errors_table(report_errors, show_report=True)}"), "danger")
+            return redirect(url_for('upload_sales_report_bulk'))
+
+        # Step 3: Resolve every line across all reports with a single in-memory dish index
+        sales_by_restaurant = {}
+        missing_recipes = []
+        for filename, rows, _ in parsed_reports:
+            restaurant = report_restaurants[filename]
+            for missing in process_data(rows, dish_index):
+                missing_recipes.append(dict(missing, restaurant_name=restaurant["restaurantname"], filename=filename))
+            sales_by_restaurant.setdefault(restaurant["id"], []).extend(rows)
+
+        if missing_recipes:
+            # Nothing is committed until every report is clean, so the whole archive can simply be re-uploaded
+            flash(Markup(
+                f"Recipe not found for the following dishes. No reports were processed. Kindly update recipe for all the dishes and continue:<br>{build_missing_recipes_table(missing_recipes, show_report=True)}"), "danger")
+            return redirect(url_for('upload_sales_report_bulk'))
+
+        # Step 4: Commit each restaurant's sales concurrently, bounded by the number of DB workers.
+        # Each restaurant is one transaction, so a failed one has nothing recorded and can be uploaded again.
+        restaurant_names = {restaurant["id"]: restaurant["restaurantname"] for restaurant in restaurants}
+        processed_restaurants = []
+        failed_restaurants = []
+        with ThreadPoolExecutor(max_workers=app.config['BULK_SALES_DB_WORKERS']) as pool:
+            futures = {
+                pool.submit(commit_sales_report_by_date, restaurant_id, sales_date, sales_report_data): restaurant_id
+                for restaurant_id, sales_report_data in sales_by_restaurant.items()
+            }
+            for future, restaurant_id in futures.items():
+                try:
+                    future.result()
+                    processed_restaurants.append(restaurant_names[restaurant_id])
+                except Exception as e:
+                    app.logger.error(f"Error committing sales report for restaurant {restaurant_id}: {e}")
+                    failed_restaurants.append(restaurant_names[restaurant_id])
+
+        if processed_restaurants:
+            flash(f"Sales reports processed for: {', '.join(processed_restaurants)}. Please do not reupload these reports as it will modify the inventory.", "success")
+        if failed_restaurants:
+            flash(f"Failed to process the sales reports for: {', '.join(failed_restaurants)}. Nothing was recorded for these restaurants, kindly upload their reports again.", "danger")
+        return redirect(url_for('upload_sales_report_bulk'))
+
+    return render_template('upload_sales_report_bulk.html', user=session["user"], restaurants=restaurants, current_date=get_current_date())
+
+
+@app.route('/sales_report_uploads', methods=['POST'])
+def init_sales_report_upload():
+    if "user" not in session:
+        return jsonify({"error": "Your session has expired. Please log in again."}), 401
+
+    data = request.get_json(silent=True) or {}
+    restaurant_id = data.get("restaurant_id")
+    sales_date = data.get("sales_date")
+    filename = secure_filename(data.get("filename") or "")[:255]
+
+    if not restaurant_id or not sales_date or not filename:
+        return jsonify({"error": "Restaurant, sales date and file are required."}), 400
+    if not filename.lower().endswith(SALES_REPORT_EXTENSIONS):
+        return jsonify({"error": f"Unsupported file type. Allowed: {', '.join(SALES_REPORT_EXTENSIONS)}"}), 400
+    try:
+        total_size = int(data.get("total_size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid file size."}), 400
+    if total_size <= 0 or total_size > app.config['SALES_UPLOAD_MAX_SIZE']:
+        return jsonify({"error": f"File size must be between 1 byte and {app.config['SALES_UPLOAD_MAX_SIZE'] // (1024 * 1024)} MB."}), 400
+
+    delete_expired_sales_report_uploads(app.config['SALES_UPLOAD_EXPIRY_HOURS'])
+
+    chunk_size = app.config['SALES_UPLOAD_CHUNK_SIZE']
+    total_chunks = -(-total_size // chunk_size)
+    upload_key = uuid.uuid4().hex
+    if not create_sales_report_upload(upload_key, restaurant_id, filename, sales_date, total_size, chunk_size, total_chunks):
+        return jsonify({"error": "Unable to start the upload. Please try again."}), 500
+
+    return jsonify(sales_report_upload_state(get_sales_report_upload(upload_key))), 201
+
+
+@app.route('/sales_report_uploads/<upload_key>', methods=['GET'])
+def get_sales_report_upload_status(upload_key):
+    if "user" not in session:
+        return jsonify({"error": "Your session has expired. Please log in again."}), 401
+
+    upload = get_sales_report_upload(upload_key)
+    if not upload:
+        return jsonify({"error": "Upload not found. It may have expired, please start again."}), 404
+    return jsonify(sales_report_upload_state(upload))
+
+
+@app.route('/sales_report_uploads/<upload_key>/chunks/<int:chunk_index>', methods=['PUT'])
+def upload_sales_report_chunk(upload_key, chunk_index):
+    if "user" not in session:
+        return jsonify({"error": "Your session has expired. Please log in again."}), 401
+
+    upload = get_sales_report_upload(upload_key)
+    if not upload:
+        return jsonify({"error": "Upload not found. It may have expired, please start again."}), 404
+    if upload["status"] != 'uploading':
+        return jsonify({"error": "This upload has already been finalized."}), 409
+    if chunk_index >= upload["total_chunks"]:
+        return jsonify({"error": f"Chunk {chunk_index} is out of range."}), 400
+
+    # Every chunk but the last is exactly chunk_size bytes
+    data = request.get_data(cache=False)
+    expected_size = upload["chunk_size"]
+    if chunk_index == upload["total_chunks"] - 1:
+        expected_size = upload["total_size"] - upload["chunk_size"] * (upload["total_chunks"] - 1)
+    if len(data) != expected_size:
+        return jsonify({"error": f"Chunk {chunk_index} should be {expected_size} bytes, received {len(data)}."}), 400
+
+    if not save_sales_report_upload_chunk(upload["id"], chunk_index, data):
+        return jsonify({"error": f"Unable to save chunk {chunk_index}. Please retry."}), 500
+    return jsonify({"chunk_index": chunk_index})
+
+
+@app.route('/sales_report_uploads/<upload_key>/finalize', methods=['POST'])
+def finalize_sales_report_upload(upload_key):
+    if "user" not in session:
+        return jsonify({"error": "Your session has expired. Please log in again."}), 401
+
+    upload = get_sales_report_upload(upload_key)
+    if not upload:
+        return jsonify({"error": "Upload not found. It may have expired, please start again."}), 404
+    if upload["status"] == 'completed':
+        return jsonify(sales_report_upload_state(upload))
+    if upload["received_chunks"] != upload["total_chunks"] or upload["received_size"] != upload["total_size"]:
+        return jsonify(dict(sales_report_upload_state(upload), error="Some chunks are still missing.")), 409
+    lease_token = claim_sales_report_upload(upload["id"], app.config['SALES_UPLOAD_STALE_MINUTES'])
+    if not lease_token:
+        return jsonify({"error": "This upload is already being processed."}), 409
+
+    # Reading, checking and committing the report all happen in the background; the client polls the status
+    sales_upload_executor.submit(process_sales_report_upload, upload["id"], lease_token, upload["restaurant_id"],
+                                 str(upload["default_sales_date"]))
+    return jsonify({"upload_key": upload_key, "status": "processing"}), 202
+
+
+@app.route('/dish_aliases', methods=['GET', 'POST'])
+def dish_aliases():
+    if "user" not in session:
+        return redirect("/login")
+
+    if request.method == 'POST':
+        action = request.form.get("action", "add")
+
+        if action == "add":
+            pos_category = request.form.get("pos_category", "").strip()
+            pos_item_name = request.form.get("pos_item_name", "").strip()
+            dish_id = request.form.get("dish_id")
+
+            if not pos_item_name or not dish_id:
+                flash("POS item name and dish are required!", "danger")
+            elif save_dish_alias(pos_category, pos_item_name, dish_alias_key(pos_category, pos_item_name), dish_id):
+                flash(f"'{pos_category} - {pos_item_name}' will now be matched to the selected dish.", "success")
+            else:
+                flash("Error saving the alias. Please try again.", "danger")
+
+        elif action == "delete":
+            if delete_dish_alias(request.form.get("alias_id")):
+                flash("Alias deleted successfully!", "success")
+            else:
+                flash("Error deleting the alias. Please try again.", "danger")
+
+        return redirect(url_for('dish_aliases'))
+
+    return render_template(
+        'dish_aliases.html',
+        user=session["user"],
+        aliases=get_all_dish_aliases(),
+        dishes=get_all_dishes(),
+        selected_category=request.args.get("category", ""),
+        selected_item_name=request.args.get("item_name", ""),
+        selected_dish_id=request.args.get("dish_id", type=int)
+    )
+
+
 @app.route('/get_available_quantity', methods=['GET'])
 def get_available_quantity():
     storageroom_id = int(request.args.get('storageroom_id'))
@@ -2522,6 +2985,40 @@ def get_available_quantity():
     return jsonify(data)
 
 
+@app.route('/get_available_quantities', methods=['GET'])
+def get_available_quantities():
+    """
+    Stock of every raw material in one or more storage rooms (storageroom_id may repeat), or only
+    of the raw_material_id values asked for, keyed by storage room and raw material id. The ETag
+    lets the transfer forms revalidate with If-None-Match and get a 304 while nothing has moved.
+    """
+    if "user" not in session:
+        return jsonify({"error": "Your session has expired. Please log in again."}), 401
+
+    try:
+        storageroom_ids = [int(value) for value in request.args.getlist('storageroom_id')]
+        raw_material_ids = [int(value) for value in request.args.getlist('raw_material_id')]
+    except ValueError:
+        return jsonify({"error": "Storage room and raw material ids must be numbers."}), 400
+    if not storageroom_ids:
+        return jsonify({"error": "At least one storage room is required."}), 400
+
+    stock = {str(storageroom_id): {} for storageroom_id in storageroom_ids}
+    for row in get_storageroom_availability(storageroom_ids, raw_material_ids):
+        stock[str(row["storageroom_id"])][str(row["raw_material_id"])] = {
+            "metric": row["metric"],
+            "available_quantity": float(row["available_quantity"]),
+            "minimum_quantity": float(row["minimum_quantity"]),
+            "quantity_needed": float(row["quantity_needed"]),
+        }
+
+    body = json.dumps({"stock": stock}, sort_keys=True)
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(hashlib.sha1(body.encode()).hexdigest())
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @app.route('/add_prepared_dishes', methods=['GET', 'POST'])
 def add_prepared_dishes():
     if "user" not in session:
@@ -2581,7 +3078,17 @@ def add_prepared_dishes():
                 )
 
             # Update kitchen stock
-            update_kitchen_stock(prepared_in_kitchen, dish_id, quantity, prepared_on)
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                update_kitchen_stock(cursor, prepared_in_kitchen, dish_id, quantity, prepared_on)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
 
         flash("Prepared dishes added successfully!", "success")
         return redirect('/add_prepared_dishes')
@@ -2767,48 +3274,256 @@ def get_restaurants():
     return restaurants
 
 
-# Read the Excel file
-def read_excel(file_path):
-    return pd.read_excel(file_path)
+def get_dish_match_index():
+    return build_dish_match_index(get_dishes_with_recipe_count(), get_all_dish_aliases())
 
 
-def process_data(file_path):
-
-    data = read_excel(file_path)
+def process_data(sales_rows, dish_index):
+    """
+    Resolve each report line to a dish through the in-memory index, setting its dish_id.
+    Returns the lines that have no dish or no recipe, with the closest dish names as suggestions.
+    """
     missing_recipes = []
-
-    for index, row in data.iterrows():
-        category = row['Category']
-        item_name = row['Item Name']
-        # Find dish_id
-        dish = get_dish_details_from_category(category, item_name)
-
-        if dish:
-            dish_id = dish[0]["id"]
-            dish_recipe = get_dish_recipe(dish_id)
-            if not dish_recipe:
-                missing_recipes.append(f"{category} - {item_name}")
-        else:
-            missing_recipes.append(f"{category} - {item_name}")
+    suggestions_cache = {}
+
+    for row in sales_rows:
+        category = row['category']
+        item_name = row['item_name']
+        dish = match_dish(dish_index, category, item_name)
+
+        if dish and dish["has_recipe"]:
+            row["dish_id"] = dish["dish_id"]
+            continue
+
+        suggestions = []
+        if not dish:
+            key = dish_alias_key(category, item_name)
+            if key not in suggestions_cache:
+                suggestions_cache[key] = suggest_dishes(dish_index, category, item_name)
+            suggestions = suggestions_cache[key]
+        missing_recipes.append({
+            "recipe": f"{category} - {item_name}",
+            "category": category,
+            "item_name": item_name,
+            "suggestions": suggestions
+        })
     return missing_recipes
 
 
-def adjust_stocks(sales_report_data, report_date, restaurant_id):
+def preview_sales_report(restaurant_id, sales_date, sales_rows, missing_recipes):
+    """
+    Work out what committing a sales report would do to the restaurant's stock, entirely in memory
+    against a snapshot of inventory_stock. Uses plain (non-locking) reads and writes nothing.
+    """
+    matched_rows = [row for row in sales_rows if "dish_id" in row]
+    recipes = get_dish_recipes({row["dish_id"] for row in matched_rows})
+    # Dishes transferred in prepared from a kitchen are not deducted again, same as adjust_stocks
+    transferred_dish_ids = get_transferred_dish_ids(restaurant_id, sales_date)
+    required = explode_sales_to_materials(matched_rows, recipes, skip_dish_ids=transferred_dish_ids)
+    stock_impact = build_stock_impact(required, get_inventory_snapshot('restaurant', restaurant_id))
+    return {
+        "stock_impact": stock_impact,
+        "negative_count": sum(1 for material in stock_impact if material["projected"] < 0),
+        "unmatched_items": missing_recipes,
+        "line_count": len(sales_rows),
+        "skipped_transferred": sum(1 for row in matched_rows if row["dish_id"] in transferred_dish_ids)
+    }
+
+
+def build_missing_recipes_table(missing_recipes, show_report=False):
+    # Each suggestion links to the alias page pre-filled, so the POS name can be mapped in one click
+    missing_recipes_table = """
+        <table class="table table-bordered">
+            <thead>
+                <tr>
+    """
+    if show_report:
+        missing_recipes_table += "<th>Restaurant</th><th>Report</th>"
+    missing_recipes_table += """
+                    <th>Missing Recipe</th>
+                    <th>Did you mean</th>
+                </tr>
+            </thead>
+            <tbody>
+    """
+    for missing in missing_recipes:
+        suggestion_links = ", ".join(
+            f'<a href="{escape(url_for("dish_aliases", category=missing["category"], item_name=missing["item_name"], dish_id=dish["dish_id"]))}">'
+            f'{escape(dish["category"])} - {escape(dish["name"])}</a>'
+            for dish in missing["suggestions"]
+        )
+        missing_recipes_table += "<tr>"
+        if show_report:
+            missing_recipes_table += f"<td>{escape(missing['restaurant_name'])}</td><td>{escape(missing['filename'])}</td>"
+        missing_recipes_table += f"<td>{escape(missing['recipe'])}</td><td>{suggestion_links or '-'}</td></tr>"
+    missing_recipes_table += "</tbody></table>"
+    return missing_recipes_table
+
+
+# Validation errors listed back to the user; the rest are only counted
+REPORT_ERRORS_SHOWN = 100
+
+
+def build_report_errors_table(errors, show_report=False):
+    errors_table = """
+        <table class="table table-bordered">
+            <thead>
+                <tr>
+    """
+    if show_report:
+        errors_table += "<th>Report</th>"
+    errors_table += """
+                    <th>Row</th>
+                    <th>Column</th>
+                    <th>Value</th>
+                    <th>Problem</th>
+                </tr>
+            </thead>
+            <tbody>
+    """
+    for error in errors[:REPORT_ERRORS_SHOWN]:
+        errors_table += "<tr>"
+        if show_report:
+            errors_table += f"<td>{escape(error['filename'])}</td>"
+        errors_table += (f"<td>{error['row'] or '-'}</td><td>{escape(error['column'] or '-')}</td>"
+                         f"<td>{escape(error['value'] if error['value'] is not None else '-')}</td><td>{escape(error['message'])}</td></tr>")
+    errors_table += "</tbody></table>"
+    if len(errors) > REPORT_ERRORS_SHOWN:
+        errors_table += f"and {len(errors) - REPORT_ERRORS_SHOWN} more."
+    return errors_table
+
+
+def record_sales_report(cursor, restaurant_id, sales_date, sales_report_data):
+    """Record one day's sold dishes in daily_sales and deduct their raw materials inside the caller's transaction."""
+    cursor.executemany("""
+        INSERT INTO daily_sales (sales_date, dish_id, restaurant_id, quantity)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+    """, [(sales_date, row["dish_id"], restaurant_id, row["quantity"]) for row in sales_report_data])
+    adjust_stocks(cursor, sales_report_data, sales_date, restaurant_id)
+
+
+def commit_sales_report(restaurant_id, sales_date, sales_report_data, upload_id=None, lease_token=None):
+    """
+    Record the sold dishes in daily_sales and deduct their raw materials from the restaurant stock
+    in one transaction. For a chunked upload the day's checkpoint is written in the same transaction,
+    under a lock on the upload row that also checks and renews the run's lease, and a day already
+    checkpointed is skipped. Returns False if skipped.
+    """
     conn = get_db_connection()
-    if not conn:
-        print("Failed to connect to the database.")
-        return []
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        if upload_id is not None:
+            last_committed_date = lock_sales_report_upload(cursor, upload_id, lease_token,
+                                                           app.config['SALES_UPLOAD_STALE_MINUTES'])
+            if last_committed_date is not None and str(last_committed_date) >= sales_date:
+                conn.rollback()
+                return False
+        record_sales_report(cursor, restaurant_id, sales_date, sales_report_data)
+        if upload_id is not None:
+            checkpoint_sales_report_upload(cursor, upload_id, sales_date)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
 
-    # data = get_sales_report_data(report_date)
-    for dish_data in sales_report_data:
 
-        dish_recipe = get_dish_recipe(dish_data["dish_id"])
+def commit_sales_report_by_date(restaurant_id, default_sales_date, sales_rows):
+    """
+    Commit a report one sales date at a time, oldest first, all in one transaction, so a failure
+    leaves nothing of the report behind. Rows without their own date use `default_sales_date`.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        for sales_date, rows in partition_sales_by_date(sales_rows, default_sales_date):
+            record_sales_report(cursor, restaurant_id, sales_date, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
 
-        transferred_dish = check_dish_transferred(dish_data["dish_id"], report_date, restaurant_id)
-        if transferred_dish:
-            pass
-        else:
-            update_restaurant_stock(restaurant_id, dish_data["dish_id"], dish_data["quantity"], report_date)
+def process_sales_report_upload(upload_id, lease_token, restaurant_id, default_sales_date):
+    """
+    Background job for a finalized chunked upload, run under the lease from claim_sales_report_upload.
+    The report is read from its chunks and every line across all days is resolved before anything is
+    committed; problems are left on the upload for the status endpoint, and the chunks are kept so the
+    same upload can simply be finalized again once they are fixed. Each day is then committed together
+    with its last_committed_date checkpoint, so a failed or interrupted run resumes from the next day
+    without applying any day twice. A run whose lease was taken over stops at its next day.
+    """
+    try:
+        dish_index = get_dish_match_index()
+        with spool_sales_report_upload(upload_id, app.config['UPLOAD_SPOOL_MAX_SIZE']) as content:
+            sales_rows = read_sales_report(content, dish_index["categories"])
+    except SalesReportError as e:
+        update_sales_report_upload(upload_id, 'failed', "The sales report has errors. Kindly correct them and upload the file again.",
+                                   lease_token, {"errors": e.errors[:REPORT_ERRORS_SHOWN], "error_count": len(e.errors)})
+        return
+    except Exception as e:
+        update_sales_report_upload(upload_id, 'failed', f"Unable to read the sales report: {e}", lease_token)
+        return
+
+    missing_recipes = process_data(sales_rows, dish_index)
+    if missing_recipes:
+        update_sales_report_upload(upload_id, 'failed', "Recipe not found for some dishes. Kindly update recipe for all the dishes and finalize again.",
+                                   lease_token, {"missing_recipes": [
+                                       {
+                                           "recipe": missing["recipe"],
+                                           "suggestions": [f"{dish['category']} - {dish['name']}" for dish in missing["suggestions"]]
+                                       }
+                                       for missing in missing_recipes
+                                   ]})
+        return
+
+    try:
+        for sales_date, rows in partition_sales_by_date(sales_rows, default_sales_date):
+            commit_sales_report(restaurant_id, sales_date, rows, upload_id=upload_id, lease_token=lease_token)
+        update_sales_report_upload(upload_id, 'completed', lease_token=lease_token)
+        delete_sales_report_upload_chunks(upload_id)
+    except Exception as e:
+        app.logger.error(f"Error committing sales report upload {upload_id}: {e}")
+        update_sales_report_upload(upload_id, 'failed', str(e), lease_token)
+
+
+def sales_report_upload_state(upload):
+    """What a client needs to resume an upload: which chunks the server already has and how far processing got."""
+    missing_chunks = []
+    if upload["status"] == 'uploading':
+        received = set(get_sales_report_upload_chunk_indexes(upload["id"]))
+        missing_chunks = [index for index in range(upload["total_chunks"]) if index not in received]
+    return {
+        "upload_key": upload["upload_key"],
+        "filename": upload["filename"],
+        "status": upload["status"],
+        "chunk_size": upload["chunk_size"],
+        "total_chunks": upload["total_chunks"],
+        "missing_chunks": missing_chunks,
+        "last_committed_date": str(upload["last_committed_date"]) if upload["last_committed_date"] else None,
+        "error": upload["error"],
+        # Report errors ({errors, error_count}) or missing recipes ({missing_recipes}) of a failed run
+        **(json.loads(upload["error_details"]) if upload["error_details"] else {})
+    }
+
+
+def adjust_stocks(cursor, sales_report_data, report_date, restaurant_id):
+    """Deduct the raw materials of the sold dishes inside the caller's transaction; dishes a kitchen transferred in are skipped."""
+    transferred_dish_ids = get_transferred_dish_ids(restaurant_id, report_date)
+
+    # data = get_sales_report_data(report_date)
+    for dish_data in sales_report_data:
+        if dish_data["dish_id"] not in transferred_dish_ids:
+            update_restaurant_stock(cursor, restaurant_id, dish_data["dish_id"], dish_data["quantity"], report_date)
         #     materials = get_raw_materials(dish_data["dish_id"])
         #     raw_materials = []
         #     for material in materials:
@@ -2996,26 +3711,12 @@ def get_transfer_ids():
         return jsonify([])  # Return an empty list if any field is missing
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        query = """
-        SELECT DISTINCT transfer_id FROM raw_material_transfer_details
-        WHERE source_storage_room_id = %s 
-        AND destination_type = %s 
-        AND destination_id = %s
-        AND DATE(transferred_date) = %s
-        ORDER BY transfer_id ASC
-        """
-        cursor.execute(query, (storageroom_id, destination_type, destination_name, transfer_date))
-        transfer_ids = cursor.fetchall()
-
-        conn.close()
+        transfer_ids = get_transfer_ids(storageroom_id, destination_type, destination_name, transfer_date)
 
         # Add "All" and "Total" options
         if transfer_ids:
             transfer_ids_list = [{"transfer_id": "all"}, {"transfer_id": "total"}]
-            transfer_ids_list += [{"transfer_id": row[0]} for row in transfer_ids]
+            transfer_ids_list += [{"transfer_id": transfer_id} for transfer_id in transfer_ids]
 
         return jsonify(transfer_ids_list)
 
@@ -3029,9 +3730,11 @@ def delete_purchase_record():
     if "user" not in session:
         return redirect("/login")
     today_date = get_current_date()
-    # today_date = '2025-03-25'
-    todays_purchase = get_cumulative_purchase_record_invoice_wise(today_date)
-    return render_template("delete_purchase_record.html", user=session["user"], today_date=today_date, todays_purchase=todays_purchase)
+    # Admins can pick an earlier day; everyone else only sees today's purchases
+    purchase_date = request.args.get("date", today_date) if session["user"]["role"] == "admin" else today_date
+    todays_purchase = get_cumulative_purchase_record_invoice_wise(purchase_date)
+    return render_template("delete_purchase_record.html", user=session["user"], today_date=today_date,
+                           purchase_date=purchase_date, todays_purchase=todays_purchase)
 
 
 @app.route("/delete_purchase_and_adjust_stock", methods=["DELETE"])
@@ -3046,62 +3749,46 @@ def delete_purchase_and_adjust_stock():
         flash("Missing required parameters", "danger")
         return jsonify({"success": False, "message": "Missing required parameters"}), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        # Fetch all raw materials associated with the purchase
-        cursor.execute("""
-            SELECT raw_material_id, quantity 
-            FROM purchase_history 
-            WHERE vendor_id = %s AND invoice_number = %s AND purchase_date = %s
-        """, (vendor_id, invoice_number, purchase_date))
+        reversed_purchases = reverse_purchase_invoices([(vendor_id, invoice_number, purchase_date)])
+    except Exception as e:
+        app.logger.error(f"Failed to delete purchase record {str(e)}")
+        flash("Failed to delete purchase record", "danger")
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
-        purchase_records = cursor.fetchall()
+    if not reversed_purchases["lines"]:
+        return jsonify({"success": False, "message": "No matching purchase records found"}), 404
+    flash("Purchase deleted and stock adjusted successfully!", "success")
+    return jsonify({"success": True, "message": "Purchase deleted and stock adjusted."})
 
-        if not purchase_records:
-            return jsonify({"success": False, "message": "No matching purchase records found"}), 404
 
-        # Adjust inventory_stock for each raw material
-        for record in purchase_records:
-            raw_material_id = record[0]
-            quantity = record[1]
+@app.route("/void_purchases", methods=["POST"])
+def void_purchases():
+    if "user" not in session:
+        return jsonify({"success": False, "message": "Your session has expired. Please log in again."}), 401
+    if session["user"]["role"] != "admin":
+        return jsonify({"success": False, "message": "Only admins can void purchases."}), 403
 
-            cursor.execute("""
-                UPDATE inventory_stock 
-                SET incoming_stock = incoming_stock - %s, 
-                    currently_available = currently_available - %s 
-                WHERE raw_material_id = %s AND destination_type = 'storageroom' AND destination_id = %s
-            """, (quantity, quantity, raw_material_id, storageroom_id))
-        # Delete purchase records after stock adjustment
-        cursor.execute("""
-            DELETE FROM purchase_history 
-            WHERE vendor_id = %s AND invoice_number = %s AND purchase_date = %s
-        """, (vendor_id, invoice_number, purchase_date))
-
-        # Delete associated payment records
-        cursor.execute("""
-            DELETE FROM vendor_payment_tracker
-            WHERE vendor_id = %s AND invoice_number = %s AND purchase_date = %s
-        """, (vendor_id, invoice_number, purchase_date))
-
-        cursor.execute("""
-            DELETE FROM payment_records
-            WHERE vendor_id = %s AND invoice_number = %s AND purchase_date = %s
-        """, (vendor_id, invoice_number, purchase_date))
-        conn.commit()  # Commit the transaction only if everything is successful
-        flash("Purchase deleted and stock adjusted successfully!", "success")
-        return jsonify({"success": True, "message": "Purchase deleted and stock adjusted."})
+    data = request.get_json(silent=True) or {}
+    invoice_ids = data.get("invoice_ids") or []
+    from_date = data.get("from_date")
+    to_date = data.get("to_date")
+    if not invoice_ids and not (from_date and to_date):
+        return jsonify({"success": False, "message": "Select invoices or a date range to void."}), 400
 
+    try:
+        invoice_keys = find_purchase_invoice_keys([int(invoice_id) for invoice_id in invoice_ids], from_date, to_date)
+        if not invoice_keys:
+            return jsonify({"success": False, "message": "No matching purchase records found"}), 404
+        reversed_purchases = reverse_purchase_invoices(invoice_keys)
     except Exception as e:
-        conn.rollback()  # Rollback in case of an error
-        app.logger.error(f"Failed to delete purchase record {str(e)}")
-        flash("Failed to delete purchase record", "danger")
+        app.logger.error(f"Failed to void purchases {str(e)}")
+        flash("Failed to void the purchases", "danger")
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
-    finally:
-        cursor.close()
-        conn.close()
+    message = f"{reversed_purchases['invoices']} invoices ({reversed_purchases['lines']} lines) deleted and stock adjusted."
+    flash(message, "success")
+    return jsonify({"success": True, "message": message, **reversed_purchases})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import io
+import pandas as pd
+from payment_allocation import to_money
+from sales_import import normalize_name
+
+# Columns of the bank statement CSV. Credits and rows without a debit are ignored.
+BANK_STATEMENT_COLUMNS = ['Date', 'Description', 'Reference', 'Debit']
+
+# An invoice dated further than this from the debit is not matched on amount alone
+MATCH_WINDOW_DAYS = 90
+
+# Subset-sum matching only looks at this many of a vendor's oldest open invoices
+SUBSET_SUM_MAX_ITEMS = 20
+SUBSET_SUM_MAX_STATES = 50000
+
+
+def read_bank_statement(content):
+    return pd.read_csv(io.BytesIO(content), engine="c", encoding="utf-8-sig", dtype={'Reference': str}).reset_index(drop=True)
+
+
+def validate_bank_statement(df):
+    """
+    Check the statement and return (errors, debits). Errors are {row, column, value, message}
+    dicts like the sales and purchase importers; debits are {row, date, description, reference,
+    amount} for every row with a positive debit, built only when there are no errors.
+    """
+    missing_columns = [column for column in BANK_STATEMENT_COLUMNS if column not in df.columns]
+    if missing_columns:
+        return [{"row": None, "column": column, "value": None, "message": "Required column is missing"}
+                for column in missing_columns], []
+
+    errors = []
+
+    def report(mask, column, message):
+        for index in df.index[mask]:
+            value = df.at[index, column]
+            errors.append({"row": int(index) + 2, "column": column,
+                           "value": None if pd.isna(value) else str(value), "message": message})
+
+    debits = pd.to_numeric(df['Debit'].astype(str).str.replace(",", "", regex=False).where(df['Debit'].notna()),
+                           errors="coerce")
+    has_debit = df['Debit'].notna() & (df['Debit'].astype(str).str.strip() != "")
+    report(has_debit & debits.isna(), 'Debit', "Debit is not a number")
+    report(debits < 0, 'Debit', "Debit is negative")
+
+    dates = pd.to_datetime(df['Date'], dayfirst=True, errors="coerce")
+    report(has_debit & dates.isna(), 'Date', "Date is not readable")
+
+    if errors:
+        errors.sort(key=lambda error: (error["row"] or 0, error["column"]))
+        return errors, []
+
+    debit_rows = has_debit & (debits > 0)
+    descriptions = df['Description'].fillna("").astype(str)
+    references = df['Reference'].fillna("").astype(str).str.strip()
+    return [], [
+        {"row": index + 2, "date": txn_date.date(), "description": description, "reference": reference,
+         "amount": to_money(amount)}
+        for index, txn_date, description, reference, amount in zip(
+            df.index[debit_rows].tolist(), dates[debit_rows].tolist(), descriptions[debit_rows].tolist(),
+            references[debit_rows].tolist(), debits[debit_rows].tolist())
+    ]
+
+
+def statement_reference(debit):
+    """Key stored on payment_records so the same statement line is never posted twice."""
+    if debit["reference"]:
+        return debit["reference"][:100]
+    return f"{debit['date']}|{debit['amount']}|{normalize_name(debit['description'])}"[:100]
+
+
+def build_open_item_index(open_items, vendors):
+    """
+    In-memory lookups over the open vendor_payment_tracker rows: vendor names for finding the
+    payee in the narration, each vendor's items oldest first, and items by invoice number.
+    Items get a `remaining` due that matching draws down, so two debits never settle the same amount.
+    """
+    index = {
+        "vendors": sorted(((normalize_name(v["vendor_name"]), v) for v in vendors if normalize_name(v["vendor_name"])),
+                          key=lambda item: len(item[0]), reverse=True),
+        "vendor_names": {v["id"]: v["vendor_name"] for v in vendors},
+        "by_vendor": {},
+        "by_invoice": {},
+    }
+    for item in sorted(open_items, key=lambda item: (item["purchase_date"], item["id"])):
+        item = dict(item, remaining=to_money(item["total_due"]))
+        index["by_vendor"].setdefault(item["vendor_id"], []).append(item)
+        invoice_key = normalize_name(item["invoice_number"]).replace(" ", "")
+        if invoice_key:
+            index["by_invoice"].setdefault(invoice_key, []).append(item)
+    return index
+
+
+def find_vendor(index, text):
+    padded = f" {text} "
+    for name, vendor in index["vendors"]:
+        if f" {name} " in padded:
+            return vendor["id"]
+    return None
+
+
+def find_invoice_items(index, text, vendor_id):
+    """Open items whose invoice number appears as a word (or two adjacent words) in the text."""
+    words = text.split()
+    candidates = set(words) | {a + b for a, b in zip(words, words[1:])}
+    items = []
+    for candidate in candidates:
+        for item in index["by_invoice"].get(candidate, ()):
+            if item["remaining"] > 0 and (vendor_id is None or item["vendor_id"] == vendor_id):
+                items.append(item)
+    return sorted(items, key=lambda item: (item["purchase_date"], item["id"]))
+
+
+def find_subset(items, amount):
+    """Oldest-first combination of item dues adding up to exactly `amount`, or None."""
+    target = int(amount * 100)
+    dues = [int(item["remaining"] * 100) for item in items[:SUBSET_SUM_MAX_ITEMS]]
+    reachable = {0: ()}
+    for position, due in enumerate(dues):
+        for total, subset in list(reachable.items()):
+            new_total = total + due
+            if new_total > target or new_total in reachable:
+                continue
+            reachable[new_total] = subset + (position,)
+            if new_total == target:
+                return [items[i] for i in reachable[new_total]]
+            if len(reachable) > SUBSET_SUM_MAX_STATES:
+                return None
+    return None
+
+
+def allocate_greedy(items, amount):
+    allocations = []
+    for item in items:
+        if amount <= 0:
+            break
+        paid = min(item["remaining"], amount)
+        if paid > 0:
+            allocations.append((item, paid))
+            amount -= paid
+    return allocations
+
+
+def match_debit(index, debit):
+    """
+    Work out which open invoices a debit pays. Tried in order: an invoice number in the
+    reference / narration, one invoice of the vendor due exactly the amount (closest in date),
+    a combination of invoices adding up to the amount, and finally oldest invoices first.
+    Returns (vendor_id, method, [(item, amount), ...]) or (vendor_id, None, message).
+    """
+    text = normalize_name(f"{debit['reference']} {debit['description']}")
+    vendor_id = find_vendor(index, text)
+    invoice_items = find_invoice_items(index, text, vendor_id)
+    if vendor_id is None and invoice_items and len({item["vendor_id"] for item in invoice_items}) == 1:
+        vendor_id = invoice_items[0]["vendor_id"]
+    if vendor_id is None:
+        return None, None, "Vendor not found in the narration"
+
+    open_items = [item for item in index["by_vendor"].get(vendor_id, []) if item["remaining"] > 0]
+    amount = debit["amount"]
+    if amount > sum((item["remaining"] for item in open_items), to_money(0)):
+        return vendor_id, None, "Amount is more than the vendor's open dues"
+
+    if invoice_items:
+        invoice_item_ids = {item["id"] for item in invoice_items}
+        others = [item for item in open_items if item["id"] not in invoice_item_ids]
+        return vendor_id, "invoice", allocate_greedy(invoice_items + others, amount)
+
+    exact = [item for item in open_items if item["remaining"] == amount
+             and abs((item["purchase_date"] - debit["date"]).days) <= MATCH_WINDOW_DAYS]
+    if exact:
+        item = min(exact, key=lambda item: (abs((item["purchase_date"] - debit["date"]).days), item["purchase_date"]))
+        return vendor_id, "amount", [(item, amount)]
+
+    subset = find_subset(open_items, amount)
+    if subset:
+        return vendor_id, "subset", [(item, item["remaining"]) for item in subset]
+
+    return vendor_id, "oldest_first", allocate_greedy(open_items, amount)
+
+
+def match_bank_statement(debits, index, imported_references=frozenset()):
+    """
+    Match every debit, oldest first, against the open item index. Returns one result per debit
+    with status matched / unmatched / already_imported / duplicate, the vendor, method and allocations.
+    A line with the same vendor and statement reference as an earlier line of the same statement is
+    a duplicate and is not matched, just like one already posted from an earlier statement.
+    """
+    results = []
+    first_rows = {}
+    for debit in sorted(debits, key=lambda debit: (debit["date"], debit["row"])):
+        reference = statement_reference(debit)
+        result = dict(debit, statement_reference=reference, vendor_id=None, vendor_name=None,
+                      method=None, allocations=[], status="unmatched", message=None)
+        vendor_id, method, allocations = match_debit(index, debit)
+        result["vendor_id"] = vendor_id
+        result["vendor_name"] = index["vendor_names"].get(vendor_id)
+        first_row = first_rows.setdefault((vendor_id, reference), debit["row"])
+        if (vendor_id, reference) in imported_references:
+            result.update(status="already_imported", message="Already posted from an earlier statement")
+        elif first_row != debit["row"]:
+            result.update(status="duplicate", message=f"Same statement line as row {first_row}")
+        elif method is None:
+            result["message"] = allocations
+        else:
+            for item, paid in allocations:
+                item["remaining"] -= paid
+            result.update(status="matched", method=method, allocations=[
+                {"invoice_number": item["invoice_number"], "purchase_date": item["purchase_date"], "amount": paid}
+                for item, paid in allocations
+            ])
+        results.append(result)
+    return sorted(results, key=lambda result: result["row"])
@@ -0,0 +1,57 @@
+"""
+Compare how long each sales report format takes to parse through read_sales_report.
+
+    python benchmark_sales_readers.py            # 10k and 100k rows
+    python benchmark_sales_readers.py 50000      # custom row counts
+"""
+import io
+import sys
+import time
+import random
+import pandas as pd
+from sales_import import SALES_REPORT_COLUMNS, read_sales_report
+
+CATEGORIES = ["Starters", "Main Course", "Biryani", "Breads", "Desserts", "Beverages"]
+
+
+def build_report(rows):
+    random.seed(rows)
+    return pd.DataFrame({
+        "Category": [random.choice(CATEGORIES) for _ in range(rows)],
+        "Item Name": [f"Dish {i}" for i in range(rows)],
+        "Qty": [random.randint(1, 40) for _ in range(rows)],
+    }, columns=SALES_REPORT_COLUMNS)
+
+
+def serialize(df, fmt):
+    buffer = io.BytesIO()
+    if fmt == "xlsx":
+        df.to_excel(buffer, index=False)
+    elif fmt == "csv":
+        df.to_csv(buffer, index=False)
+    elif fmt == "tsv":
+        df.to_csv(buffer, index=False, sep="\t")
+    elif fmt == "parquet":
+        df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def main(row_counts):
+    print(f"{'rows':>8} {'format':>8} {'size (KB)':>10} {'parse (s)':>10} {'rows/s':>12}")
+    for rows in row_counts:
+        df = build_report(rows)
+        for fmt in ("xlsx", "csv", "tsv", "parquet"):
+            try:
+                content = serialize(df, fmt)
+            except ImportError as e:
+                print(f"{rows:>8} {fmt:>8} skipped ({e})")
+                continue
+            start = time.perf_counter()
+            parsed = read_sales_report(content)
+            elapsed = time.perf_counter() - start
+            assert len(parsed) == rows
+            print(f"{rows:>8} {fmt:>8} {len(content) / 1024:>10.1f} {elapsed:>10.3f} {rows / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,140 @@
+"""
+Time the raw material transfer report lookups against a large scratch copy of
+raw_material_transfer_details, before and after the sargable rewrite and composite indexes.
+
+    python benchmark_transfer_queries.py            # 1,000,000 rows
+    python benchmark_transfer_queries.py 200000     # custom row count
+
+Uses the database configured for the app and drops its scratch table when done.
+"""
+import sys
+import time
+from db_utils import get_db_connection
+
+TABLE = "benchmark_raw_material_transfer_details"
+REPEATS = 5
+
+# One storage room, destination and day to look up, like /get_transfer_ids and the transfer report
+FILTERS = (1, "kitchen", 1, "2023-03-01")
+
+QUERIES = {
+    "transfer report": (
+        f"""SELECT raw_material_id, quantity, metric,
+                   DATE_FORMAT(STR_TO_DATE(transfer_time, '%Y-%m-%d %H:%i:%S'), '%Y-%m-%d %I:%i:%S %p'), transfer_id
+            FROM {TABLE}
+            WHERE source_storage_room_id = %s AND destination_type = %s AND destination_id = %s
+              AND DATE(transferred_date) = %s""",
+        f"""SELECT raw_material_id, quantity, metric,
+                   DATE_FORMAT(transfer_time, '%Y-%m-%d %I:%i:%S %p'), transfer_id
+            FROM {TABLE}
+            WHERE source_storage_room_id = %s AND destination_type = %s AND destination_id = %s
+              AND transferred_date = %s""",
+        FILTERS,
+    ),
+    "transfer ids": (
+        f"""SELECT DISTINCT transfer_id FROM {TABLE}
+            WHERE source_storage_room_id = %s AND destination_type = %s AND destination_id = %s
+              AND DATE(transferred_date) = %s ORDER BY transfer_id""",
+        f"""SELECT DISTINCT transfer_id FROM {TABLE}
+            WHERE source_storage_room_id = %s AND destination_type = %s AND destination_id = %s
+              AND transferred_date = %s ORDER BY transfer_id""",
+        FILTERS,
+    ),
+    "day history": (
+        f"SELECT raw_material_id, quantity, destination_type, destination_id FROM {TABLE} WHERE DATE(transferred_date) = %s",
+        f"SELECT raw_material_id, quantity, destination_type, destination_id FROM {TABLE} WHERE transferred_date = %s",
+        FILTERS[3:],
+    ),
+}
+
+
+def build_table(cursor, rows):
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    # Same columns and single-column keys as raw_material_transfer_details had before the composite index
+    cursor.execute(f"""
+        CREATE TABLE {TABLE} (
+          `id` int NOT NULL AUTO_INCREMENT,
+          `source_storage_room_id` int NOT NULL,
+          `destination_type` enum('kitchen','restaurant') NOT NULL,
+          `destination_id` int NOT NULL,
+          `raw_material_id` int NOT NULL,
+          `quantity` decimal(25,5) NOT NULL,
+          `metric` enum('kg','grams','liter','ml','unit') NOT NULL,
+          `transferred_date` date NOT NULL,
+          `transfer_time` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          `transfer_id` int NOT NULL,
+          PRIMARY KEY (`id`),
+          KEY `destination_id` (`destination_id`),
+          KEY `raw_material_id` (`raw_material_id`)
+        )
+    """)
+    digits = "(SELECT 0 AS n UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 " \
+             "UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9)"
+    places = max(1, len(str(rows - 1)))
+    number = " + ".join(f"d{place}.n * {10 ** place}" for place in range(places))
+    # 5 storage rooms, 20 kitchens and 20 restaurants, 500 materials, three years of days
+    cursor.execute(f"""
+        INSERT INTO {TABLE}
+            (source_storage_room_id, destination_type, destination_id, raw_material_id, quantity, metric,
+             transferred_date, transfer_time, transfer_id)
+        SELECT MOD(n, 5) + 1, IF(MOD(n, 2), 'restaurant', 'kitchen'), MOD(n DIV 2, 20) + 1, MOD(n, 500) + 1, MOD(n, 1000) / 10, 'kg',
+               DATE '2023-01-01' + INTERVAL MOD(n DIV 1000, 1095) DAY,
+               TIMESTAMP(DATE '2023-01-01' + INTERVAL MOD(n DIV 1000, 1095) DAY) + INTERVAL MOD(n, 86400) SECOND,
+               MOD(n, 7) + 1
+        FROM (SELECT {number} AS n FROM {", ".join(f"{digits} d{place}" for place in range(places))}) numbers
+        WHERE n < %s
+    """, (rows,))
+    cursor.execute(f"ANALYZE TABLE {TABLE}")
+    cursor.fetchall()
+
+
+def add_indexes(cursor):
+    cursor.execute(f"""
+        ALTER TABLE {TABLE}
+            ADD KEY `source_destination_date_transfer` (`source_storage_room_id`,`destination_type`,`destination_id`,`transferred_date`,`transfer_id`),
+            ADD KEY `transferred_date` (`transferred_date`)
+    """)
+    cursor.execute(f"ANALYZE TABLE {TABLE}")
+    cursor.fetchall()
+
+
+def time_query(cursor, query, params):
+    cursor.execute("EXPLAIN " + query, params)
+    columns = [column[0] for column in cursor.description]
+    plan = dict(zip(columns, cursor.fetchone()))
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        found = len(cursor.fetchall())
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2], found, plan
+
+
+def main(rows):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        build_table(cursor, rows)
+        conn.commit()
+        print(f"Loaded {rows} rows in {time.perf_counter() - start:.1f}s\n")
+
+        results = {name: {"before": time_query(cursor, old, params)} for name, (old, _, params) in QUERIES.items()}
+        add_indexes(cursor)
+        for name, (_, new, params) in QUERIES.items():
+            results[name]["after"] = time_query(cursor, new, params)
+
+        print(f"{'query':>16} {'phase':>7} {'median (ms)':>12} {'rows':>6} {'access':>7} {'key':>34} {'examined':>10}")
+        for name, phases in results.items():
+            for phase, (elapsed, found, plan) in phases.items():
+                print(f"{name:>16} {phase:>7} {elapsed * 1000:>12.2f} {found:>6} {plan['type'] or '':>7} "
+                      f"{plan['key'] or '-':>34} {plan['rows'] or 0:>10}")
+    finally:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -88,6 +88,7 @@ CREATE TABLE IF NOT EXISTS `inventory_stock` (
   `currently_available` decimal(10,5) NOT NULL DEFAULT '0.00000',
   `minimum_quantity` decimal(10,5) NOT NULL DEFAULT '0.00000',
   `quantity_needed` decimal(10,5) NOT NULL DEFAULT '0.00000',
+  `average_unit_cost` decimal(20,5) NOT NULL DEFAULT '0.00000',
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
@@ -136,10 +137,13 @@ CREATE TABLE IF NOT EXISTS `payment_records` (
   `amount_paid` decimal(35,2) NOT NULL,
   `mode_of_payment` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
   `paid_on` date NOT NULL,
+  `reference` varchar(100) DEFAULT NULL,
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
   KEY `vendor_id` (`vendor_id`),
+  KEY `vendor_reference` (`vendor_id`,`reference`),
+  KEY `vendor_paid_on` (`vendor_id`,`paid_on`),
   CONSTRAINT `payment_records_ibfk_1` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`)
 );
 
@@ -178,6 +182,8 @@ CREATE TABLE IF NOT EXISTS `raw_material_transfer_details` (
   PRIMARY KEY (`id`),
   KEY `destination_id` (`destination_id`),
   KEY `raw_material_id` (`raw_material_id`),
+  KEY `source_destination_date_transfer` (`source_storage_room_id`,`destination_type`,`destination_id`,`transferred_date`,`transfer_id`),
+  KEY `transferred_date` (`transferred_date`),
   CONSTRAINT `raw_material_transfer_details_ibfk_3` FOREIGN KEY (`raw_material_id`) REFERENCES `raw_materials` (`id`)
 );
 
@@ -189,9 +195,172 @@ CREATE TABLE IF NOT EXISTS `vendor_payment_tracker` (
   `outstanding_cost` decimal(35,2) NOT NULL DEFAULT '0.00',
   `total_paid` decimal(35,2) NOT NULL DEFAULT '0.00',
   `total_due` decimal(35,2) GENERATED ALWAYS AS ((`outstanding_cost` - `total_paid`)) STORED,
+  `is_open` tinyint(1) GENERATED ALWAYS AS ((`outstanding_cost` <> `total_paid`)) STORED,
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `last_updated` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
   UNIQUE KEY `unique_vendor_invoice` (`vendor_id`,`invoice_number`,`purchase_date`),
+  KEY `vendor_open_purchase_date` (`vendor_id`,`is_open`,`purchase_date`),
+  KEY `open_purchase_date` (`is_open`,`purchase_date`),
   CONSTRAINT `fk_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
 );
+
+-- POS item names mapped to the dish they should be matched to during sales uploads
+CREATE TABLE IF NOT EXISTS `dish_aliases` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `pos_category` varchar(255) NOT NULL,
+  `pos_item_name` varchar(255) NOT NULL,
+  `alias_key` varchar(512) NOT NULL,
+  `dish_id` int NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_alias_key` (`alias_key`),
+  KEY `dish_id` (`dish_id`)
+);
+
+-- Large / multi-day sales reports uploaded in chunks. Kept in the database so an upload can be
+-- resumed from any app worker and nothing is written to the local filesystem.
+CREATE TABLE IF NOT EXISTS `sales_report_uploads` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `upload_key` char(32) NOT NULL,
+  `restaurant_id` int NOT NULL,
+  `filename` varchar(255) NOT NULL,
+  `default_sales_date` date NOT NULL,
+  `total_size` bigint NOT NULL,
+  `chunk_size` int NOT NULL,
+  `total_chunks` int NOT NULL,
+  `status` enum('uploading','processing','completed','failed') NOT NULL DEFAULT 'uploading',
+  `last_committed_date` date DEFAULT NULL,
+  `lease_token` char(32) DEFAULT NULL,
+  `lease_expires_at` timestamp NULL DEFAULT NULL,
+  `error` text,
+  `error_details` json DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_upload_key` (`upload_key`),
+  KEY `status_updated_at` (`status`,`updated_at`)
+);
+
+CREATE TABLE IF NOT EXISTS `sales_report_upload_chunks` (
+  `upload_id` int NOT NULL,
+  `chunk_index` int NOT NULL,
+  `size` int NOT NULL,
+  `data` mediumblob NOT NULL,
+  PRIMARY KEY (`upload_id`,`chunk_index`),
+  CONSTRAINT `fk_sales_report_upload_id` FOREIGN KEY (`upload_id`) REFERENCES `sales_report_uploads` (`id`) ON DELETE CASCADE
+);
+
+-- One row per purchase invoice, kept in step with purchase_history by the purchase write paths
+CREATE TABLE IF NOT EXISTS `purchase_invoices` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `vendor_id` int NOT NULL,
+  `invoice_number` varchar(50) NOT NULL,
+  `purchase_date` date NOT NULL,
+  `storageroom_id` int NOT NULL,
+  `total_cost` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `line_count` int NOT NULL DEFAULT '0',
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_purchase_invoice` (`vendor_id`,`invoice_number`,`purchase_date`,`storageroom_id`),
+  KEY `purchase_date` (`purchase_date`),
+  KEY `vendor_purchase_date` (`vendor_id`,`purchase_date`),
+  KEY `fk_purchase_invoice_storageroom_id` (`storageroom_id`),
+  CONSTRAINT `fk_purchase_invoice_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT,
+  CONSTRAINT `fk_purchase_invoice_storageroom_id` FOREIGN KEY (`storageroom_id`) REFERENCES `storagerooms` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+);
+
+-- Cumulative purchases and payments of a vendor up to and including each month end, so a ledger's
+-- opening balance never sums the vendor's whole history. Rebuilt by `flask refresh-vendor-balances`
+-- and moved in place by every purchase, payment and reversal dated on or before a checkpoint.
+CREATE TABLE IF NOT EXISTS `vendor_balance_checkpoints` (
+  `vendor_id` int NOT NULL,
+  `checkpoint_date` date NOT NULL,
+  `total_credit` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `total_debit` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`vendor_id`,`checkpoint_date`),
+  CONSTRAINT `fk_vendor_balance_checkpoint_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+);
+
+-- Open dues of each vendor split by invoice age on `as_of`. Kept in step by the purchase, payment
+-- and reversal paths and re-bucketed nightly by `flask roll-vendor-ageing`.
+CREATE TABLE IF NOT EXISTS `vendor_ageing_summary` (
+  `vendor_id` int NOT NULL,
+  `as_of` date NOT NULL,
+  `due_0_30` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `due_31_60` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `due_61_90` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `due_over_90` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `total_due` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`vendor_id`),
+  CONSTRAINT `fk_vendor_ageing_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+);
+
+-- Last transfer id handed out per storage room and day, bumped atomically by allocate_transfer_ids
+CREATE TABLE IF NOT EXISTS `raw_material_transfer_sequences` (
+  `source_storage_room_id` int NOT NULL,
+  `transferred_date` date NOT NULL,
+  `last_transfer_id` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`source_storage_room_id`,`transferred_date`)
+);
+
+-- One row per raw material transfer (storage room, day, transfer id) and where it went
+CREATE TABLE IF NOT EXISTS `raw_material_transfers` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `source_storage_room_id` int NOT NULL,
+  `transferred_date` date NOT NULL,
+  `transfer_id` int NOT NULL,
+  `destination_type` enum('kitchen','restaurant') NOT NULL,
+  `destination_id` int NOT NULL,
+  `transfer_time` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_transfer` (`source_storage_room_id`,`transferred_date`,`transfer_id`),
+  KEY `source_destination_date` (`source_storage_room_id`,`destination_type`,`destination_id`,`transferred_date`,`transfer_id`)
+);
+
+-- Append-only ledger of every stock change; inventory_stock is its running balance per location and material
+CREATE TABLE IF NOT EXISTS `inventory_movements` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `movement_type` enum('opening','purchase','purchase_reversal','transfer_in','transfer_out','consumption') NOT NULL,
+  `movement_date` date NOT NULL,
+  `destination_type` enum('storageroom','kitchen','restaurant') NOT NULL,
+  `destination_id` int NOT NULL,
+  `raw_material_id` int NOT NULL,
+  `metric` enum('kg','liter','unit') NOT NULL,
+  `incoming` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `outgoing` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `total_cost` decimal(35,2) DEFAULT NULL,
+  `reference` varchar(100) DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `location_material_date` (`destination_type`,`destination_id`,`raw_material_id`,`movement_date`),
+  KEY `movement_date` (`movement_date`)
+);
+
+-- Month-end stock per location and material, rebuilt by `flask refresh-inventory-snapshots` and kept
+-- current by record_inventory_movements; point-in-time stock replays the ledger from the latest one
+CREATE TABLE IF NOT EXISTS `inventory_snapshots` (
+  `snapshot_date` date NOT NULL,
+  `destination_type` enum('storageroom','kitchen','restaurant') NOT NULL,
+  `destination_id` int NOT NULL,
+  `raw_material_id` int NOT NULL,
+  `metric` enum('kg','liter','unit') NOT NULL,
+  `incoming_stock` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `outgoing_stock` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `currently_available` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  PRIMARY KEY (`destination_type`,`destination_id`,`raw_material_id`,`snapshot_date`)
+);
+
+-- Bank statements between the import preview and posting their matched payments
+CREATE TABLE IF NOT EXISTS `pending_bank_statements` (
+  `token` char(32) NOT NULL,
+  `filename` varchar(255) NOT NULL,
+  `content` mediumblob NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`token`),
+  KEY `created_at` (`created_at`)
+);
@@ -1,10 +1,14 @@
 import mysql.connector
 from mysql.connector import Error
+import json
 import logging
 from datetime import datetime
 from decimal import Decimal
 import os
 import pytz
+import tempfile
+import uuid
+from payment_allocation import allocate_payment, to_money
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -195,12 +199,234 @@ def get_sales_report_data(sales_date):
     return sales_report_data
 
 
+def get_dishes_with_recipe_count():
+    # Every dish with the number of raw materials in its recipe, for the in-memory dish matcher
+    query = """
+    SELECT d.id, d.category, d.name, COUNT(drm.raw_material_id) AS recipe_items
+    FROM dishes d
+    LEFT JOIN dish_raw_materials drm ON drm.dish_id = d.id
+    GROUP BY d.id, d.category, d.name
+    """
+    return fetch_all(query)
+
+
+def get_all_dish_aliases():
+    query = """
+    SELECT da.id, da.pos_category, da.pos_item_name, da.dish_id, d.category AS dish_category, d.name AS dish_name
+    FROM dish_aliases da
+    JOIN dishes d ON da.dish_id = d.id
+    ORDER BY da.pos_category, da.pos_item_name
+    """
+    return fetch_all(query)
+
+
+def save_dish_alias(pos_category, pos_item_name, alias_key, dish_id):
+    query = """
+    INSERT INTO dish_aliases (pos_category, pos_item_name, alias_key, dish_id)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        pos_category = VALUES(pos_category),
+        pos_item_name = VALUES(pos_item_name),
+        dish_id = VALUES(dish_id)
+    """
+    return execute_query(query, (pos_category, pos_item_name, alias_key, dish_id))
+
+
+def delete_dish_alias(alias_id):
+    query = 'DELETE FROM dish_aliases WHERE id = %s'
+    return execute_query(query, (alias_id,))
+
+
 def get_dish_recipe(dish_id):
     query = 'SELECT dish_id, raw_material_id, quantity, metric FROM dish_raw_materials WHERE dish_id =%s'
     recipe = fetch_all(query, (dish_id,))
     return recipe
 
 
+def get_dish_recipes(dish_ids):
+    # Recipes of many dishes in one query
+    if not dish_ids:
+        return []
+    placeholders = ",".join(["%s"] * len(dish_ids))
+    query = f"""
+    SELECT drm.dish_id, drm.raw_material_id, rm.name AS raw_material_name, drm.quantity, drm.metric
+    FROM dish_raw_materials drm
+    JOIN raw_materials rm ON rm.id = drm.raw_material_id
+    WHERE drm.dish_id IN ({placeholders})
+    """
+    return fetch_all(query, tuple(dish_ids))
+
+
+def get_transferred_dish_ids(restaurant_id, transferred_date):
+    query = """
+    SELECT DISTINCT dish_id FROM prepared_dish_transfer
+    WHERE destination_restaurant_id = %s AND transferred_date = %s
+    """
+    return {row["dish_id"] for row in fetch_all(query, (restaurant_id, transferred_date))}
+
+
+def get_inventory_snapshot(destination_type, destination_id):
+    # Plain SELECT, so InnoDB serves it as a consistent read without taking row locks
+    query = """
+    SELECT raw_material_id, metric, currently_available
+    FROM inventory_stock
+    WHERE destination_type = %s AND destination_id = %s
+    """
+    return {row["raw_material_id"]: row for row in fetch_all(query, (destination_type, destination_id))}
+
+
+def create_sales_report_upload(upload_key, restaurant_id, filename, default_sales_date, total_size, chunk_size, total_chunks):
+    query = """
+    INSERT INTO sales_report_uploads
+        (upload_key, restaurant_id, filename, default_sales_date, total_size, chunk_size, total_chunks)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+    return execute_query(query, (upload_key, restaurant_id, filename, default_sales_date, total_size, chunk_size, total_chunks))
+
+
+def get_sales_report_upload(upload_key):
+    query = """
+    SELECT sru.*, COUNT(c.chunk_index) AS received_chunks, COALESCE(SUM(c.size), 0) AS received_size
+    FROM sales_report_uploads sru
+    LEFT JOIN sales_report_upload_chunks c ON c.upload_id = sru.id
+    WHERE sru.upload_key = %s
+    GROUP BY sru.id
+    """
+    return fetch_one(query, (upload_key,))
+
+
+def get_sales_report_upload_chunk_indexes(upload_id):
+    query = 'SELECT chunk_index FROM sales_report_upload_chunks WHERE upload_id = %s ORDER BY chunk_index'
+    return [row["chunk_index"] for row in fetch_all(query, (upload_id,))]
+
+
+def save_sales_report_upload_chunk(upload_id, chunk_index, data):
+    # Re-sending a chunk replaces it, so a client can safely retry after a dropped connection
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO sales_report_upload_chunks (upload_id, chunk_index, size, data)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE size = VALUES(size), data = VALUES(data)
+        """, (upload_id, chunk_index, len(data), data))
+        # Keep the upload from expiring while chunks are still arriving
+        cursor.execute('UPDATE sales_report_uploads SET updated_at = NOW() WHERE id = %s', (upload_id,))
+        conn.commit()
+        return True
+    except Error as e:
+        conn.rollback()
+        logger.error(f"Database Error: {e}")
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def spool_sales_report_upload(upload_id, max_memory_size):
+    """
+    Stream an upload's chunks, one row at a time, into a temporary file that stays in memory up to
+    `max_memory_size` bytes and spills over to disk beyond that. Returns the file rewound to the start.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory_size, mode='w+b')
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            'SELECT data FROM sales_report_upload_chunks WHERE upload_id = %s ORDER BY chunk_index', (upload_id,))
+        for (data,) in cursor:
+            spool.write(data)
+        spool.seek(0)
+        return spool
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def claim_sales_report_upload(upload_id, lease_minutes):
+    """
+    Move an upload to 'processing' under a new lease unless another run holds one. The lease is
+    renewed before every day the run commits, so only a run that has stopped renewing it for
+    `lease_minutes` can be taken over. Returns the lease token, or None if the upload was not claimed.
+    """
+    lease_token = uuid.uuid4().hex
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE sales_report_uploads
+            SET status = 'processing', error = NULL, error_details = NULL, lease_token = %s,
+                lease_expires_at = NOW() + INTERVAL %s MINUTE
+            WHERE id = %s
+              AND (status IN ('uploading', 'failed')
+                   OR (status = 'processing' AND (lease_expires_at IS NULL OR lease_expires_at < NOW())))
+        """, (lease_token, lease_minutes, upload_id))
+        conn.commit()
+        return lease_token if cursor.rowcount == 1 else None
+    except Error as e:
+        # A lock wait timeout means a run is committing a day of this upload right now
+        conn.rollback()
+        logger.error(f"Database Error: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def update_sales_report_upload(upload_id, status, error=None, lease_token=None, error_details=None):
+    """
+    Record how a run ended and release its lease. With `lease_token`, only if that run still holds the
+    lease. `error_details` is a dict of the problems found (report errors, missing recipes) kept as JSON.
+    """
+    query = """
+    UPDATE sales_report_uploads
+    SET status = %s, error = %s, error_details = %s, lease_token = NULL, lease_expires_at = NULL, updated_at = NOW()
+    WHERE id = %s AND (%s IS NULL OR lease_token = %s)
+    """
+    details = json.dumps(error_details) if error_details is not None else None
+    return execute_query(query, (status, error, details, upload_id, lease_token, lease_token))
+
+
+def lock_sales_report_upload(cursor, upload_id, lease_token, lease_minutes):
+    """
+    Lock an upload row for the rest of the caller's transaction, check the caller still holds the
+    lease and renew it. Returns the upload's last_committed_date. Raises ValueError if another run
+    has taken the upload over.
+    """
+    cursor.execute('SELECT last_committed_date, lease_token FROM sales_report_uploads WHERE id = %s FOR UPDATE',
+                   (upload_id,))
+    row = cursor.fetchone()
+    if not row or row[1] != lease_token:
+        raise ValueError("This upload has been taken over by another run")
+    cursor.execute('UPDATE sales_report_uploads SET lease_expires_at = NOW() + INTERVAL %s MINUTE WHERE id = %s',
+                   (lease_minutes, upload_id))
+    return row[0]
+
+
+def checkpoint_sales_report_upload(cursor, upload_id, sales_date):
+    """Record `sales_date` as committed inside the same transaction as its sales and stock movements."""
+    cursor.execute("""
+        UPDATE sales_report_uploads SET last_committed_date = %s, updated_at = NOW() WHERE id = %s
+    """, (sales_date, upload_id))
+
+
+def delete_sales_report_upload_chunks(upload_id):
+    query = 'DELETE FROM sales_report_upload_chunks WHERE upload_id = %s'
+    return execute_query(query, (upload_id,))
+
+
+def delete_expired_sales_report_uploads(expiry_hours):
+    # Abandoned uploads that were never finalized; their chunks go with them (ON DELETE CASCADE)
+    query = """
+    DELETE FROM sales_report_uploads
+    WHERE status IN ('uploading', 'failed') AND updated_at < NOW() - INTERVAL %s HOUR
+    """
+    return execute_query(query, (expiry_hours,))
+
+
 def check_dish_transferred(dish_id, prepared_date, restaurant_id):
     result = None
     conn = get_db_connection()
@@ -209,6 +435,7 @@ def check_dish_transferred(dish_id, prepared_date, restaurant_id):
     cursor.execute(query, (dish_id, prepared_date, restaurant_id))
     result = cursor.fetchone()
     cursor.close()
+    conn.close()
     return result
 
 
@@ -220,6 +447,7 @@ def check_prepared_dish(dish_id, prepared_date, restaurant_id):
     cursor.execute(query, (dish_id, prepared_date, restaurant_id))
     result = cursor.fetchone()
     cursor.close()
+    conn.close()
     return result
 
 
@@ -239,7 +467,7 @@ def get_restaurant_consumption_report(restaurant_id, report_date):
     JOIN 
         raw_materials rm ON ris.raw_material_id = rm.id
     LEFT JOIN 
-        raw_material_transfer_details rmtd ON rmtd.destination_id = ris.restaurant_id AND rmtd.raw_material_id = ris.raw_material_id AND DATE(rmtd.transferred_date) = %s AND rmtd.destination_type = 'restaurant'
+        raw_material_transfer_details rmtd ON rmtd.destination_id = ris.restaurant_id AND rmtd.raw_material_id = ris.raw_material_id AND rmtd.transferred_date = %s AND rmtd.destination_type = 'restaurant'
     LEFT JOIN 
         consumption c ON c.location_id = ris.restaurant_id AND c.raw_material_id = ris.raw_material_id AND c.location_type = 'restaurant' AND DATE(c.consumption_date) = %s
     WHERE 
@@ -271,7 +499,7 @@ JOIN
 JOIN 
     raw_materials rm ON kis.raw_material_id = rm.id
 LEFT JOIN 
-    raw_material_transfer_details rmtd ON rmtd.destination_id = kis.kitchen_id AND rmtd.raw_material_id = kis.raw_material_id AND DATE(rmtd.transferred_date) = %s AND rmtd.destination_type = 'kitchen'
+    raw_material_transfer_details rmtd ON rmtd.destination_id = kis.kitchen_id AND rmtd.raw_material_id = kis.raw_material_id AND rmtd.transferred_date = %s AND rmtd.destination_type = 'kitchen'
 LEFT JOIN 
     consumption c ON c.location_id = kis.kitchen_id AND c.raw_material_id = kis.raw_material_id AND c.location_type = 'kitchen' AND DATE(c.consumption_date) = %s
 WHERE 
@@ -458,7 +686,7 @@ def get_all_pending_payments():
     JOIN
         vendor_list AS vl ON vpt.vendor_id = vl.id
     WHERE
-        vpt.total_due != 0;
+        vpt.is_open = 1;
     """
     payments = fetch_all(query)
     return payments
@@ -477,6 +705,8 @@ def get_all_pending_payments_vendor_cumulative():
         vendor_payment_tracker AS vpt
     JOIN
         vendor_list AS vl ON vpt.vendor_id = vl.id
+    WHERE
+        vpt.is_open = 1
     GROUP BY
         vl.id, vl.vendor_name
     HAVING
@@ -527,8 +757,8 @@ def get_payment_details_of_vendor(vendor_id):
     JOIN
         vendor_list AS vl ON vpt.vendor_id = vl.id
     WHERE
-        vpt.total_due != 0 
-        AND vpt.vendor_id = %s
+        vpt.vendor_id = %s
+        AND vpt.is_open = 1
     ORDER BY purchase_date;
     """
     payments = fetch_all(query, (vendor_id,))
@@ -547,7 +777,9 @@ def get_storageroom_stock(destination_id=None, category=None):
         srm.outgoing_stock,
         srm.currently_available,
         COALESCE(ms.min_quantity, 0) AS minimum_required,
-        GREATEST(0, COALESCE(ms.min_quantity, 0) - srm.currently_available) AS quantity_needed
+        GREATEST(0, COALESCE(ms.min_quantity, 0) - srm.currently_available) AS quantity_needed,
+        srm.average_unit_cost,
+        ROUND(GREATEST(0, srm.currently_available) * srm.average_unit_cost, 2) AS stock_value
     FROM
         inventory_stock AS srm
     JOIN
@@ -620,9 +852,54 @@ def get_payment_record():
     return payments
 
 
-def get_rawmaterial_transfer_history(transferred_date):
-    query = """
+TRANSFER_HISTORY_PAGE_SIZE = 200
+
+
+def parse_page_cursor(cursor, id_parts=1):
+    """
+    Split a keyset `next_cursor` of the form "YYYY-MM-DD:<int>[:<int>...]" into the date and
+    `id_parts` integers. Returns None for anything else, e.g. a cursor edited in the URL.
+    """
+    parts = cursor.split(":") if isinstance(cursor, str) else []
+    if len(parts) != id_parts + 1:
+        return None
+    try:
+        datetime.strptime(parts[0], '%Y-%m-%d')
+        return (parts[0], *(int(part) for part in parts[1:]))
+    except ValueError:
+        return None
+
+
+def transfer_history_page(rows, limit):
+    """Trim the extra row fetched past `limit` and turn the last row kept into the next page's cursor."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['transferred_date']}:{rows[-1]['id']}"
+    return {"transfers": rows, "next_cursor": next_cursor}
+
+
+def get_rawmaterial_transfer_history(from_date, to_date, storageroom_id=None, destination_type=None,
+                                     destination_id=None, raw_material_id=None, after=None,
+                                     limit=TRANSFER_HISTORY_PAGE_SIZE):
+    """
+    One page of raw material transfers between two dates, ordered by (transferred_date, id) and
+    optionally narrowed to a storage room, a destination and a raw material. `after` is the
+    `next_cursor` of the previous page (a malformed one starts over from the first page); the keyset
+    condition is written so the date range stays an index range.
+    """
+    # A missing or malformed cursor starts from the first page
+    after_date, after_id = parse_page_cursor(after) or (from_date, 0)
+    filters = ""
+    params = [from_date, to_date, after_date, after_date, after_id]
+    for column, value in (("rmt.source_storage_room_id", storageroom_id), ("rmt.destination_type", destination_type),
+                          ("rmt.destination_id", destination_id), ("rmt.raw_material_id", raw_material_id)):
+        if value:
+            filters += f" AND {column} = %s"
+            params.append(value)
+    query = f"""
     SELECT
+        rmt.id,
         rm.name AS raw_material_name,
         rmt.quantity,
         rmt.metric,
@@ -633,7 +910,8 @@ def get_rawmaterial_transfer_history(transferred_date):
             WHEN rmt.destination_type = 'restaurant' THEN r.restaurantname
             ELSE 'Unknown'
         END AS transferred_to,
-        rmt.transferred_date
+        rmt.transferred_date,
+        rmt.transfer_id
     FROM
         raw_material_transfer_details rmt
     JOIN
@@ -645,21 +923,35 @@ def get_rawmaterial_transfer_history(transferred_date):
     LEFT JOIN
         restaurant r ON rmt.destination_type = 'restaurant' AND rmt.destination_id = r.id
     WHERE
-        DATE(rmt.transferred_date) = %s;
+        rmt.transferred_date BETWEEN %s AND %s
+        AND rmt.transferred_date >= %s AND (rmt.transferred_date > %s OR rmt.id > %s){filters}
+    ORDER BY rmt.transferred_date, rmt.id
+    LIMIT %s
     """
-    rawmaterial_transfer = fetch_all(query, (transferred_date,))
-    return rawmaterial_transfer
-
-
-def get_prepared_dishes_transfer_history(transferred_date):
-    query = """
+    return transfer_history_page(fetch_all(query, params + [limit + 1]), limit)
+
+
+def get_prepared_dishes_transfer_history(from_date, to_date, kitchen_id=None, restaurant_id=None, dish_id=None,
+                                         after=None, limit=TRANSFER_HISTORY_PAGE_SIZE):
+    """Like get_rawmaterial_transfer_history, for prepared dishes sent from kitchens to restaurants."""
+    # A missing or malformed cursor starts from the first page
+    after_date, after_id = parse_page_cursor(after) or (from_date, 0)
+    filters = ""
+    params = [from_date, to_date, after_date, after_date, after_id]
+    for column, value in (("pdt.source_kitchen_id", kitchen_id), ("pdt.destination_restaurant_id", restaurant_id),
+                          ("pdt.dish_id", dish_id)):
+        if value:
+            filters += f" AND {column} = %s"
+            params.append(value)
+    query = f"""
     SELECT
+        pdt.id,
         k.kitchenname AS kitchen_name,
         r.restaurantname AS restaurant_name,
         d.category AS dish_category,
         d.name AS dish_name,
         pdt.quantity AS transferred_quantity,
-        pdt.transferred_date AS transferred_on
+        pdt.transferred_date
     FROM
         prepared_dish_transfer pdt
     JOIN
@@ -669,10 +961,12 @@ def get_prepared_dishes_transfer_history(transferred_date):
     JOIN
         dishes d ON pdt.dish_id = d.id
     WHERE
-        DATE(pdt.transferred_date) = %s;
+        pdt.transferred_date BETWEEN %s AND %s
+        AND pdt.transferred_date >= %s AND (pdt.transferred_date > %s OR pdt.id > %s){filters}
+    ORDER BY pdt.transferred_date, pdt.id
+    LIMIT %s
     """
-    prepared_dishes_transfer = fetch_all(query, (transferred_date,))
-    return prepared_dishes_transfer
+    return transfer_history_page(fetch_all(query, params + [limit + 1]), limit)
 
 
 # def get_storageroom_rawmaterial_quantity(storageroom_id, rawmaterial_id):
@@ -694,6 +988,27 @@ def get_storageroom_rawmaterial_quantity(storageroom_id, rawmaterial_id):
     return data
 
 
+def get_storageroom_availability(storageroom_ids, raw_material_ids=None):
+    """
+    Current stock, minimum and needed quantity of every raw material held in the given storage
+    rooms, or only of raw_material_ids when given, in one query.
+    """
+    if not storageroom_ids:
+        return []
+    query = f"""
+    SELECT
+        destination_id AS storageroom_id, raw_material_id, metric, currently_available AS available_quantity,
+        minimum_quantity, quantity_needed
+    FROM inventory_stock
+    WHERE destination_type='storageroom' AND destination_id IN ({",".join(["%s"] * len(storageroom_ids))})"""
+    params = list(storageroom_ids)
+    if raw_material_ids:
+        query += f" AND raw_material_id IN ({','.join(['%s'] * len(raw_material_ids))})"
+        params += list(raw_material_ids)
+    query += " ORDER BY destination_id, raw_material_id"
+    return fetch_all(query, params)
+
+
 def get_total_cost_stats():
     data = [{'total_purchased_amount': 0, 'total_paid': 0, 'total_due': 0}]
     query = """
@@ -797,150 +1112,70 @@ ORDER BY
     return restaurant_inventory_stock
 
 
-def update_restaurant_stock(restaurant_id, dish_id, sold_quantity, sold_on):
-    # try:
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # Fetch raw materials required for the given dish
+def dish_raw_material_quantities(cursor, dish_id, dish_quantity):
+    """Raw materials used by `dish_quantity` of a dish, in kg/liter/unit, keyed by raw material id."""
     cursor.execute("""
         SELECT raw_material_id, quantity, metric
         FROM dish_raw_materials
         WHERE dish_id = %s
     """, (dish_id,))
-    raw_materials = cursor.fetchall()
-    # Calculate the total quantity needed for the sold dishes
+    # Report quantities arrive as floats (fractional portions are valid), recipe quantities as Decimal
+    dish_quantity = Decimal(str(dish_quantity))
     required_quantities = {}
-    for material in raw_materials:
-        total_quantity = material['quantity'] * sold_quantity
-        raw_material_id = material['raw_material_id']
-
+    for raw_material_id, quantity, metric in cursor.fetchall():
+        total_quantity = quantity * dish_quantity
         # Convert grams to kilograms and milliliters to liters
-        if material['metric'] == 'grams':
-            total_quantity /= 1000  # Convert to kg
-        elif material['metric'] == 'ml':
-            total_quantity /= 1000  # Convert to liters
-        if raw_material_id in required_quantities:
-            required_quantities[raw_material_id] += total_quantity
-        else:
-            required_quantities[raw_material_id] = total_quantity
-    # Update the restaurant inventory stock
-    for raw_material_id, required_quantity in required_quantities.items():
-        cursor.execute("""
-            SELECT quantity, metric
-            FROM restaurant_inventory_stock
-            WHERE restaurant_id = %s AND raw_material_id = %s
-        """, (restaurant_id, raw_material_id))
-        stock = cursor.fetchone()
-        if not stock:
-            continue
-        # Convert stock metric to match the required quantity
-        available_quantity = stock['quantity']
-        if stock['metric'] == 'grams':
-            available_quantity /= 1000  # Convert to kg
-            stock['metric'] = "kg"
-        elif stock['metric'] == 'ml':
-            available_quantity /= 1000  # Convert to liters
-            stock['metric'] = "liter"
-        # Calculate the new quantity after deduction
-        new_quantity = available_quantity - required_quantity
-        # Update the stock quantity in the database
-        cursor.execute("""
-            UPDATE restaurant_inventory_stock
-            SET quantity = %s
-            WHERE restaurant_id = %s AND raw_material_id = %s
-        """, (new_quantity, restaurant_id, raw_material_id))
+        if metric == 'grams':
+            total_quantity /= 1000
+            metric = 'kg'
+        elif metric == 'ml':
+            total_quantity /= 1000
+            metric = 'liter'
+        required = required_quantities.setdefault(raw_material_id, {"quantity": 0, "metric": metric})
+        required["quantity"] += total_quantity
+    return required_quantities
+
+
+def consume_raw_materials(cursor, location_type, location_id, dish_id, dish_quantity, consumed_on):
+    """
+    Deduct the recipe of `dish_quantity` dishes from a restaurant or kitchen inside the caller's
+    transaction. The consumption rows and ledger movements come from the recipe itself; the legacy
+    per-location table is only kept in step for the materials it still has a row for, in that
+    row's own unit.
+    """
+    legacy_table, legacy_column = {
+        "restaurant": ("restaurant_inventory_stock", "restaurant_id"),
+        "kitchen": ("kitchen_inventory_stock", "kitchen_id"),
+    }[location_type]
+
+    consumed = []
+    for raw_material_id, required in dish_raw_material_quantities(cursor, dish_id, dish_quantity).items():
+        # The required quantity is in kg / liter; rows kept in grams / ml are deducted 1000 times as much
+        cursor.execute(f"""
+            UPDATE {legacy_table}
+            SET quantity = quantity - IF(metric IN ('grams', 'ml'), %s * 1000, %s)
+            WHERE {legacy_column} = %s AND raw_material_id = %s
+        """, (required["quantity"], required["quantity"], location_id, raw_material_id))
         cursor.execute("""
         INSERT INTO consumption (raw_material_id, quantity, metric, consumption_date, location_type, location_id)
         VALUES (%s, %s, %s, %s, %s, %s)
         ON DUPLICATE KEY UPDATE
         quantity = quantity + VALUES(quantity);
-        """, (raw_material_id, required_quantity, stock['metric'], sold_on, "restaurant", restaurant_id))
-
-    # Commit the transaction
-    conn.commit()
-    print("Kitchen stock updated successfully.")
-
-    # except mysql.connector.Error as err:
-    #     print(f"Error: {err}")
-    # finally:
-    #     if conn.is_connected():
-    #         cursor.close()
-    #         conn.close()
-
-
-def update_kitchen_stock(kitchen_id, dish_id, prepared_quantity, prepared_on):
-    # try:
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+        """, (raw_material_id, required["quantity"], required["metric"], consumed_on, location_type, location_id))
+        consumed.append({"movement_type": "consumption", "movement_date": consumed_on, "destination_type": location_type,
+                         "destination_id": location_id, "raw_material_id": raw_material_id, "metric": required["metric"],
+                         "outgoing": required["quantity"]})
 
-    # Fetch raw materials required for the given dish
-    cursor.execute("""
-        SELECT raw_material_id, quantity, metric
-        FROM dish_raw_materials
-        WHERE dish_id = %s
-    """, (dish_id,))
-    raw_materials = cursor.fetchall()
-    # Calculate the total quantity needed for the prepared dishes
-    required_quantities = {}
-    for material in raw_materials:
-        total_quantity = material['quantity'] * prepared_quantity
-        raw_material_id = material['raw_material_id']
+    # inventory_stock follows the movement ledger
+    apply_stock_movements(cursor, consumed)
 
-        # Convert grams to kilograms and milliliters to liters
-        if material['metric'] == 'grams':
-            total_quantity /= 1000  # Convert to kg
-        elif material['metric'] == 'ml':
-            total_quantity /= 1000  # Convert to liters
 
-        if raw_material_id in required_quantities:
-            required_quantities[raw_material_id] += total_quantity
-        else:
-            required_quantities[raw_material_id] = total_quantity
-    # Update the kitchen inventory stock
-    for raw_material_id, required_quantity in required_quantities.items():
-        cursor.execute("""
-            SELECT quantity, metric
-            FROM kitchen_inventory_stock
-            WHERE kitchen_id = %s AND raw_material_id = %s
-        """, (kitchen_id, raw_material_id))
-        stock = cursor.fetchone()
-        if not stock:
-            continue
-        # Convert stock metric to match the required quantity
-        available_quantity = stock['quantity']
-        if stock['metric'] == 'grams':
-            available_quantity /= 1000  # Convert to kg
-            stock['metric'] = "kg"
-        elif stock['metric'] == 'ml':
-            available_quantity /= 1000  # Convert to liters
-            stock['metric'] = "liter"
-        # Calculate the new quantity after deduction
-        new_quantity = available_quantity - required_quantity
-
-        # Update the stock quantity in the database
-        cursor.execute("""
-            UPDATE kitchen_inventory_stock
-            SET quantity = %s
-            WHERE kitchen_id = %s AND raw_material_id = %s
-        """, (new_quantity, kitchen_id, raw_material_id))
-        cursor.execute("""
-        INSERT INTO consumption (raw_material_id, quantity, metric, consumption_date, location_type, location_id)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        quantity = quantity + VALUES(quantity);
-        """, (raw_material_id, required_quantity, stock['metric'], prepared_on, "kitchen", kitchen_id))
+def update_restaurant_stock(cursor, restaurant_id, dish_id, sold_quantity, sold_on):
+    consume_raw_materials(cursor, "restaurant", restaurant_id, dish_id, sold_quantity, sold_on)
 
-    # Commit the transaction
-    conn.commit()
-    print("Kitchen stock updated successfully.")
 
-    # except mysql.connector.Error as err:
-    #     print(f"Error: {err}")
-    # finally:
-    #     if conn.is_connected():
-    #         cursor.close()
-    #         conn.close()
+def update_kitchen_stock(cursor, kitchen_id, dish_id, prepared_quantity, prepared_on):
+    consume_raw_materials(cursor, "kitchen", kitchen_id, dish_id, prepared_quantity, prepared_on)
 
 
 def get_raw_material_by_id(rawmaterial_id):
@@ -1170,7 +1405,7 @@ def get_pending_payments_record(vendor_id):
     JOIN
         vendor_list AS vl ON vpt.vendor_id = vl.id
     WHERE
-        vpt.total_due != 0 
+        vpt.is_open = 1
         {vendor_filter}
     ORDER BY
         purchase_date ASC;
@@ -1186,14 +1421,14 @@ def get_pending_payments_record(vendor_id):
     JOIN
         vendor_list v ON vpt.vendor_id = v.id
     WHERE
-        1=1 {vendor_filter}
+        vpt.is_open = 1 {vendor_filter}
     GROUP BY
         v.id
     ORDER BY
         total_due DESC;
     """
     # Handling 'All' vendors by removing the vendor_id filter
-    vendor_filter = "AND vendor_id = %s" if vendor_id != "all" else ""
+    vendor_filter = "AND vpt.vendor_id = %s" if vendor_id != "all" else ""
 
     # Format the query dynamically
     payment_query = payment_query.format(vendor_filter=vendor_filter)
@@ -1370,10 +1605,10 @@ def get_transfer_raw_material_report(storageroom, destination_type, destination_
             LEFT JOIN
                 restaurant r ON rmt.destination_type = 'restaurant' AND rmt.destination_id = r.id
             WHERE
-                sr.id = %s
+                rmt.source_storage_room_id = %s
                 AND rmt.destination_type = %s
                 AND rmt.destination_id = %s
-                AND DATE(rmt.transferred_date) = %s
+                AND rmt.transferred_date = %s
             GROUP BY
                 rm.name, rm.category, rmt.metric, sr.storageroomname, rmt.destination_type, transferred_to, transferred_date;
             """
@@ -1393,7 +1628,7 @@ def get_transfer_raw_material_report(storageroom, destination_type, destination_
                 ELSE 'Unknown'
             END AS transferred_to,
             DATE_FORMAT(rmt.transferred_date, '%Y-%m-%d') AS transferred_date,
-            DATE_FORMAT(STR_TO_DATE(rmt.transfer_time, '%Y-%m-%d %H:%i:%S'), '%Y-%m-%d %I:%i:%S %p') AS transfer_time,
+            DATE_FORMAT(rmt.transfer_time, '%Y-%m-%d %I:%i:%S %p') AS transfer_time,
             rmt.transfer_id AS transfer_id
         FROM
             raw_material_transfer_details rmt
@@ -1406,10 +1641,10 @@ def get_transfer_raw_material_report(storageroom, destination_type, destination_
         LEFT JOIN
             restaurant r ON rmt.destination_type = 'restaurant' AND rmt.destination_id = r.id
         WHERE
-            sr.id = %s
+            rmt.source_storage_room_id = %s
             AND rmt.destination_type = %s
             AND rmt.destination_id = %s
-            AND DATE(rmt.transferred_date) = %s
+            AND rmt.transferred_date = %s
         """
 
         params = [storageroom, destination_type, destination_id, transferred_date]
@@ -1451,26 +1686,1119 @@ def delete_rawmaterial_from_db(rawmaterial_id):
 def get_cumulative_purchase_record_invoice_wise(date):
     query = """
     SELECT
-        ph.invoice_number,
-        ph.vendor_id,
+        pi.id AS invoice_id,
+        pi.invoice_number,
+        pi.vendor_id,
         v.vendor_name,
-        ph.storageroom_id,
+        pi.storageroom_id,
         sr.storageroomname AS storageroom_name,
-        SUM(ph.total_cost) AS total_purchase_amount,
-        ph.purchase_date as purchase_date
+        pi.total_cost AS total_purchase_amount,
+        pi.purchase_date as purchase_date
     FROM
-        purchase_history ph
+        purchase_invoices pi
     JOIN
-        vendor_list v ON ph.vendor_id = v.id
+        vendor_list v ON pi.vendor_id = v.id
     JOIN
-        storagerooms sr ON ph.storageroom_id = sr.id
+        storagerooms sr ON pi.storageroom_id = sr.id
     WHERE
-        ph.purchase_date = %s
-    GROUP BY
-        ph.invoice_number, ph.vendor_id, ph.storageroom_id
+        pi.purchase_date = %s
     ORDER BY
-        MIN(ph.created_at) ASC;
+        pi.created_at ASC;
     """
 
     cumulative_purchases = fetch_all(query, (date,))
     return cumulative_purchases
+
+
+# Rows per statement for multi-row INSERTs, well below max_allowed_packet
+MULTI_ROW_CHUNK_SIZE = 500
+
+
+def execute_values(cursor, query, rows, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Run `query` once per chunk of `rows`, with its {values} marker expanded into a
+    multi-row VALUES list, e.g. "INSERT INTO t (a, b) VALUES {values} ON DUPLICATE KEY UPDATE ...".
+    """
+    if not rows:
+        return
+    row_placeholder = "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        cursor.execute(query.replace("{values}", ", ".join([row_placeholder] * len(chunk))),
+                       [value for row in chunk for value in row])
+
+
+def record_inventory_movements(cursor, movements, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Append movements to the inventory_movements ledger and move every inventory snapshot of the
+    same location and material dated on or after each movement by the same amounts, so
+    point-in-time stock stays right for back-dated purchases and reversals.
+    """
+    execute_values(cursor, """
+        INSERT INTO inventory_movements
+            (movement_type, movement_date, destination_type, destination_id, raw_material_id, metric,
+             incoming, outgoing, total_cost, reference)
+        VALUES {values}
+    """, [
+        (movement["movement_type"], movement["movement_date"], movement["destination_type"],
+         movement["destination_id"], movement["raw_material_id"], movement["metric"],
+         round(movement.get("incoming", 0), 5), round(movement.get("outgoing", 0), 5),
+         round(movement["total_cost"], 2) if movement.get("total_cost") is not None else None,
+         str(movement["reference"])[:100] if movement.get("reference") is not None else None)
+        for movement in movements
+    ], chunk_size)
+
+    totals = {}
+    for movement in movements:
+        total = totals.setdefault((movement["destination_type"], movement["destination_id"],
+                                   movement["raw_material_id"], str(movement["movement_date"])), [0, 0])
+        total[0] += movement.get("incoming", 0)
+        total[1] += movement.get("outgoing", 0)
+    if totals:
+        cursor.executemany("""
+            UPDATE inventory_snapshots
+            SET incoming_stock = incoming_stock + %s, outgoing_stock = outgoing_stock + %s,
+                currently_available = currently_available + %s
+            WHERE destination_type = %s AND destination_id = %s AND raw_material_id = %s AND snapshot_date >= %s
+        """, [(round(incoming, 5), round(outgoing, 5), round(incoming - outgoing, 5), *key)
+              for key, (incoming, outgoing) in totals.items()])
+
+
+def apply_stock_movements(cursor, movements, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Apply signed stock deltas inside the caller's transaction. Movements are dicts with
+    movement_type, movement_date, destination_type, destination_id, raw_material_id, metric,
+    incoming and outgoing (currently_available moves by incoming - outgoing), plus total_cost when
+    the movement changes the stock's value (purchases and their reversals) and an optional reference.
+    Every movement is appended to inventory_movements and shifts the inventory_snapshots dated on or
+    after it. inventory_stock is the running balance of that ledger: movements of the same location
+    and material are added together, then applied per chunk with one multi-row upsert; missing rows
+    are created with the location's minimum stock.
+    """
+    record_inventory_movements(cursor, movements, chunk_size)
+
+    totals = {}
+    for movement in movements:
+        key = (movement["destination_type"], movement["destination_id"], movement["raw_material_id"])
+        total = totals.setdefault(key, {"metric": movement["metric"], "incoming": 0, "outgoing": 0, "total_cost": None})
+        total["incoming"] += movement.get("incoming", 0)
+        total["outgoing"] += movement.get("outgoing", 0)
+        if movement.get("total_cost") is not None:
+            total["total_cost"] = (total["total_cost"] or 0) + movement["total_cost"]
+
+    keys = list(totals)
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        keys_in = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        params = [value for key in chunk for value in key]
+
+        cursor.execute(f"""
+            SELECT type, destination_id, raw_material_id, min_quantity
+            FROM minimum_stock
+            WHERE (type, destination_id, raw_material_id) IN ({keys_in})
+        """, params)
+        min_quantities = {(row[0], row[1], row[2]): float(row[3]) for row in cursor.fetchall()}
+
+        # Average the cost in (or back out) while currently_available is still the stock before the movement
+        costed = [(key, totals[key]) for key in chunk if totals[key]["total_cost"] is not None]
+        if costed:
+            cursor.execute(f"""
+                UPDATE inventory_stock s
+                JOIN ({" UNION ALL ".join(["SELECT %s AS destination_type, %s AS destination_id, %s AS raw_material_id, "
+                                           "%s AS quantity, %s AS total_cost"] * len(costed))}) c
+                  ON s.destination_type = c.destination_type AND s.destination_id = c.destination_id
+                 AND s.raw_material_id = c.raw_material_id
+                SET s.average_unit_cost = IF(GREATEST(0, s.currently_available) + c.quantity > 0,
+                    GREATEST(0, (GREATEST(0, s.currently_available) * s.average_unit_cost + c.total_cost)
+                                / (GREATEST(0, s.currently_available) + c.quantity)),
+                    s.average_unit_cost)
+            """, [value for key, total in costed
+                  for value in (*key, round(total["incoming"] - total["outgoing"], 5), round(total["total_cost"], 2))])
+
+        rows = []
+        for key in chunk:
+            total = totals[key]
+            available = round(total["incoming"] - total["outgoing"], 5)
+            min_quantity = min_quantities.get(key, 0)
+            unit_cost = round(total["total_cost"] / available, 5) if total["total_cost"] is not None and available > 0 else 0
+            rows.append((*key, total["metric"], round(total["incoming"], 5), round(total["outgoing"], 5), available,
+                         min_quantity, max(0, min_quantity - float(available)), unit_cost))
+        execute_values(cursor, """
+            INSERT INTO inventory_stock
+                (destination_type, destination_id, raw_material_id, metric, incoming_stock, outgoing_stock,
+                 currently_available, minimum_quantity, quantity_needed, average_unit_cost)
+            VALUES {values}
+            ON DUPLICATE KEY UPDATE
+                incoming_stock = incoming_stock + VALUES(incoming_stock),
+                outgoing_stock = outgoing_stock + VALUES(outgoing_stock),
+                currently_available = currently_available + VALUES(currently_available),
+                minimum_quantity = VALUES(minimum_quantity),
+                quantity_needed = GREATEST(0, minimum_quantity - currently_available),
+                updated_at = CURRENT_TIMESTAMP
+        """, rows, chunk_size)
+
+
+def refresh_inventory_snapshots(through_date):
+    """
+    Rebuild the month-end inventory snapshots up to `through_date` from the inventory_movements
+    ledger, with the cumulative totals of every location and material taken by a window function.
+    Returns the number of snapshot rows written.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("DELETE FROM inventory_snapshots")
+        cursor.execute("""
+            INSERT INTO inventory_snapshots
+                (snapshot_date, destination_type, destination_id, raw_material_id, metric,
+                 incoming_stock, outgoing_stock, currently_available)
+            SELECT month_end, destination_type, destination_id, raw_material_id, metric,
+                   SUM(incoming) OVER stock_window, SUM(outgoing) OVER stock_window,
+                   SUM(incoming - outgoing) OVER stock_window
+            FROM (
+                SELECT LAST_DAY(movement_date) AS month_end, destination_type, destination_id, raw_material_id,
+                       MAX(metric) AS metric, SUM(incoming) AS incoming, SUM(outgoing) AS outgoing
+                FROM inventory_movements
+                WHERE movement_date <= %s
+                GROUP BY LAST_DAY(movement_date), destination_type, destination_id, raw_material_id
+            ) months
+            WHERE month_end <= %s
+            WINDOW stock_window AS (PARTITION BY destination_type, destination_id, raw_material_id ORDER BY month_end)
+        """, (through_date, through_date))
+        written = cursor.rowcount
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_inventory_ledger_start():
+    """Day of the opening movements the ledger was seeded with; stock before it cannot be replayed."""
+    row = fetch_one("SELECT MIN(movement_date) AS movement_date FROM inventory_movements WHERE movement_type = 'opening'")
+    return row["movement_date"] if row else None
+
+
+def get_stock_as_of(destination_type, destination_id, as_of):
+    """
+    Stock of every raw material at a location at the end of `as_of`: each material's latest
+    snapshot on or before that day plus the ledger movements between the snapshot and the day.
+    Only meaningful from get_inventory_ledger_start() on; earlier days would replay back-dated
+    movements without the balance that preceded them.
+    """
+    query = """
+    WITH latest AS (
+        SELECT raw_material_id, MAX(snapshot_date) AS snapshot_date
+        FROM inventory_snapshots
+        WHERE destination_type = %s AND destination_id = %s AND snapshot_date <= %s
+        GROUP BY raw_material_id
+    )
+    SELECT
+        rm.id AS raw_material_id, rm.name AS raw_material_name, rm.category, MAX(stock.metric) AS metric,
+        ROUND(SUM(stock.incoming), 5) AS incoming_stock, ROUND(SUM(stock.outgoing), 5) AS outgoing_stock,
+        ROUND(SUM(stock.available), 5) AS currently_available
+    FROM (
+        SELECT s.raw_material_id, s.metric, s.incoming_stock AS incoming, s.outgoing_stock AS outgoing,
+               s.currently_available AS available
+        FROM inventory_snapshots s
+        JOIN latest ON latest.raw_material_id = s.raw_material_id AND latest.snapshot_date = s.snapshot_date
+        WHERE s.destination_type = %s AND s.destination_id = %s
+        UNION ALL
+        SELECT im.raw_material_id, im.metric, im.incoming, im.outgoing, im.incoming - im.outgoing
+        FROM inventory_movements im
+        LEFT JOIN latest ON latest.raw_material_id = im.raw_material_id
+        WHERE im.destination_type = %s AND im.destination_id = %s AND im.movement_date <= %s
+          AND im.movement_date > COALESCE(latest.snapshot_date, '1000-01-01')
+    ) stock
+    JOIN raw_materials rm ON rm.id = stock.raw_material_id
+    GROUP BY rm.id, rm.name, rm.category
+    ORDER BY rm.category, rm.name
+    """
+    return fetch_all(query, (destination_type, destination_id, as_of, destination_type, destination_id,
+                             destination_type, destination_id, as_of))
+
+
+def get_inventory_ledger_drift():
+    """
+    Locations and materials whose inventory_stock balance no longer equals the sum of their
+    inventory_movements, i.e. stock changed by something that bypassed apply_stock_movements.
+    """
+    query = """
+    SELECT
+        s.destination_type, s.destination_id, s.raw_material_id,
+        s.currently_available AS stock_balance, COALESCE(l.available, 0) AS ledger_balance
+    FROM inventory_stock s
+    LEFT JOIN (
+        SELECT destination_type, destination_id, raw_material_id, SUM(incoming - outgoing) AS available
+        FROM inventory_movements
+        GROUP BY destination_type, destination_id, raw_material_id
+    ) l ON l.destination_type = s.destination_type AND l.destination_id = s.destination_id
+       AND l.raw_material_id = s.raw_material_id
+    WHERE ABS(s.currently_available - COALESCE(l.available, 0)) > 0.00001
+    ORDER BY s.destination_type, s.destination_id, s.raw_material_id
+    """
+    return fetch_all(query)
+
+
+def refresh_purchase_invoices(cursor, invoice_keys, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Recompute the purchase_invoices headers of the given (vendor_id, invoice_number, purchase_date)
+    invoices from their purchase_history lines, inside the caller's transaction. Headers whose
+    lines are all gone are removed.
+    """
+    for start in range(0, len(invoice_keys), chunk_size):
+        chunk = invoice_keys[start:start + chunk_size]
+        keys_in = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        params = [value for key in chunk for value in key]
+        cursor.execute(f"""
+            DELETE pi FROM purchase_invoices pi
+            LEFT JOIN purchase_history ph
+                ON ph.vendor_id = pi.vendor_id AND ph.invoice_number = pi.invoice_number
+               AND ph.purchase_date = pi.purchase_date AND ph.storageroom_id = pi.storageroom_id
+            WHERE (pi.vendor_id, pi.invoice_number, pi.purchase_date) IN ({keys_in}) AND ph.id IS NULL
+        """, params)
+        cursor.execute(f"""
+            INSERT INTO purchase_invoices (vendor_id, invoice_number, purchase_date, storageroom_id, total_cost, line_count)
+            SELECT vendor_id, invoice_number, purchase_date, storageroom_id, SUM(total_cost), COUNT(*)
+            FROM purchase_history
+            WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+            GROUP BY vendor_id, invoice_number, purchase_date, storageroom_id
+            ON DUPLICATE KEY UPDATE total_cost = VALUES(total_cost), line_count = VALUES(line_count)
+        """, params)
+
+
+def adjust_vendor_balance_checkpoints(cursor, movements):
+    """
+    Keep vendor_balance_checkpoints in step with a purchase or payment written inside the caller's
+    transaction. Movements are (vendor_id, entry_date, credit, debit); every checkpoint of the vendor
+    on or after the entry date moves by the same amounts. Reversals pass negative amounts.
+    """
+    totals = {}
+    for vendor_id, entry_date, credit, debit in movements:
+        total = totals.setdefault((vendor_id, str(entry_date)), [0, 0])
+        total[0] += credit
+        total[1] += debit
+    if totals:
+        cursor.executemany("""
+            UPDATE vendor_balance_checkpoints
+            SET total_credit = total_credit + %s, total_debit = total_debit + %s
+            WHERE vendor_id = %s AND checkpoint_date >= %s
+        """, [(credit, debit, vendor_id, entry_date) for (vendor_id, entry_date), (credit, debit) in totals.items()])
+
+
+def refresh_vendor_balance_checkpoints(through_date):
+    """
+    Rebuild the month-end balance checkpoints of every vendor up to `through_date` from
+    purchase_invoices and payment_records, with the cumulative totals taken by a window function.
+    Returns the number of checkpoints written.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("DELETE FROM vendor_balance_checkpoints")
+        cursor.execute("""
+            INSERT INTO vendor_balance_checkpoints (vendor_id, checkpoint_date, total_credit, total_debit)
+            SELECT vendor_id, month_end,
+                   SUM(credit) OVER (PARTITION BY vendor_id ORDER BY month_end),
+                   SUM(debit) OVER (PARTITION BY vendor_id ORDER BY month_end)
+            FROM (
+                SELECT vendor_id, LAST_DAY(entry_date) AS month_end, SUM(credit) AS credit, SUM(debit) AS debit
+                FROM (
+                    SELECT vendor_id, purchase_date AS entry_date, total_cost AS credit, 0 AS debit
+                    FROM purchase_invoices WHERE purchase_date <= %s
+                    UNION ALL
+                    SELECT vendor_id, paid_on, 0, amount_paid
+                    FROM payment_records WHERE paid_on <= %s
+                ) entries
+                GROUP BY vendor_id, LAST_DAY(entry_date)
+            ) months
+            WHERE month_end <= %s
+        """, (through_date, through_date, through_date))
+        written = cursor.rowcount
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def ageing_bucket(days):
+    # Column of vendor_ageing_summary holding dues of this age
+    if days <= 30:
+        return "due_0_30"
+    if days <= 60:
+        return "due_31_60"
+    if days <= 90:
+        return "due_61_90"
+    return "due_over_90"
+
+
+def adjust_vendor_ageing(cursor, movements):
+    """
+    Move dues in vendor_ageing_summary inside the caller's transaction. Movements are
+    (vendor_id, purchase_date, amount) with payments and reversals negative. Existing rows are
+    bucketed by their own as_of date, so changes land where the last nightly roll put that invoice.
+    """
+    totals = {}
+    for vendor_id, purchase_date, amount in movements:
+        key = (vendor_id, str(purchase_date))
+        totals[key] = totals.get(key, 0) + amount
+    if not totals:
+        return
+
+    as_of = datetime.strptime(get_current_date(), '%Y-%m-%d').date()
+    rows = []
+    for (vendor_id, purchase_date), amount in totals.items():
+        bucket = ageing_bucket((as_of - datetime.strptime(purchase_date, '%Y-%m-%d').date()).days)
+        buckets = [amount if column == bucket else 0 for column in ("due_0_30", "due_31_60", "due_61_90", "due_over_90")]
+        rows.append((vendor_id, as_of, *buckets, amount, *((purchase_date, amount) * 4), amount))
+    cursor.executemany("""
+        INSERT INTO vendor_ageing_summary (vendor_id, as_of, due_0_30, due_31_60, due_61_90, due_over_90, total_due)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            due_0_30 = due_0_30 + IF(DATEDIFF(as_of, %s) <= 30, %s, 0),
+            due_31_60 = due_31_60 + IF(DATEDIFF(as_of, %s) BETWEEN 31 AND 60, %s, 0),
+            due_61_90 = due_61_90 + IF(DATEDIFF(as_of, %s) BETWEEN 61 AND 90, %s, 0),
+            due_over_90 = due_over_90 + IF(DATEDIFF(as_of, %s) > 90, %s, 0),
+            total_due = total_due + %s
+    """, rows)
+
+
+def roll_vendor_ageing(as_of):
+    """
+    Rebuild vendor_ageing_summary from the open vendor_payment_tracker rows, bucketed by age on
+    `as_of`. Run nightly so dues move into older buckets as days pass. Returns the vendor count.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("DELETE FROM vendor_ageing_summary")
+        cursor.execute("""
+            INSERT INTO vendor_ageing_summary (vendor_id, as_of, due_0_30, due_31_60, due_61_90, due_over_90, total_due)
+            SELECT vendor_id, %s,
+                   SUM(IF(DATEDIFF(%s, purchase_date) <= 30, total_due, 0)),
+                   SUM(IF(DATEDIFF(%s, purchase_date) BETWEEN 31 AND 60, total_due, 0)),
+                   SUM(IF(DATEDIFF(%s, purchase_date) BETWEEN 61 AND 90, total_due, 0)),
+                   SUM(IF(DATEDIFF(%s, purchase_date) > 90, total_due, 0)),
+                   SUM(total_due)
+            FROM vendor_payment_tracker
+            WHERE is_open = 1
+            GROUP BY vendor_id
+        """, (as_of,) * 5)
+        rolled = cursor.rowcount
+        conn.commit()
+        return rolled
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_vendor_ageing():
+    query = """
+    SELECT
+        vl.id AS vendor_id,
+        vl.vendor_name,
+        vas.as_of,
+        vas.due_0_30,
+        vas.due_31_60,
+        vas.due_61_90,
+        vas.due_over_90,
+        vas.total_due
+    FROM
+        vendor_ageing_summary AS vas
+    JOIN
+        vendor_list AS vl ON vas.vendor_id = vl.id
+    WHERE
+        vas.total_due != 0
+    ORDER BY
+        vas.due_over_90 DESC, vas.total_due DESC;
+    """
+    return fetch_all(query)
+
+
+# Ledger lines per page of /get_invoice_data
+VENDOR_LEDGER_PAGE_SIZE = 200
+
+
+def parse_vendor_ledger_cursor(cursor):
+    """
+    Split a vendor ledger `next_cursor` ("YYYY-MM-DD:<kind>:<id>:<movement>") into the keyset of the
+    last entry shown and the running movement since `from_date` up to it. Returns None if malformed.
+    """
+    keyset, _, movement = cursor.rpartition(":") if isinstance(cursor, str) else ("", "", "")
+    keyset = parse_page_cursor(keyset, 2)
+    try:
+        movement = Decimal(movement)
+    except ArithmeticError:
+        return None
+    if keyset is None or not movement.is_finite():
+        return None
+    return (*keyset, movement)
+
+
+def get_vendor_ledger(vendor_id, from_date, to_date, after=None, limit=VENDOR_LEDGER_PAGE_SIZE):
+    """
+    One page of a vendor's ledger between two dates: purchases (one line per invoice) as credits
+    and payments as debits, ordered by date with purchases before payments on the same day.
+    The opening balance starts from the vendor's last balance checkpoint before `from_date` plus
+    the entries since. Each side of the UNION reads at most a page past the cursor through its
+    (vendor_id, date) index, and the running balance continues from the movement carried in the
+    cursor. `after` is the `next_cursor` of the previous page; see parse_vendor_ledger_cursor.
+    """
+    opening = fetch_one("""
+    SELECT checkpoint_date, total_credit, total_debit
+    FROM vendor_balance_checkpoints
+    WHERE vendor_id = %s AND checkpoint_date < %s
+    ORDER BY checkpoint_date DESC
+    LIMIT 1
+    """, (vendor_id, from_date)) or {"checkpoint_date": "1000-01-01", "total_credit": 0, "total_debit": 0}
+
+    totals = fetch_one("""
+    SELECT
+        (SELECT COALESCE(SUM(total_cost), 0) FROM purchase_invoices
+         WHERE vendor_id = %s AND purchase_date > %s AND purchase_date < %s) AS credit_before,
+        (SELECT COALESCE(SUM(amount_paid), 0) FROM payment_records
+         WHERE vendor_id = %s AND paid_on > %s AND paid_on < %s) AS debit_before,
+        (SELECT COALESCE(SUM(total_cost), 0) FROM purchase_invoices
+         WHERE vendor_id = %s AND purchase_date BETWEEN %s AND %s) AS total_credit,
+        (SELECT COALESCE(SUM(amount_paid), 0) FROM payment_records
+         WHERE vendor_id = %s AND paid_on BETWEEN %s AND %s) AS total_debit
+    """, (vendor_id, opening["checkpoint_date"], from_date, vendor_id, opening["checkpoint_date"], from_date,
+          vendor_id, from_date, to_date, vendor_id, from_date, to_date))
+    opening_balance = (opening["total_credit"] - opening["total_debit"]
+                       + totals["credit_before"] - totals["debit_before"])
+
+    # The cursor also carries the running movement at the end of the previous page, so a page reads
+    # only its own rows instead of re-summing everything before it
+    after_date, after_kind, after_id, movement = parse_vendor_ledger_cursor(after) or ("1000-01-01", 0, 0, Decimal(0))
+    keyset = "{date} >= %s AND ({date} > %s OR {kind} > %s OR ({kind} = %s AND id > %s))"
+    keyset_params = (after_date, after_date, after_kind, after_kind, after_id)
+    entries = fetch_all(f"""
+    SELECT entry_date, entry_kind, entry_id, type, sr_no, payment_mode, credit, debit
+    FROM (
+        (SELECT purchase_date AS entry_date, 0 AS entry_kind, id AS entry_id, invoice_number AS type,
+                invoice_number AS sr_no, '-' AS payment_mode, total_cost AS credit, 0.00 AS debit
+         FROM purchase_invoices
+         WHERE vendor_id = %s AND purchase_date BETWEEN %s AND %s AND {keyset.format(date="purchase_date", kind="0")}
+         ORDER BY purchase_date, id
+         LIMIT %s)
+        UNION ALL
+        (SELECT paid_on, 1, id, 'Payment Out', invoice_number, mode_of_payment, 0.00, amount_paid
+         FROM payment_records
+         WHERE vendor_id = %s AND paid_on BETWEEN %s AND %s AND {keyset.format(date="paid_on", kind="1")}
+         ORDER BY paid_on, id
+         LIMIT %s)
+    ) entries
+    ORDER BY entry_date, entry_kind, entry_id
+    LIMIT %s
+    """, (vendor_id, from_date, to_date, *keyset_params, limit + 1,
+          vendor_id, from_date, to_date, *keyset_params, limit + 1, limit + 1))
+
+    has_more = len(entries) > limit
+    transactions = []
+    for entry in entries[:limit]:
+        movement += entry["credit"] - entry["debit"]
+        transactions.append({
+            "date": entry["entry_date"].strftime('%Y-%m-%d'),
+            "type": entry["type"],
+            "sr_no": entry["sr_no"],
+            "payment_mode": entry["payment_mode"],
+            "credit": entry["credit"],
+            "debit": entry["debit"],
+            "balance": opening_balance + movement
+        })
+
+    next_cursor = None
+    if has_more:
+        last = entries[limit - 1]
+        next_cursor = f"{last['entry_date']}:{last['entry_kind']}:{last['entry_id']}:{movement}"
+
+    return {
+        "opening_balance": opening_balance,
+        "closing_balance": opening_balance + totals["total_credit"] - totals["total_debit"],
+        "total_credit": totals["total_credit"],
+        "total_debit": totals["total_debit"],
+        "transactions": transactions,
+        "next_cursor": next_cursor
+    }
+
+
+def invoice_exists(vendor_id, invoice_number, purchase_date):
+    query = """
+    SELECT 1 FROM purchase_invoices
+    WHERE vendor_id = %s AND invoice_number = %s AND purchase_date = %s
+    LIMIT 1
+    """
+    return fetch_one(query, (vendor_id, invoice_number, purchase_date)) is not None
+
+
+def get_recorded_invoices(vendor_ids, from_date, to_date):
+    # Invoices already recorded for the vendors in the date range, to reject re-imported ones in one query
+    if not vendor_ids:
+        return []
+    placeholders = ",".join(["%s"] * len(vendor_ids))
+    query = f"""
+    SELECT vendor_id, invoice_number, purchase_date
+    FROM purchase_invoices
+    WHERE vendor_id IN ({placeholders}) AND purchase_date BETWEEN %s AND %s
+    """
+    return fetch_all(query, (*vendor_ids, from_date, to_date))
+
+
+def save_purchase_lines(lines, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Record purchase lines in a single transaction: purchase_history, vendor_payment_tracker (one
+    row per invoice) and the storage room's inventory_stock, each with chunked multi-row upserts.
+    Lines carry vendor_id, invoice_number, purchase_date, storageroom_id, raw_material_id,
+    raw_material_name, quantity, metric (already kg / liter / unit) and total_cost. Repeated
+    materials on an invoice are added together, as add_purchase does. Rolls back and re-raises on error.
+    """
+    purchases = {}
+    invoice_totals = {}
+    for line in lines:
+        purchase_key = (line["vendor_id"], line["invoice_number"], line["raw_material_id"],
+                        line["purchase_date"], line["storageroom_id"])
+        purchase = purchases.setdefault(purchase_key, dict(line, quantity=0, total_cost=0))
+        purchase["quantity"] += line["quantity"]
+        purchase["total_cost"] += line["total_cost"]
+
+        invoice_key = (line["vendor_id"], line["invoice_number"], line["purchase_date"])
+        invoice_totals[invoice_key] = invoice_totals.get(invoice_key, 0) + line["total_cost"]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        execute_values(cursor, """
+            INSERT INTO purchase_history
+            (vendor_id, invoice_number, raw_material_id, raw_material_name,
+             quantity, metric, total_cost, purchase_date, storageroom_id)
+            VALUES {values}
+            ON DUPLICATE KEY UPDATE
+                quantity = quantity + VALUES(quantity),
+                total_cost = total_cost + VALUES(total_cost)
+        """, [
+            (p["vendor_id"], p["invoice_number"], p["raw_material_id"], p["raw_material_name"],
+             round(p["quantity"], 5), p["metric"], round(p["total_cost"], 2), p["purchase_date"], p["storageroom_id"])
+            for p in purchases.values()
+        ], chunk_size)
+
+        execute_values(cursor, """
+            INSERT INTO vendor_payment_tracker (vendor_id, invoice_number, purchase_date, outstanding_cost)
+            VALUES {values}
+            ON DUPLICATE KEY UPDATE outstanding_cost = outstanding_cost + VALUES(outstanding_cost)
+        """, [
+            (vendor_id, invoice_number, purchase_date, round(total, 2))
+            for (vendor_id, invoice_number, purchase_date), total in invoice_totals.items()
+        ], chunk_size)
+
+        apply_stock_movements(cursor, [
+            {"movement_type": "purchase", "movement_date": line["purchase_date"], "reference": line["invoice_number"],
+             "destination_type": "storageroom", "destination_id": line["storageroom_id"],
+             "raw_material_id": line["raw_material_id"], "metric": line["metric"],
+             "incoming": line["quantity"], "total_cost": line["total_cost"]}
+            for line in lines
+        ], chunk_size)
+
+        refresh_purchase_invoices(cursor, list(invoice_totals), chunk_size)
+        adjust_vendor_balance_checkpoints(cursor, [
+            (vendor_id, purchase_date, round(total, 2), 0)
+            for (vendor_id, invoice_number, purchase_date), total in invoice_totals.items()
+        ])
+        adjust_vendor_ageing(cursor, [
+            (vendor_id, purchase_date, round(total, 2))
+            for (vendor_id, invoice_number, purchase_date), total in invoice_totals.items()
+        ])
+
+        conn.commit()
+        return {"lines": len(lines), "invoices": len(invoice_totals), "purchases": len(purchases)}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def recompute_average_unit_costs(batch_size=5000):
+    """
+    Rebuild the average unit cost of every storage room stock row by replaying its purchases and
+    outgoing transfers in time order: a purchase averages its cost in with the stock on hand,
+    a transfer only lowers the quantity. The history is streamed in batches and the costs written
+    back with multi-row upserts. Returns the number of stock rows updated.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT storageroom_id, raw_material_id, quantity, total_cost, purchase_date AS entry_date, created_at AS entry_time
+            FROM purchase_history
+            UNION ALL
+            SELECT source_storage_room_id, raw_material_id, -quantity, NULL, transferred_date, transfer_time
+            FROM raw_material_transfer_details
+            ORDER BY storageroom_id, raw_material_id, entry_date, entry_time
+        """)
+        costs = {}
+        on_hand = {}
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for storageroom_id, raw_material_id, quantity, total_cost, _, _ in rows:
+                key = (storageroom_id, raw_material_id)
+                available = on_hand.get(key, Decimal(0))
+                if total_cost is not None and available + quantity > 0:
+                    costs[key] = (available * costs.get(key, Decimal(0)) + total_cost) / (available + quantity)
+                on_hand[key] = max(Decimal(0), available + quantity)
+
+        cursor.execute("SELECT destination_id, raw_material_id FROM inventory_stock WHERE destination_type = 'storageroom'")
+        stock_keys = set(cursor.fetchall())
+        rows = [(stock_id, raw_material_id, round(cost, 5))
+                for (stock_id, raw_material_id), cost in costs.items() if (stock_id, raw_material_id) in stock_keys]
+        for start in range(0, len(rows), MULTI_ROW_CHUNK_SIZE):
+            chunk = rows[start:start + MULTI_ROW_CHUNK_SIZE]
+            cursor.execute(f"""
+                UPDATE inventory_stock s
+                JOIN ({" UNION ALL ".join(["SELECT %s AS destination_id, %s AS raw_material_id, %s AS average_unit_cost"] * len(chunk))}) c
+                  ON s.destination_type = 'storageroom' AND s.destination_id = c.destination_id
+                 AND s.raw_material_id = c.raw_material_id
+                SET s.average_unit_cost = c.average_unit_cost
+            """, [value for row in chunk for value in row])
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def find_purchase_invoice_keys(invoice_ids=None, from_date=None, to_date=None):
+    """
+    (vendor_id, invoice_number, purchase_date) of the invoices picked by purchase_invoices ids or by
+    a purchase date range. An invoice split across storage rooms is picked whole.
+    """
+    if invoice_ids:
+        placeholders = ",".join(["%s"] * len(invoice_ids))
+        rows = fetch_all(f"""
+        SELECT DISTINCT vendor_id, invoice_number, purchase_date
+        FROM purchase_invoices
+        WHERE id IN ({placeholders})
+        """, tuple(invoice_ids))
+    elif from_date and to_date:
+        rows = fetch_all("""
+        SELECT DISTINCT vendor_id, invoice_number, purchase_date
+        FROM purchase_invoices
+        WHERE purchase_date BETWEEN %s AND %s
+        """, (from_date, to_date))
+    else:
+        return []
+    return [(row["vendor_id"], row["invoice_number"], str(row["purchase_date"])) for row in rows]
+
+
+def reverse_purchase_invoices(invoice_keys, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Undo whole purchase invoices, given as (vendor_id, invoice_number, purchase_date), in one
+    transaction: their stock comes back out of the storage rooms through apply_stock_movements,
+    the balance checkpoints and ageing summary are moved back, and the purchase lines, invoice
+    headers, payment tracker rows and payments are deleted chunk by chunk.
+    Returns {"invoices", "lines"}; rolls back and re-raises on error.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        reversed_invoices = 0
+        reversed_lines = 0
+        for start in range(0, len(invoice_keys), chunk_size):
+            chunk = invoice_keys[start:start + chunk_size]
+            keys_in = ", ".join(["(%s, %s, %s)"] * len(chunk))
+            params = [value for key in chunk for value in key]
+
+            cursor.execute(f"""
+                SELECT vendor_id, invoice_number, purchase_date FROM purchase_history
+                WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+                FOR UPDATE
+            """, params)
+            lines = cursor.fetchall()
+            reversed_lines += len(lines)
+            reversed_invoices += len(set(lines))
+
+            cursor.execute(f"""
+                SELECT purchase_date, invoice_number, storageroom_id, raw_material_id, metric, SUM(quantity), SUM(total_cost)
+                FROM purchase_history
+                WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+                GROUP BY purchase_date, invoice_number, storageroom_id, raw_material_id, metric
+            """, params)
+            apply_stock_movements(cursor, [
+                {"movement_type": "purchase_reversal", "movement_date": purchase_date, "reference": invoice_number,
+                 "destination_type": "storageroom", "destination_id": storageroom_id, "raw_material_id": raw_material_id,
+                 "metric": metric, "incoming": -quantity, "total_cost": -total_cost}
+                for purchase_date, invoice_number, storageroom_id, raw_material_id, metric, quantity, total_cost
+                in cursor.fetchall()
+            ], chunk_size)
+
+            cursor.execute(f"""
+                SELECT vendor_id, purchase_date, -SUM(total_cost), 0 FROM purchase_invoices
+                WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+                GROUP BY vendor_id, purchase_date
+                UNION ALL
+                SELECT vendor_id, paid_on, 0, -SUM(amount_paid) FROM payment_records
+                WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+                GROUP BY vendor_id, paid_on
+            """, params + params)
+            adjust_vendor_balance_checkpoints(cursor, cursor.fetchall())
+
+            cursor.execute(f"""
+                SELECT vendor_id, purchase_date, -total_due FROM vendor_payment_tracker
+                WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+                FOR UPDATE
+            """, params)
+            adjust_vendor_ageing(cursor, cursor.fetchall())
+
+            for table in ("purchase_history", "purchase_invoices", "vendor_payment_tracker", "payment_records"):
+                cursor.execute(f"""
+                    DELETE FROM {table}
+                    WHERE (vendor_id, invoice_number, purchase_date) IN ({keys_in})
+                """, params)
+
+        conn.commit()
+        return {"invoices": reversed_invoices, "lines": reversed_lines}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def apply_vendor_payments(cursor, vendor_id, payments, chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Post payments inside the caller's transaction: total_paid on vendor_payment_tracker and one
+    payment_records row each, both as multi-row statements. Payments carry invoice_number,
+    purchase_date, amount, mode_of_payment, paid_on and optionally a bank reference.
+    """
+    execute_values(cursor, """
+        INSERT INTO vendor_payment_tracker (vendor_id, invoice_number, purchase_date, total_paid)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE total_paid = total_paid + VALUES(total_paid)
+    """, [(vendor_id, p["invoice_number"], p["purchase_date"], p["amount"]) for p in payments], chunk_size)
+    execute_values(cursor, """
+        INSERT INTO payment_records (vendor_id, invoice_number, purchase_date, amount_paid, mode_of_payment, paid_on, reference)
+        VALUES {values}
+    """, [(vendor_id, p["invoice_number"], p["purchase_date"], p["amount"], p["mode_of_payment"], p["paid_on"],
+           p.get("reference")) for p in payments], chunk_size)
+    adjust_vendor_balance_checkpoints(cursor, [(vendor_id, p["paid_on"], 0, p["amount"]) for p in payments])
+    adjust_vendor_ageing(cursor, [(vendor_id, p["purchase_date"], -p["amount"]) for p in payments])
+
+
+def record_vendor_payments(vendor_id, payments):
+    # Payments split per invoice by the user, posted all-or-nothing
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        apply_vendor_payments(cursor, vendor_id, payments)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def allocate_vendor_payment(vendor_id, amount, mode_of_payment, paid_on, strategy="fifo", dry_run=False):
+    """
+    Settle a lump-sum payment against the vendor's open invoices in `strategy` order (see
+    payment_allocation.ALLOCATION_STRATEGIES). The open rows are locked with SELECT ... FOR UPDATE,
+    so concurrent payments to the same vendor are allocated one after the other. Raises ValueError
+    if the amount is more than the vendor owes. With dry_run nothing is written.
+    Returns the allocations.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        cursor.execute("""
+            SELECT id, invoice_number, purchase_date, total_due
+            FROM vendor_payment_tracker
+            WHERE vendor_id = %s AND is_open = 1 AND total_due > 0
+            ORDER BY purchase_date, id
+            FOR UPDATE
+        """, (vendor_id,))
+        open_items = cursor.fetchall()
+
+        allocations, unallocated = allocate_payment(open_items, amount, strategy)
+        if unallocated > 0:
+            total_due = sum((to_money(item["total_due"]) for item in open_items), to_money(0))
+            raise ValueError(f"Amount is more than the total due of Rs. {total_due}")
+
+        if dry_run:
+            conn.rollback()
+            return allocations
+
+        apply_vendor_payments(cursor, vendor_id, [
+            dict(allocation, mode_of_payment=mode_of_payment, paid_on=paid_on) for allocation in allocations
+        ])
+        conn.commit()
+        return allocations
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_open_vendor_payments():
+    query = """
+    SELECT id, vendor_id, invoice_number, purchase_date, total_due
+    FROM vendor_payment_tracker
+    WHERE is_open = 1 AND total_due > 0
+    """
+    return fetch_all(query)
+
+
+def save_pending_bank_statement(token, filename, content):
+    query = 'INSERT INTO pending_bank_statements (token, filename, content) VALUES (%s, %s, %s)'
+    return execute_query(query, (token, filename, content))
+
+
+def get_pending_bank_statement(token, expiry_hours):
+    # A statement previewed more than `expiry_hours` ago has to be uploaded again
+    query = """
+    SELECT content FROM pending_bank_statements
+    WHERE token = %s AND created_at >= NOW() - INTERVAL %s HOUR
+    """
+    row = fetch_one(query, (token, expiry_hours))
+    return bytes(row["content"]) if row else None
+
+
+def delete_pending_bank_statement(token):
+    query = 'DELETE FROM pending_bank_statements WHERE token = %s'
+    return execute_query(query, (token,))
+
+
+def delete_expired_pending_bank_statements(expiry_hours):
+    # Statements that were previewed but never posted
+    query = 'DELETE FROM pending_bank_statements WHERE created_at < NOW() - INTERVAL %s HOUR'
+    return execute_query(query, (expiry_hours,))
+
+
+def get_posted_payment_references(references):
+    # (vendor_id, reference) pairs already posted, for the given bank statement references
+    if not references:
+        return set()
+    placeholders = ",".join(["%s"] * len(references))
+    query = f"SELECT DISTINCT vendor_id, reference FROM payment_records WHERE reference IN ({placeholders})"
+    return {(row["vendor_id"], row["reference"]) for row in fetch_all(query, tuple(references))}
+
+
+def post_vendor_payment_batch(payments_by_vendor):
+    """
+    Post matched payments for many vendors in one transaction through apply_vendor_payments.
+    The vendors' open rows are locked first and every amount is checked against the current due,
+    so a payment recorded since the statement was matched makes the whole batch fail instead of overpaying.
+    """
+    vendor_ids = sorted(payments_by_vendor)
+    if not vendor_ids:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        placeholders = ",".join(["%s"] * len(vendor_ids))
+        cursor.execute(f"""
+            SELECT vendor_id, invoice_number, purchase_date, total_due
+            FROM vendor_payment_tracker
+            WHERE vendor_id IN ({placeholders}) AND is_open = 1 AND total_due > 0
+            FOR UPDATE
+        """, tuple(vendor_ids))
+        dues = {(row["vendor_id"], row["invoice_number"].lower(), str(row["purchase_date"])): row["total_due"]
+                for row in cursor.fetchall()}
+
+        for vendor_id in vendor_ids:
+            for payment in payments_by_vendor[vendor_id]:
+                key = (vendor_id, payment["invoice_number"].lower(), str(payment["purchase_date"]))
+                if dues.get(key, 0) < payment["amount"]:
+                    raise ValueError(f"Invoice {payment['invoice_number']} no longer has Rs. {payment['amount']} due")
+                dues[key] -= payment["amount"]
+
+        for vendor_id in vendor_ids:
+            apply_vendor_payments(cursor, vendor_id, payments_by_vendor[vendor_id])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+
+def allocate_transfer_ids(cursor, source_storeroom_id, transfer_date, count=1):
+    """
+    Reserve `count` consecutive transfer ids for a storage room and day inside the caller's
+    transaction. The sequence row is bumped with the LAST_INSERT_ID(expr) trick, so concurrent
+    transfers queue on that row and never get the same id. Returns the first id.
+    """
+    cursor.execute("""
+        INSERT INTO raw_material_transfer_sequences (source_storage_room_id, transferred_date, last_transfer_id)
+        VALUES (%s, %s, LAST_INSERT_ID(%s))
+        ON DUPLICATE KEY UPDATE last_transfer_id = LAST_INSERT_ID(last_transfer_id + %s)
+    """, (source_storeroom_id, transfer_date, count, count))
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    return cursor.fetchone()[0] - count + 1
+
+
+def save_transfer_headers(cursor, source_storeroom_id, transfer_date, transfer_time, transfer_ids,
+                          chunk_size=MULTI_ROW_CHUNK_SIZE):
+    # transfer_ids maps (destination_type, destination_id) to the transfer id sent there
+    execute_values(cursor, """
+        INSERT INTO raw_material_transfers
+            (source_storage_room_id, transferred_date, transfer_id, destination_type, destination_id, transfer_time)
+        VALUES {values}
+    """, [(source_storeroom_id, transfer_date, transfer_id, destination_type, destination_id, transfer_time)
+          for (destination_type, destination_id), transfer_id in transfer_ids.items()], chunk_size)
+
+
+def get_transfer_ids(source_storeroom_id, destination_type, destination_id, transfer_date):
+    query = """
+    SELECT transfer_id FROM raw_material_transfers
+    WHERE source_storage_room_id = %s
+    AND destination_type = %s
+    AND destination_id = %s
+    AND transferred_date = %s
+    ORDER BY transfer_id ASC
+    """
+    return [row["transfer_id"] for row in fetch_all(query, (source_storeroom_id, destination_type, destination_id, transfer_date))]
+
+
+def get_transfer_manifest_lines(source_storeroom_id, transfer_date, transfer_id=None):
+    """
+    Material lines of one transfer, or of every transfer a storage room made on a day, ordered by
+    transfer id with each line carrying its transfer's header fields.
+    """
+    query = """
+    SELECT
+        rt.transfer_id,
+        sr.storageroomname AS transferred_from,
+        rt.destination_type,
+        CASE
+            WHEN rt.destination_type = 'kitchen' THEN k.kitchenname
+            WHEN rt.destination_type = 'restaurant' THEN r.restaurantname
+            ELSE 'Unknown'
+        END AS transferred_to,
+        DATE_FORMAT(rt.transferred_date, '%d-%m-%Y') AS transferred_date,
+        DATE_FORMAT(rt.transfer_time, '%I:%i %p') AS transfer_time,
+        rm.name AS raw_material_name,
+        rm.category,
+        rmt.quantity,
+        rmt.metric
+    FROM raw_material_transfers rt
+    JOIN raw_material_transfer_details rmt
+        ON rmt.source_storage_room_id = rt.source_storage_room_id AND rmt.destination_type = rt.destination_type
+       AND rmt.destination_id = rt.destination_id AND rmt.transferred_date = rt.transferred_date
+       AND rmt.transfer_id = rt.transfer_id
+    JOIN raw_materials rm ON rmt.raw_material_id = rm.id
+    JOIN storagerooms sr ON rt.source_storage_room_id = sr.id
+    LEFT JOIN kitchen k ON rt.destination_type = 'kitchen' AND rt.destination_id = k.id
+    LEFT JOIN restaurant r ON rt.destination_type = 'restaurant' AND rt.destination_id = r.id
+    WHERE rt.source_storage_room_id = %s AND rt.transferred_date = %s
+    """
+    params = [source_storeroom_id, transfer_date]
+    if transfer_id:
+        query += " AND rt.transfer_id = %s"
+        params.append(transfer_id)
+    query += " ORDER BY rt.transfer_id, rm.name"
+    return fetch_all(query, params)
+
+
+def save_bulk_raw_material_transfer(source_storeroom_id, transfer_date, transfer_time, lines,
+                                    chunk_size=MULTI_ROW_CHUNK_SIZE):
+    """
+    Transfer raw materials from one storage room to many kitchens and restaurants in one transaction.
+    Lines carry destination_type, destination_id, raw_material_id, quantity and metric (the raw
+    material's own metric). The storage room stock of every material is checked in one locking
+    query; each destination gets its own transfer id. Stock is debited and credited together through
+    apply_stock_movements. Raises ValueError listing the materials that are short.
+    Returns {destination: transfer_id} keyed by (destination_type, destination_id).
+    """
+    requested = {}
+    credits = {}
+    for line in lines:
+        requested[line["raw_material_id"]] = requested.get(line["raw_material_id"], 0) + line["quantity"]
+        credit_key = (line["destination_type"], line["destination_id"], line["raw_material_id"])
+        credit = credits.setdefault(credit_key, {"metric": line["metric"], "quantity": 0})
+        credit["quantity"] += line["quantity"]
+    destinations = sorted({(line["destination_type"], line["destination_id"]) for line in lines})
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        raw_material_ids = sorted(requested)
+        cursor.execute(f"""
+            SELECT rm.id, rm.name, COALESCE(s.currently_available, 0)
+            FROM raw_materials rm
+            LEFT JOIN inventory_stock s
+                ON s.raw_material_id = rm.id AND s.destination_type = 'storageroom' AND s.destination_id = %s
+            WHERE rm.id IN ({",".join(["%s"] * len(raw_material_ids))})
+            FOR UPDATE OF s
+        """, (source_storeroom_id, *raw_material_ids))
+        shortages = [
+            f"{name} (needs {requested[raw_material_id]:.2f}, available {available:.2f})"
+            for raw_material_id, name, available in cursor.fetchall()
+            if requested[raw_material_id] > available
+        ]
+        if shortages:
+            raise ValueError("Not enough stock in the storage room: " + ", ".join(shortages))
+
+        first_transfer_id = allocate_transfer_ids(cursor, source_storeroom_id, transfer_date, len(destinations))
+        transfer_ids = {destination: first_transfer_id + index for index, destination in enumerate(destinations)}
+        save_transfer_headers(cursor, source_storeroom_id, transfer_date, transfer_time, transfer_ids, chunk_size)
+
+        execute_values(cursor, """
+            INSERT INTO raw_material_transfer_details
+                (source_storage_room_id, destination_type, destination_id,
+                 raw_material_id, quantity, metric, transferred_date, transfer_time, transfer_id)
+            VALUES {values}
+        """, [
+            (source_storeroom_id, destination_type, destination_id, raw_material_id, round(credit["quantity"], 5),
+             credit["metric"], transfer_date, transfer_time, transfer_ids[(destination_type, destination_id)])
+            for (destination_type, destination_id, raw_material_id), credit in credits.items()
+        ], chunk_size)
+
+        movements = []
+        for line in lines:
+            transfer_id = transfer_ids[(line["destination_type"], line["destination_id"])]
+            movements.append({"movement_type": "transfer_out", "movement_date": transfer_date, "reference": transfer_id,
+                              "destination_type": "storageroom", "destination_id": source_storeroom_id,
+                              "raw_material_id": line["raw_material_id"], "metric": line["metric"],
+                              "outgoing": line["quantity"]})
+            movements.append({"movement_type": "transfer_in", "movement_date": transfer_date, "reference": transfer_id,
+                              "destination_type": line["destination_type"], "destination_id": line["destination_id"],
+                              "raw_material_id": line["raw_material_id"], "metric": line["metric"],
+                              "incoming": line["quantity"]})
+        apply_stock_movements(cursor, movements, chunk_size)
+
+        conn.commit()
+        return transfer_ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
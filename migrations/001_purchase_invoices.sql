@@ -0,0 +1,30 @@
+-- Adds the purchase_invoices header table to an existing database and backfills it from
+-- purchase_history. Safe to run more than once.
+--   mysql -u root -p dharaniinvmgmt < migrations/001_purchase_invoices.sql
+
+CREATE TABLE IF NOT EXISTS `purchase_invoices` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `vendor_id` int NOT NULL,
+  `invoice_number` varchar(50) NOT NULL,
+  `purchase_date` date NOT NULL,
+  `storageroom_id` int NOT NULL,
+  `total_cost` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `line_count` int NOT NULL DEFAULT '0',
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_purchase_invoice` (`vendor_id`,`invoice_number`,`purchase_date`,`storageroom_id`),
+  KEY `purchase_date` (`purchase_date`),
+  KEY `fk_purchase_invoice_storageroom_id` (`storageroom_id`),
+  CONSTRAINT `fk_purchase_invoice_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT,
+  CONSTRAINT `fk_purchase_invoice_storageroom_id` FOREIGN KEY (`storageroom_id`) REFERENCES `storagerooms` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+);
+
+INSERT INTO purchase_invoices
+    (vendor_id, invoice_number, purchase_date, storageroom_id, total_cost, line_count, created_at)
+SELECT vendor_id, invoice_number, purchase_date, storageroom_id, SUM(total_cost), COUNT(*), MIN(created_at)
+FROM purchase_history
+GROUP BY vendor_id, invoice_number, purchase_date, storageroom_id
+ON DUPLICATE KEY UPDATE
+    total_cost = VALUES(total_cost),
+    line_count = VALUES(line_count);
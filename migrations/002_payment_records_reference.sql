@@ -0,0 +1,6 @@
+-- Bank statement references on payment_records, so an imported statement line is never posted twice.
+--   mysql -u root -p dharaniinvmgmt < migrations/002_payment_records_reference.sql
+
+ALTER TABLE payment_records
+    ADD COLUMN `reference` varchar(100) DEFAULT NULL AFTER `paid_on`,
+    ADD KEY `vendor_reference` (`vendor_id`,`reference`);
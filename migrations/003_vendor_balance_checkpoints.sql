@@ -0,0 +1,16 @@
+-- Vendor ledger: balance checkpoints and the (vendor, date) indexes the ledger queries range over.
+--   mysql -u root -p dharaniinvmgmt < migrations/003_vendor_balance_checkpoints.sql
+-- then build the checkpoints once with `flask refresh-vendor-balances`.
+
+ALTER TABLE payment_records ADD KEY `vendor_paid_on` (`vendor_id`,`paid_on`);
+ALTER TABLE purchase_invoices ADD KEY `vendor_purchase_date` (`vendor_id`,`purchase_date`);
+
+CREATE TABLE IF NOT EXISTS `vendor_balance_checkpoints` (
+  `vendor_id` int NOT NULL,
+  `checkpoint_date` date NOT NULL,
+  `total_credit` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `total_debit` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`vendor_id`,`checkpoint_date`),
+  CONSTRAINT `fk_vendor_balance_checkpoint_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+);
@@ -0,0 +1,16 @@
+-- Per-vendor ageing summary behind /vendor_ageing.
+--   mysql -u root -p dharaniinvmgmt < migrations/004_vendor_ageing_summary.sql
+-- then fill it once with `flask roll-vendor-ageing` (and schedule that nightly).
+
+CREATE TABLE IF NOT EXISTS `vendor_ageing_summary` (
+  `vendor_id` int NOT NULL,
+  `as_of` date NOT NULL,
+  `due_0_30` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `due_31_60` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `due_61_90` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `due_over_90` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `total_due` decimal(35,2) NOT NULL DEFAULT '0.00',
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`vendor_id`),
+  CONSTRAINT `fk_vendor_ageing_vendor_id` FOREIGN KEY (`vendor_id`) REFERENCES `vendor_list` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+);
@@ -0,0 +1,7 @@
+-- Indexed open-invoice flag on vendor_payment_tracker, so pending payment queries skip settled invoices.
+--   mysql -u root -p dharaniinvmgmt < migrations/005_vendor_payment_tracker_is_open.sql
+
+ALTER TABLE vendor_payment_tracker
+    ADD COLUMN `is_open` tinyint(1) GENERATED ALWAYS AS ((`outstanding_cost` <> `total_paid`)) STORED AFTER `total_due`,
+    ADD KEY `vendor_open_purchase_date` (`vendor_id`,`is_open`,`purchase_date`),
+    ADD KEY `open_purchase_date` (`is_open`,`purchase_date`);
@@ -0,0 +1,6 @@
+-- Weighted-average unit cost of storage room stock, maintained by the purchase and reversal paths.
+--   mysql -u root -p dharaniinvmgmt < migrations/006_inventory_stock_average_unit_cost.sql
+-- then fill it from the purchase and transfer history with `flask recompute-stock-cost`.
+
+ALTER TABLE inventory_stock
+    ADD COLUMN `average_unit_cost` decimal(20,5) NOT NULL DEFAULT '0.00000' AFTER `quantity_needed`;
@@ -0,0 +1,36 @@
+-- Transfer id sequences and transfer headers, backfilled from raw_material_transfer_details.
+-- Safe to run more than once.
+--   mysql -u root -p dharaniinvmgmt < migrations/007_raw_material_transfer_headers.sql
+
+CREATE TABLE IF NOT EXISTS `raw_material_transfer_sequences` (
+  `source_storage_room_id` int NOT NULL,
+  `transferred_date` date NOT NULL,
+  `last_transfer_id` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`source_storage_room_id`,`transferred_date`)
+);
+
+CREATE TABLE IF NOT EXISTS `raw_material_transfers` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `source_storage_room_id` int NOT NULL,
+  `transferred_date` date NOT NULL,
+  `transfer_id` int NOT NULL,
+  `destination_type` enum('kitchen','restaurant') NOT NULL,
+  `destination_id` int NOT NULL,
+  `transfer_time` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_transfer` (`source_storage_room_id`,`transferred_date`,`transfer_id`),
+  KEY `source_destination_date` (`source_storage_room_id`,`destination_type`,`destination_id`,`transferred_date`)
+);
+
+INSERT INTO raw_material_transfers
+    (source_storage_room_id, transferred_date, transfer_id, destination_type, destination_id, transfer_time)
+SELECT source_storage_room_id, transferred_date, transfer_id, MIN(destination_type), MIN(destination_id), MIN(transfer_time)
+FROM raw_material_transfer_details
+GROUP BY source_storage_room_id, transferred_date, transfer_id
+ON DUPLICATE KEY UPDATE transfer_id = VALUES(transfer_id);
+
+INSERT INTO raw_material_transfer_sequences (source_storage_room_id, transferred_date, last_transfer_id)
+SELECT source_storage_room_id, transferred_date, MAX(transfer_id)
+FROM raw_material_transfer_details
+GROUP BY source_storage_room_id, transferred_date
+ON DUPLICATE KEY UPDATE last_transfer_id = GREATEST(last_transfer_id, VALUES(last_transfer_id));
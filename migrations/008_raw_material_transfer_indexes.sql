@@ -0,0 +1,11 @@
+-- Composite indexes for the transfer report and transfer id lookups, which filter on the storage
+-- room, destination and day (and the transfer id), and for the day-wise transfer history.
+--   mysql -u root -p dharaniinvmgmt < migrations/008_raw_material_transfer_indexes.sql
+
+ALTER TABLE raw_material_transfer_details
+    ADD KEY `source_destination_date_transfer` (`source_storage_room_id`,`destination_type`,`destination_id`,`transferred_date`,`transfer_id`),
+    ADD KEY `transferred_date` (`transferred_date`);
+
+ALTER TABLE raw_material_transfers
+    DROP KEY `source_destination_date`,
+    ADD KEY `source_destination_date` (`source_storage_room_id`,`destination_type`,`destination_id`,`transferred_date`,`transfer_id`);
@@ -0,0 +1,4 @@
+-- Day index for the paged prepared dish transfer history, which ranges over (transferred_date, id).
+--   mysql -u root -p dharaniinvmgmt < migrations/009_prepared_dish_transfer_date.sql
+
+ALTER TABLE prepared_dish_transfer ADD KEY `transferred_date` (`transferred_date`);
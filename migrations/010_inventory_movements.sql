@@ -0,0 +1,49 @@
+-- Inventory movement ledger and month-end snapshots. The ledger starts from an 'opening' movement
+-- holding each location's current balance, dated the day this migration runs. Stock as of earlier
+-- dates is not known: movements back-dated before the opening (e.g. a late purchase entry) are in
+-- the ledger but the balance that preceded them is not, so /stock_as_of refuses those dates.
+-- Negative balances are not carried over as openings (a location cannot open with less than
+-- nothing); `flask check-inventory-ledger` lists them as drift until the stock is corrected.
+-- Safe to run more than once.
+--   mysql -u root -p dharaniinvmgmt < migrations/010_inventory_movements.sql
+-- then schedule `flask refresh-inventory-snapshots` monthly and `flask check-inventory-ledger` as an audit.
+
+-- Append-only ledger of every stock change; inventory_stock is its running balance per location and material
+CREATE TABLE IF NOT EXISTS `inventory_movements` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `movement_type` enum('opening','purchase','purchase_reversal','transfer_in','transfer_out','consumption') NOT NULL,
+  `movement_date` date NOT NULL,
+  `destination_type` enum('storageroom','kitchen','restaurant') NOT NULL,
+  `destination_id` int NOT NULL,
+  `raw_material_id` int NOT NULL,
+  `metric` enum('kg','liter','unit') NOT NULL,
+  `incoming` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `outgoing` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `total_cost` decimal(35,2) DEFAULT NULL,
+  `reference` varchar(100) DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `location_material_date` (`destination_type`,`destination_id`,`raw_material_id`,`movement_date`),
+  KEY `movement_date` (`movement_date`)
+);
+
+-- Month-end stock per location and material, rebuilt by `flask refresh-inventory-snapshots` and kept
+-- current by record_inventory_movements; point-in-time stock replays the ledger from the latest one
+CREATE TABLE IF NOT EXISTS `inventory_snapshots` (
+  `snapshot_date` date NOT NULL,
+  `destination_type` enum('storageroom','kitchen','restaurant') NOT NULL,
+  `destination_id` int NOT NULL,
+  `raw_material_id` int NOT NULL,
+  `metric` enum('kg','liter','unit') NOT NULL,
+  `incoming_stock` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `outgoing_stock` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  `currently_available` decimal(25,5) NOT NULL DEFAULT '0.00000',
+  PRIMARY KEY (`destination_type`,`destination_id`,`raw_material_id`,`snapshot_date`)
+);
+
+INSERT INTO inventory_movements
+    (movement_type, movement_date, destination_type, destination_id, raw_material_id, metric, incoming, outgoing)
+SELECT 'opening', CURDATE(), destination_type, destination_id, raw_material_id, metric, currently_available, 0
+FROM inventory_stock
+WHERE currently_available > 0
+  AND NOT EXISTS (SELECT 1 FROM (SELECT id FROM inventory_movements WHERE movement_type = 'opening' LIMIT 1) opened);
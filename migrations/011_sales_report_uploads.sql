@@ -0,0 +1,32 @@
+-- Chunked sales report uploads, kept in the database so an upload can be resumed from any app worker.
+-- Creates the tables as the chunked upload first shipped them; 012 and 013 add the lease and error
+-- detail columns. Safe to run more than once.
+--   mysql -u root -p dharaniinvmgmt < migrations/011_sales_report_uploads.sql
+
+CREATE TABLE IF NOT EXISTS `sales_report_uploads` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `upload_key` char(32) NOT NULL,
+  `restaurant_id` int NOT NULL,
+  `filename` varchar(255) NOT NULL,
+  `default_sales_date` date NOT NULL,
+  `total_size` bigint NOT NULL,
+  `chunk_size` int NOT NULL,
+  `total_chunks` int NOT NULL,
+  `status` enum('uploading','processing','completed','failed') NOT NULL DEFAULT 'uploading',
+  `last_committed_date` date DEFAULT NULL,
+  `error` text,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_upload_key` (`upload_key`),
+  KEY `status_updated_at` (`status`,`updated_at`)
+);
+
+CREATE TABLE IF NOT EXISTS `sales_report_upload_chunks` (
+  `upload_id` int NOT NULL,
+  `chunk_index` int NOT NULL,
+  `size` int NOT NULL,
+  `data` mediumblob NOT NULL,
+  PRIMARY KEY (`upload_id`,`chunk_index`),
+  CONSTRAINT `fk_sales_report_upload_id` FOREIGN KEY (`upload_id`) REFERENCES `sales_report_uploads` (`id`) ON DELETE CASCADE
+);
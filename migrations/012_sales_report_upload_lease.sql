@@ -0,0 +1,16 @@
+-- Lease held by the run committing a chunked sales report upload. Each day's transaction checks
+-- and renews it under a row lock, so a second finalize can only take over a run that has stopped.
+-- Runs after 011. Safe to run more than once, including on a database created from db_setup.sql
+-- that already has the columns.
+--   mysql -u root -p dharaniinvmgmt < migrations/012_sales_report_upload_lease.sql
+
+SET @has_lease = (SELECT COUNT(*) FROM information_schema.COLUMNS
+                  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'sales_report_uploads' AND COLUMN_NAME = 'lease_token');
+SET @ddl = IF(@has_lease = 0,
+              'ALTER TABLE sales_report_uploads
+                 ADD COLUMN `lease_token` char(32) DEFAULT NULL AFTER `last_committed_date`,
+                 ADD COLUMN `lease_expires_at` timestamp NULL DEFAULT NULL AFTER `lease_token`',
+              'DO 0');
+PREPARE migration FROM @ddl;
+EXECUTE migration;
+DEALLOCATE PREPARE migration;
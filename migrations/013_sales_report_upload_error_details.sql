@@ -0,0 +1,13 @@
+-- Problems found by the background run of a chunked sales report upload (report errors or missing
+-- recipes), returned by the upload status endpoint. Runs after 011. Safe to run more than once,
+-- including on a database created from db_setup.sql that already has the column.
+--   mysql -u root -p dharaniinvmgmt < migrations/013_sales_report_upload_error_details.sql
+
+SET @has_error_details = (SELECT COUNT(*) FROM information_schema.COLUMNS
+                          WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'sales_report_uploads' AND COLUMN_NAME = 'error_details');
+SET @ddl = IF(@has_error_details = 0,
+              'ALTER TABLE sales_report_uploads ADD COLUMN `error_details` json DEFAULT NULL AFTER `error`',
+              'DO 0');
+PREPARE migration FROM @ddl;
+EXECUTE migration;
+DEALLOCATE PREPARE migration;
@@ -0,0 +1,12 @@
+-- Bank statements between the import preview and posting their matched payments. Kept in the
+-- database so any web worker can post them; posted or expired ones are deleted by the import page.
+--   mysql -u root -p dharaniinvmgmt < migrations/014_pending_bank_statements.sql
+
+CREATE TABLE IF NOT EXISTS `pending_bank_statements` (
+  `token` char(32) NOT NULL,
+  `filename` varchar(255) NOT NULL,
+  `content` mediumblob NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`token`),
+  KEY `created_at` (`created_at`)
+);
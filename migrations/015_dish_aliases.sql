@@ -0,0 +1,16 @@
+-- POS item names mapped to the dish they should be matched to during sales uploads, used by the
+-- dish match index and the /dish_aliases page. Safe to run more than once.
+--   mysql -u root -p dharaniinvmgmt < migrations/015_dish_aliases.sql
+
+CREATE TABLE IF NOT EXISTS `dish_aliases` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `pos_category` varchar(255) NOT NULL,
+  `pos_item_name` varchar(255) NOT NULL,
+  `alias_key` varchar(512) NOT NULL,
+  `dish_id` int NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_alias_key` (`alias_key`),
+  KEY `dish_id` (`dish_id`)
+);
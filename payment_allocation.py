@@ -0,0 +1,44 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Order in which a lump-sum payment settles a vendor's open invoices
+ALLOCATION_STRATEGIES = {
+    "fifo": lambda item: (item["purchase_date"], item["id"]),
+    "lifo": lambda item: (-item["purchase_date"].toordinal(), -item["id"]),
+    "smallest_first": lambda item: (item["total_due"], item["purchase_date"], item["id"]),
+    "largest_first": lambda item: (-item["total_due"], item["purchase_date"], item["id"]),
+}
+
+
+def to_money(value):
+    return Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def allocate_payment(open_items, amount, strategy="fifo"):
+    """
+    Split `amount` across open vendor_payment_tracker rows (id, invoice_number, purchase_date,
+    total_due) in the order of `strategy`, paying each invoice in full before moving on.
+    Returns (allocations, unallocated) where allocations are {id, invoice_number, purchase_date,
+    total_due, amount, remaining_due} dicts.
+    """
+    if strategy not in ALLOCATION_STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy '{strategy}'")
+
+    remaining = to_money(amount)
+    allocations = []
+    for item in sorted(open_items, key=ALLOCATION_STRATEGIES[strategy]):
+        if remaining <= 0:
+            break
+        due = to_money(item["total_due"])
+        if due <= 0:
+            continue
+        paid = min(due, remaining)
+        remaining -= paid
+        allocations.append({
+            "id": item["id"],
+            "invoice_number": item["invoice_number"],
+            "purchase_date": item["purchase_date"],
+            "total_due": due,
+            "amount": paid,
+            "remaining_due": due - paid
+        })
+    return allocations, remaining
@@ -0,0 +1,137 @@
+import io
+import pandas as pd
+from sales_import import detect_sales_report_format
+
+# File types accepted for bulk purchase sheets. The format itself is detected from the content.
+PURCHASE_SHEET_EXTENSIONS = ('.xlsx', '.csv', '.tsv', '.txt', '.parquet')
+
+# One row per invoice line; lines sharing vendor, invoice number and date form one invoice
+PURCHASE_SHEET_COLUMNS = ['Vendor', 'Invoice Number', 'Purchase Date', 'Storage Room',
+                          'Raw Material', 'Quantity', 'Metric', 'Total Cost']
+
+PURCHASE_METRICS = ('kg', 'liter', 'ml', 'grams', 'unit')
+
+# grams / ml are stored as kg / liter, the same way convert_metric does for add_purchase
+BASE_METRICS = {'grams': ('kg', 1000), 'ml': ('liter', 1000)}
+
+
+def read_purchase_sheet(content):
+    """Read a purchase sheet in any supported format into a DataFrame. Invoice numbers are kept as text."""
+    sheet_format = detect_sales_report_format(content)
+    buffer = io.BytesIO(content)
+    if sheet_format == "xlsx":
+        df = pd.read_excel(buffer, dtype={'Invoice Number': str})
+    elif sheet_format == "parquet":
+        df = pd.read_parquet(buffer)
+    else:
+        df = pd.read_csv(buffer, sep="\t" if sheet_format == "tsv" else ",", engine="c",
+                         encoding="utf-8-sig", dtype={'Invoice Number': str})
+    return df.reset_index(drop=True)
+
+
+def name_key(series):
+    # MySQL compares these names case-insensitively, so the lookups do too
+    return series.fillna("").astype(str).str.strip().str.lower()
+
+
+def validate_purchase_sheet(df, vendors, storagerooms, raw_materials):
+    """
+    Check a whole purchase sheet in one pass and resolve vendor, storage room and raw material
+    names to ids through dicts. Returns (errors, lines): errors are {row, column, value, message}
+    dicts as in sales_import.validate_sales_report, lines are only built when there are no errors.
+    Each line has row, vendor_id, invoice_number, purchase_date, storageroom_id, raw_material_id,
+    raw_material_name, quantity, metric (kg / liter / unit) and total_cost.
+    """
+    missing_columns = [column for column in PURCHASE_SHEET_COLUMNS if column not in df.columns]
+    if missing_columns:
+        return [{"row": None, "column": column, "value": None, "message": "Required column is missing"}
+                for column in missing_columns], []
+
+    errors = []
+
+    def report(mask, column, message):
+        for index in df.index[mask]:
+            value = df.at[index, column]
+            errors.append({
+                "row": int(index) + 2,
+                "column": column,
+                "value": None if pd.isna(value) else str(value),
+                "message": message
+            })
+
+    blank = {column: name_key(df[column]) == "" for column in PURCHASE_SHEET_COLUMNS}
+    for column in PURCHASE_SHEET_COLUMNS:
+        report(blank[column], column, f"{column} is blank")
+
+    vendor_ids = name_key(df['Vendor']).map({str(v['vendor_name']).strip().lower(): v['id'] for v in vendors})
+    storageroom_ids = name_key(df['Storage Room']).map(
+        {str(s['storageroomname']).strip().lower(): s['id'] for s in storagerooms})
+    materials_by_name = {str(rm['name']).strip().lower(): rm for rm in raw_materials}
+    material_keys = name_key(df['Raw Material'])
+    report(~blank['Vendor'] & vendor_ids.isna(), 'Vendor', "Unknown vendor. Please add the vendor first")
+    report(~blank['Storage Room'] & storageroom_ids.isna(), 'Storage Room', "Unknown storage room")
+    report(~blank['Raw Material'] & ~material_keys.isin(materials_by_name.keys()), 'Raw Material',
+           "Unknown raw material. Please add the raw material first")
+
+    invoice_numbers = df['Invoice Number'].fillna("").astype(str).str.strip()
+    report(invoice_numbers.str.len() > 50, 'Invoice Number', "Invoice number is longer than 50 characters")
+
+    purchase_dates = pd.to_datetime(df['Purchase Date'], dayfirst=True, errors="coerce")
+    report(~blank['Purchase Date'] & purchase_dates.isna(), 'Purchase Date', "Date is not readable")
+
+    quantities = pd.to_numeric(df['Quantity'], errors="coerce")
+    report(~blank['Quantity'] & (quantities.isna() | (quantities.abs() == float("inf"))), 'Quantity', "Quantity is not a number")
+    report(quantities <= 0, 'Quantity', "Quantity must be greater than 0")
+
+    costs = pd.to_numeric(df['Total Cost'], errors="coerce")
+    report(~blank['Total Cost'] & (costs.isna() | (costs.abs() == float("inf"))), 'Total Cost', "Total cost is not a number")
+    report(costs < 0, 'Total Cost', "Total cost is negative")
+
+    metrics = name_key(df['Metric'])
+    report(~blank['Metric'] & ~metrics.isin(PURCHASE_METRICS), 'Metric', f"Metric must be one of {', '.join(PURCHASE_METRICS)}")
+
+    if errors:
+        errors.sort(key=lambda error: (error["row"] or 0, error["column"]))
+        return errors, []
+
+    # Store grams / ml as kg / liter
+    base_quantities = quantities / metrics.map({metric: divisor for metric, (_, divisor) in BASE_METRICS.items()}).fillna(1)
+    base_metrics = metrics.replace({metric: base for metric, (base, _) in BASE_METRICS.items()})
+
+    lines = []
+    for index, vendor_id, invoice_number, purchase_date, storageroom_id, material_key, quantity, metric, cost in zip(
+            df.index.tolist(), vendor_ids.tolist(), invoice_numbers.tolist(),
+            purchase_dates.dt.strftime('%Y-%m-%d').tolist(), storageroom_ids.tolist(), material_keys.tolist(),
+            base_quantities.tolist(), base_metrics.tolist(), costs.tolist()):
+        raw_material = materials_by_name[material_key]
+        lines.append({
+            "row": index + 2,
+            "vendor_id": int(vendor_id),
+            "invoice_number": invoice_number,
+            "purchase_date": purchase_date,
+            "storageroom_id": int(storageroom_id),
+            "raw_material_id": raw_material["id"],
+            "raw_material_name": raw_material["name"],
+            "quantity": round(quantity, 5),
+            "metric": metric,
+            "total_cost": round(cost, 2)
+        })
+    return [], lines
+
+
+def invoice_key(vendor_id, invoice_number, purchase_date):
+    return vendor_id, str(invoice_number).strip().lower(), str(purchase_date)
+
+
+def find_recorded_invoices(lines, recorded_invoices):
+    """
+    Errors for lines whose invoice is already in purchase_history. `recorded_invoices` are
+    rows with vendor_id, invoice_number and purchase_date.
+    """
+    recorded = {invoice_key(row["vendor_id"], row["invoice_number"], row["purchase_date"]) for row in recorded_invoices}
+    return [
+        {"row": line["row"], "column": 'Invoice Number', "value": line["invoice_number"],
+         "message": "This invoice number already exists for the same vendor on the same day"}
+        for line in lines
+        if invoice_key(line["vendor_id"], line["invoice_number"], line["purchase_date"]) in recorded
+    ]
@@ -0,0 +1,363 @@
+import io
+import os
+import re
+import zipfile
+import pandas as pd
+import pyarrow.parquet as pq
+
+# File types accepted from the POS exports. The format itself is detected from the content.
+SALES_REPORT_EXTENSIONS = ('.xlsx', '.csv', '.tsv', '.txt', '.parquet')
+
+# Columns every POS export has to provide
+SALES_REPORT_COLUMNS = ['Category', 'Item Name', 'Qty']
+
+# Optional column of multi-day reports, where every row carries its own sales date
+SALES_REPORT_DATE_COLUMN = 'Date'
+
+
+def normalize_name(value):
+    """Lower-case a name and collapse everything that is not a letter or digit into single spaces."""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(value).lower()).split())
+
+
+def trigrams(value):
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def build_dish_match_index(dishes, aliases):
+    """
+    Build the in-memory lookup used to resolve POS item names to dishes.
+    `dishes` rows need id, category, name and recipe_items; `aliases` rows need pos_category,
+    pos_item_name and dish_id.
+    """
+    index = {"dishes": {}, "keys": {}, "aliases": {}, "trigrams": {}, "categories": set()}
+    for dish in dishes:
+        dish_id = dish["id"]
+        name_key = normalize_name(dish["name"])
+        index["dishes"][dish_id] = {
+            "dish_id": dish_id,
+            "category": dish["category"],
+            "name": dish["name"],
+            "has_recipe": dish["recipe_items"] > 0,
+            "name_key": name_key,
+        }
+        index["keys"][(normalize_name(dish["category"]), name_key)] = dish_id
+        index["categories"].add(normalize_name(dish["category"]))
+        for trigram in trigrams(name_key):
+            index["trigrams"].setdefault(trigram, set()).add(dish_id)
+    for alias in aliases:
+        if alias["dish_id"] in index["dishes"]:
+            index["aliases"][(normalize_name(alias["pos_category"]), normalize_name(alias["pos_item_name"]))] = alias["dish_id"]
+            index["categories"].add(normalize_name(alias["pos_category"]))
+    return index
+
+
+def dish_alias_key(category, item_name):
+    """Key under which an alias is stored, so differently spaced or cased POS names share one alias."""
+    return f"{normalize_name(category)}|{normalize_name(item_name)}"
+
+
+def match_dish(index, category, item_name):
+    """Resolve a POS line to a dish: exact normalized name first, then a saved alias. Returns None when neither matches."""
+    key = (normalize_name(category), normalize_name(item_name))
+    dish_id = index["keys"].get(key) or index["aliases"].get(key)
+    return index["dishes"][dish_id] if dish_id else None
+
+
+def suggest_dishes(index, category, item_name, limit=3, min_similarity=0.5):
+    """Closest dishes by name for an unmatched POS line, using the trigram index to shortlist candidates."""
+    name_key = normalize_name(item_name)
+    category_key = normalize_name(category)
+    if not name_key:
+        return []
+
+    # Shortlist the dishes sharing the most trigrams, then rank them by edit distance
+    shared = {}
+    for trigram in trigrams(name_key):
+        for dish_id in index["trigrams"].get(trigram, ()):
+            shared[dish_id] = shared.get(dish_id, 0) + 1
+    shortlist = sorted(shared, key=shared.get, reverse=True)[:20]
+
+    suggestions = []
+    for dish_id in shortlist:
+        dish = index["dishes"][dish_id]
+        similarity = 1 - edit_distance(name_key, dish["name_key"]) / max(len(name_key), len(dish["name_key"]))
+        if normalize_name(dish["category"]) == category_key:
+            similarity += 0.1
+        if similarity >= min_similarity:
+            suggestions.append((similarity, dish))
+    suggestions.sort(key=lambda item: item[0], reverse=True)
+    return [dish for _, dish in suggestions[:limit]]
+
+
+def explode_sales_to_materials(sales_rows, recipes, skip_dish_ids=()):
+    """
+    Total raw material needed for the sold dishes, converted to kg / liter the same way
+    update_restaurant_stock converts it. Returns {raw_material_id: {name, metric, quantity}}.
+    """
+    recipes_by_dish = {}
+    for material in recipes:
+        recipes_by_dish.setdefault(material["dish_id"], []).append(material)
+
+    required = {}
+    for row in sales_rows:
+        if row["dish_id"] in skip_dish_ids:
+            continue
+        for material in recipes_by_dish.get(row["dish_id"], []):
+            quantity = float(material["quantity"]) * float(row["quantity"])
+            metric = material["metric"]
+            if metric == 'grams':
+                quantity, metric = quantity / 1000, 'kg'
+            elif metric == 'ml':
+                quantity, metric = quantity / 1000, 'liter'
+            entry = required.setdefault(material["raw_material_id"], {
+                "raw_material_name": material["raw_material_name"],
+                "metric": metric,
+                "quantity": 0.0
+            })
+            entry["quantity"] += quantity
+    return required
+
+
+def build_stock_impact(required, stock_snapshot):
+    """Compare the required quantities with a {raw_material_id: stock row} snapshot, sorted by material name."""
+    impact = []
+    for raw_material_id, material in required.items():
+        stock = stock_snapshot.get(raw_material_id)
+        available = float(stock["currently_available"]) if stock else 0.0
+        projected = available - material["quantity"]
+        impact.append({
+            "raw_material_id": raw_material_id,
+            "raw_material_name": material["raw_material_name"],
+            "metric": stock["metric"] if stock else material["metric"],
+            "available": round(available, 5),
+            "deduction": round(material["quantity"], 5),
+            "projected": round(projected, 5),
+            "has_stock": stock is not None
+        })
+    impact.sort(key=lambda material: material["raw_material_name"])
+    return impact
+
+
+def is_report_column(column):
+    return column in SALES_REPORT_COLUMNS or column == SALES_REPORT_DATE_COLUMN
+
+
+def read_excel_report(source):
+    return pd.read_excel(source, usecols=is_report_column)
+
+
+def read_csv_report(source):
+    # The C parser is several times faster than openpyxl for the same rows
+    return pd.read_csv(source, engine="c", encoding="utf-8-sig", usecols=is_report_column)
+
+
+def read_tsv_report(source):
+    return pd.read_csv(source, sep="\t", engine="c", encoding="utf-8-sig", usecols=is_report_column)
+
+
+def read_parquet_report(source):
+    parquet_file = pq.ParquetFile(source)
+    columns = [column for column in parquet_file.schema_arrow.names if is_report_column(column)]
+    return parquet_file.read(columns=columns).to_pandas()
+
+
+# Reader for each supported format, given a seekable binary file and all returning a DataFrame with SALES_REPORT_COLUMNS (and the date column if present)
+SALES_REPORT_READERS = {
+    "xlsx": read_excel_report,
+    "csv": read_csv_report,
+    "tsv": read_tsv_report,
+    "parquet": read_parquet_report,
+}
+
+
+def detect_sales_report_format(content):
+    """Detect the format of a POS export from its first bytes rather than trusting the file name."""
+    if content.startswith(b"PK\x03\x04"):
+        return "xlsx"  # xlsx files are zip containers
+    if content.startswith(b"PAR1"):
+        return "parquet"
+    header = content[:4096].split(b"\n", 1)[0]
+    return "tsv" if header.count(b"\t") > header.count(b",") else "csv"
+
+
+class SalesReportError(ValueError):
+    """A report that failed validation. `errors` holds one {row, column, value, message} dict per problem."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} problem(s) found in the sales report")
+        self.errors = errors
+
+
+def normalize_column(series):
+    """normalize_name for a whole column at once."""
+    return (series.fillna("").astype(str).str.lower()
+            .str.replace(r"[^0-9a-z]+", " ", regex=True).str.strip())
+
+
+def parse_report_dates(df):
+    # Dates the POS writes as text are read day first (31-01-2025)
+    return pd.to_datetime(df[SALES_REPORT_DATE_COLUMN], dayfirst=True, errors="coerce")
+
+
+def validate_sales_report(df, known_categories=None):
+    """
+    Check a whole report before anything touches the database. Every check runs over complete
+    columns rather than row by row. `known_categories` is a set of normalized category names;
+    when given, rows in any other category are reported. Returns a list of
+    {row, column, value, message} errors sorted by row, where row is the spreadsheet row number
+    (the header is row 1) and None for problems with the file as a whole.
+    """
+    missing_columns = [column for column in SALES_REPORT_COLUMNS if column not in df.columns]
+    if missing_columns:
+        return [{"row": None, "column": column, "value": None, "message": "Required column is missing"}
+                for column in missing_columns]
+
+    errors = []
+
+    def report(mask, column, message):
+        for index in df.index[mask]:
+            value = df.at[index, column]
+            errors.append({
+                "row": int(index) + 2,
+                "column": column,
+                "value": None if pd.isna(value) else str(value),
+                "message": message(index) if callable(message) else message
+            })
+
+    categories = normalize_column(df['Category'])
+    item_names = normalize_column(df['Item Name'])
+    report(categories == "", 'Category', "Category is blank")
+    report(item_names == "", 'Item Name', "Item name is blank")
+
+    quantities = pd.to_numeric(df['Qty'], errors="coerce")
+    blank_quantity = df['Qty'].isna()
+    report(blank_quantity, 'Qty', "Quantity is blank")
+    report(~blank_quantity & (quantities.isna() | (quantities.abs() == float("inf"))), 'Qty', "Quantity is not a number")
+    report(quantities < 0, 'Qty', "Quantity is negative")
+
+    keys = categories + "|" + item_names
+    if SALES_REPORT_DATE_COLUMN in df.columns:
+        dates = parse_report_dates(df)
+        report(df[SALES_REPORT_DATE_COLUMN].notna() & dates.isna(), SALES_REPORT_DATE_COLUMN, "Date is not readable")
+        keys = keys + "|" + dates.dt.strftime('%Y-%m-%d').fillna("")
+
+    # The same item twice (on the same day) would be counted twice
+    duplicated = keys.duplicated(keep="first") & (item_names != "")
+    if duplicated.any():
+        first_rows = keys.drop_duplicates()
+        first_row_by_key = dict(zip(first_rows.tolist(), (first_rows.index + 2).tolist()))
+        report(duplicated, 'Item Name', lambda index: f"Duplicate of row {first_row_by_key[keys.at[index]]}")
+
+    if known_categories is not None:
+        report((categories != "") & ~categories.isin(known_categories), 'Category', "Unknown category")
+
+    errors.sort(key=lambda error: (error["row"] or 0, error["column"]))
+    return errors
+
+
+def sales_report_rows(df):
+    """Turn a validated report into {category, item_name, quantity, sales_date} rows. sales_date is None unless the report has a Date column."""
+    quantities = pd.to_numeric(df['Qty'], errors="coerce").tolist()
+    sales_dates = [None] * len(df)
+    if SALES_REPORT_DATE_COLUMN in df.columns:
+        sales_dates = [date if isinstance(date, str) else None
+                       for date in parse_report_dates(df).dt.strftime('%Y-%m-%d').tolist()]
+    return [
+        {"category": category, "item_name": item_name, "quantity": quantity, "sales_date": sales_date}
+        for category, item_name, quantity, sales_date in zip(
+            df['Category'].tolist(), df['Item Name'].tolist(), quantities, sales_dates)
+    ]
+
+
+def read_sales_report(content, known_categories=None):
+    """
+    Parse a POS export in any supported format, given as bytes or a seekable binary file, into report
+    rows (see sales_report_rows). Raises SalesReportError listing every problem if the report does not
+    pass validate_sales_report.
+    """
+    source = io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+    head = source.read(4096)
+    source.seek(0)
+    df = SALES_REPORT_READERS[detect_sales_report_format(head)](source).reset_index(drop=True)
+    errors = validate_sales_report(df, known_categories)
+    if errors:
+        raise SalesReportError(errors)
+    return sales_report_rows(df)
+
+
+def partition_sales_by_date(sales_rows, default_sales_date):
+    """
+    Split report rows into per-day batches, oldest first. Rows without their own date
+    belong to `default_sales_date`. Returns [(sales_date, rows), ...].
+    """
+    partitions = {}
+    for row in sales_rows:
+        partitions.setdefault(row["sales_date"] or default_sales_date, []).append(row)
+    return sorted(partitions.items())
+
+
+def parse_sales_report_file(filename, content, known_categories=None):
+    """Process pool worker for bulk imports. Returns (filename, rows, errors) instead of raising."""
+    try:
+        return filename, read_sales_report(content, known_categories), []
+    except SalesReportError as e:
+        return filename, [], e.errors
+    except Exception as e:
+        return filename, [], [{"row": None, "column": None, "value": None, "message": f"Unable to read the file: {e}"}]
+
+
+def expand_sales_archive(files):
+    """
+    Flatten the uploaded files of a bulk import into (filename, content) pairs.
+    Accepts zip archives as well as loose reports (e.g. a folder upload).
+    """
+    reports = []
+    for file in files:
+        name = (file.filename or "").replace("\\", "/")
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(file.stream) as archive:
+                for info in archive.infolist():
+                    base_name = os.path.basename(info.filename)
+                    # Skip folders and the metadata files added by macOS / editors
+                    if info.is_dir() or base_name.startswith(('.', '~$')) or info.filename.startswith('__MACOSX'):
+                        continue
+                    if base_name.lower().endswith(SALES_REPORT_EXTENSIONS):
+                        reports.append((info.filename, archive.read(info)))
+        elif name.lower().endswith(SALES_REPORT_EXTENSIONS):
+            reports.append((name, file.read()))
+    return reports
+
+
+def match_restaurant(filename, restaurants):
+    """
+    Find the restaurant a report belongs to. The restaurant name has to prefix either the
+    folder the report sits in or the report's file name, e.g. "KTC Nagar/report.xlsx" or
+    "KTC_Nagar_item_tax_report_2025_01_01.xlsx". The longest matching name wins.
+    """
+    parts = filename.replace("\\", "/").split("/")
+    candidates = [normalize_name(os.path.splitext(parts[-1])[0])]
+    if len(parts) > 1:
+        candidates.insert(0, normalize_name(parts[-2]))
+
+    names = sorted(((normalize_name(r["restaurantname"]), r) for r in restaurants),
+                   key=lambda item: len(item[0]), reverse=True)
+    for candidate in candidates:
+        for name, restaurant in names:
+            if name and (candidate == name or candidate.startswith(name + " ")):
+                return restaurant
+    return None
@@ -0,0 +1,187 @@
+import os
+import time
+from itertools import groupby
+from openpyxl import Workbook
+
+MANIFEST_FORMATS = ("xlsx", "pdf")
+
+MANIFEST_COLUMNS = ["S.No", "Raw Material", "Category", "Quantity", "Metric"]
+
+# A4 portrait in points, and the rows of the material table that fit below the header
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 40
+PDF_LINE_HEIGHT = 16
+PDF_ROWS_PER_PAGE = 38
+PDF_COLUMN_OFFSETS = [0, 40, 250, 380, 460]
+
+
+def group_manifests(lines):
+    """
+    Split manifest lines (ordered by transfer id) into one manifest per transfer: the header
+    fields of its first line and the material lines.
+    """
+    groups = (list(group) for _, group in groupby(lines, key=lambda line: line["transfer_id"]))
+    return [(group[0], group) for group in groups]
+
+
+def manifest_title_lines(header):
+    return [
+        f"Delivery Manifest - Transfer ID {header['transfer_id']}",
+        f"From: {header['transferred_from']}",
+        f"To: {header['transferred_to']} ({header['destination_type'].title()})",
+        f"Date: {header['transferred_date']}    Time: {header['transfer_time']}",
+    ]
+
+
+def manifest_rows(lines):
+    return [[index, line["raw_material_name"], line["category"], round(float(line["quantity"]), 3), line["metric"]]
+            for index, line in enumerate(lines, start=1)]
+
+
+def write_xlsx_manifests(manifests, path):
+    """One worksheet per transfer, written row by row through openpyxl's write-only workbook."""
+    workbook = Workbook(write_only=True)
+    for header, lines in manifests:
+        sheet = workbook.create_sheet(title=f"{header['transfer_id']} {header['transferred_to']}"[:31]
+                                      .translate(str.maketrans("[]:*?/\\", "       ")))
+        for title_line in manifest_title_lines(header):
+            sheet.append([title_line])
+        sheet.append([])
+        sheet.append(MANIFEST_COLUMNS)
+        for row in manifest_rows(lines):
+            sheet.append(row)
+        sheet.append([])
+        sheet.append(["Dispatched by:", "", "Received by:"])
+    workbook.save(path)
+
+
+def pdf_text(value):
+    text = str(value).encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_page_content(title_lines, rows, continued):
+    """Content stream of one manifest page: the title block, the table header and up to a page of rows."""
+    commands = []
+    y = PDF_PAGE_HEIGHT - PDF_MARGIN
+
+    def text(x, y, value, size=10, font="F1"):
+        commands.append(f"BT /{font} {size} Tf {x} {y} Td ({pdf_text(value)}) Tj ET")
+
+    for index, title_line in enumerate(title_lines):
+        if index == 0 and continued:
+            title_line += " (continued)"
+        text(PDF_MARGIN, y, title_line, 14 if index == 0 else 10, "F2" if index == 0 else "F1")
+        y -= PDF_LINE_HEIGHT + (6 if index == 0 else 0)
+    y -= PDF_LINE_HEIGHT
+    for offset, column in zip(PDF_COLUMN_OFFSETS, MANIFEST_COLUMNS):
+        text(PDF_MARGIN + offset, y, column, font="F2")
+    commands.append(f"{PDF_MARGIN} {y - 4} m {PDF_PAGE_WIDTH - PDF_MARGIN} {y - 4} l S")
+    for row in rows:
+        y -= PDF_LINE_HEIGHT
+        for offset, value in zip(PDF_COLUMN_OFFSETS, row):
+            text(PDF_MARGIN + offset, y, str(value)[:40])
+    return "\n".join(commands), y
+
+
+def write_pdf_manifests(manifests, path):
+    """
+    Every transfer starts on a new page. Pages are written to the file as they are built, so only
+    the object offsets are held in memory; the page tree and cross-reference table come last.
+    """
+    offsets = []
+
+    def write_object(pdf, body):
+        offsets.append(pdf.tell())
+        pdf.write(f"{len(offsets)} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+        return len(offsets)
+
+    with open(path, "wb") as pdf:
+        pdf.write(b"%PDF-1.4\n")
+        # Objects 1-3 are the page tree and the two fonts; the page tree is written last as object 1
+        offsets.append(None)
+        write_object(pdf, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        write_object(pdf, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>")
+
+        page_ids = []
+        for header, lines in manifests:
+            title_lines = manifest_title_lines(header)
+            rows = manifest_rows(lines)
+            for start in range(0, max(len(rows), 1), PDF_ROWS_PER_PAGE):
+                content, y = pdf_page_content(title_lines, rows[start:start + PDF_ROWS_PER_PAGE], start > 0)
+                if start + PDF_ROWS_PER_PAGE >= len(rows):
+                    signature_y = max(y - 3 * PDF_LINE_HEIGHT, PDF_MARGIN)
+                    content += (f"\nBT /F1 10 Tf {PDF_MARGIN} {signature_y} Td (Dispatched by: ____________________) Tj ET"
+                                f"\nBT /F1 10 Tf {PDF_PAGE_WIDTH // 2} {signature_y} Td (Received by: ____________________) Tj ET")
+                stream = content.encode("latin-1")
+                content_id = write_object(pdf, f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1")
+                                          + stream + b"\nendstream")
+                page_ids.append(write_object(pdf, (
+                    f"<< /Type /Page /Parent 1 0 R /MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] "
+                    f"/Resources << /Font << /F1 2 0 R /F2 3 0 R >> >> /Contents {content_id} 0 R >>"
+                ).encode("latin-1")))
+
+        offsets[0] = pdf.tell()
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        pdf.write(f"1 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>\nendobj\n".encode("latin-1"))
+        catalog_id = write_object(pdf, b"<< /Type /Catalog /Pages 1 0 R >>")
+
+        xref_offset = pdf.tell()
+        pdf.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+        for offset in offsets:
+            pdf.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+        pdf.write(f"trailer\n<< /Size {len(offsets) + 1} /Root {catalog_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+                  .encode("latin-1"))
+
+
+def write_manifest_error(path, message):
+    with open(f"{path}.error", "w") as error_file:
+        error_file.write(message)
+
+
+def build_transfer_manifests(lines, manifest_format, path):
+    """
+    Write the manifests of the given lines to `path` in a worker process. The file appears only
+    once complete (written as path.part, then renamed); a failure leaves path.error with the reason.
+    """
+    part_path = f"{path}.part"
+    try:
+        manifests = group_manifests(lines)
+        if manifest_format == "xlsx":
+            write_xlsx_manifests(manifests, part_path)
+        else:
+            write_pdf_manifests(manifests, part_path)
+        os.replace(part_path, path)
+    except Exception as e:
+        write_manifest_error(path, str(e))
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return path
+
+
+def record_manifest_failure(path, future):
+    """
+    Done-callback for a submitted build_transfer_manifests. A worker that died, a broken pool or
+    arguments that could not be pickled never reach the worker's own error handling, so the
+    .error marker is written here instead and the download page stops waiting.
+    """
+    if future.cancelled():
+        write_manifest_error(path, "The manifest job was cancelled")
+    elif future.exception() is not None and not os.path.exists(f"{path}.error"):
+        write_manifest_error(path, str(future.exception()) or type(future.exception()).__name__)
+
+
+def remove_old_manifests(directory, max_age_hours):
+    """Delete manifests, error markers and leftover .part files older than `max_age_hours`."""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age_hours * 3600
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Removed by another web worker in the meantime
+            pass